@@ -0,0 +1,72 @@
+import json
+import os
+import subprocess
+import sys
+
+# how long the hub takes to come up, eager (every module imported before serving, like
+# run_hub.py used to do) against lazy (modules imported on their first request).
+# every scenario runs in a fresh python process so nothing is already imported.
+# usage: python bench_startup.py [runs]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = r'''
+import json, os, resource, sys, time
+t0 = time.perf_counter()
+import run_hub
+from hub.lazy_app import prewarm
+if sys.argv[1] == 'eager':
+    prewarm(list(run_hub.lazy_apps.values()), wait=True)
+ready = time.perf_counter() - t0
+
+from werkzeug.test import Client
+client = Client(run_hub.application)
+first = {}
+for path in sys.argv[2:]:
+    t = time.perf_counter()
+    client.get(path)
+    first[path] = time.perf_counter() - t
+
+# did anything open the webcam just by being imported
+cam = sys.modules.get('module6.app')
+camera_open = bool(cam and cam.cam_context.cap is not None)
+print(json.dumps({'ready': ready, 'first': first, 'camera_open': camera_open,
+                  'loaded': [p for p, a in run_hub.lazy_apps.items() if a.loaded],
+                  'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}), flush=True)
+# module6 may still be warming trackers on daemon threads, don't wait for them to be torn down
+os._exit(0)
+'''
+
+# the first request each scenario makes, in order
+PATHS = ['/', '/module1/', '/module7/']
+
+
+def run_child(mode):
+    env = dict(os.environ, CV_PREWARM='')
+    out = subprocess.run([sys.executable, '-c', CHILD, mode] + PATHS, cwd=HERE, env=env,
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1])
+    # the apps print while loading, the result is the last line
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(runs=3):
+    results = {}
+    for mode in ('eager', 'lazy'):
+        results[mode] = [run_child(mode) for _ in range(runs)]
+
+    print(f"{'mode':<8}{'ready s':>9}" + ''.join(f"{'first ' + p:>16}" for p in PATHS) +
+          f"{'rss MB':>9}  camera opened")
+    for mode, samples in results.items():
+        best = min(samples, key=lambda r: r['ready'])
+        firsts = ''.join(f"{min(r['first'][p] for r in samples):>16.3f}" for p in PATHS)
+        print(f"{mode:<8}{best['ready']:>9.3f}{firsts}{best['max_rss_mb']:>9.0f}  "
+              f"{'yes' if best['camera_open'] else 'no'}")
+
+    speedup = min(r['ready'] for r in results['eager']) / min(r['ready'] for r in results['lazy'])
+    print(f"\nlazy hub is ready {speedup:.1f}x sooner (best of {runs})")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
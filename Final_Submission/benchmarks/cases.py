@@ -0,0 +1,203 @@
+import glob
+import os
+import shutil
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+# every benchmark case: a setup function that loads whatever the hot path needs and returns
+# a Case with the function to time. setup isn't timed, only run() is.
+# the cases call the modules' own functions directly on the bundled datasets (or synthetic
+# frames for the trackers), so the numbers are the same code the web pages run.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in [ROOT] + [os.path.join(ROOT, m) for m in ('module6', 'module7')]:
+    if path not in sys.path:
+        sys.path.append(path)
+
+
+class Case:
+    def __init__(self, run, units, unit, repeat=3, warmup=1, cleanup=None):
+        # run() does one full pass and processes `units` things (images, frames, megapixels...)
+        self.run = run
+        self.units = units
+        self.unit = unit
+        self.repeat = repeat
+        self.warmup = warmup
+        self.cleanup = cleanup
+
+
+def scratch_dir():
+    # outputs go to a temp folder, never into the modules' static folders
+    return tempfile.mkdtemp(prefix='cv_bench_')
+
+
+def synthetic_marker_frames(count=120, width=640, height=480):
+    # an ArUco marker sliding across a noisy background, like module6/stress_switch.py
+    rng = np.random.default_rng(0)
+    dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+    marker = cv2.aruco.generateImageMarker(dictionary, 7, 120)
+    background = rng.integers(90, 160, (height, width, 3), dtype=np.uint8)
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        x = 40 + (i * 4) % (width - 200)
+        y = 150 + int(60 * np.sin(i / 15))
+        frame[y:y + 120, x:x + 120] = marker[..., None]
+        frames.append(frame)
+    return frames
+
+
+# --- module2: template matching, keypoint index and deconvolution ---
+
+def template_matching():
+    from module2 import app as module2
+    out = scratch_dir()
+    module2.UPLOAD_FOLDER = out
+    templates = [p for p in glob.glob(os.path.join(module2.TEMPLATES_DIR, '*'))
+                 if os.path.basename(p) not in module2.IGNORE_FILES]
+    return Case(lambda: module2.process_image_and_blur(module2.SCENE_SOURCE), len(templates), 'templates',
+                repeat=2, cleanup=lambda: shutil.rmtree(out, ignore_errors=True))
+
+
+def feature_index(feature):
+    def setup():
+        from module2 import app as module2
+        from feature_index import get_index
+        scene = cv2.imread(module2.SCENE_SOURCE)
+        # the index is built once and saved, what's timed is the per-request cost
+        get_index(feature, module2.TEMPLATES_DIR, module2.IGNORE_FILES)
+        return Case(lambda: module2.detect_objects(scene, feature), 1, 'scenes', repeat=3)
+    return setup
+
+
+def deconvolution():
+    from module2 import task2
+    img = cv2.imread(task2.IMAGE_PATH)
+    blurred = cv2.GaussianBlur(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), (task2.KERNEL_SIZE, task2.KERNEL_SIZE),
+                               task2.SIGMA)
+    channels = [np.ascontiguousarray(blurred[:, :, i]) for i in range(3)]
+
+    def run():
+        for channel in channels:
+            task2.recover_channel(channel, task2.KERNEL_SIZE, task2.SIGMA)
+    return Case(run, img.shape[0] * img.shape[1] * 3 / 1e6, 'MP', repeat=5)
+
+
+# --- module3: gradients/edges/corners and ArUco segmentation ---
+
+def module3_batch(process, dataset_dir):
+    from module3 import app as module3
+    names = sorted(os.path.basename(p) for p in glob.glob(os.path.join(dataset_dir(module3), '*.[jp][pn]g')))
+    root = scratch_dir()
+
+    def run():
+        # a fresh output folder every pass, otherwise the app's own cache skips the work
+        module3.OUTPUT_DIR = tempfile.mkdtemp(dir=root)
+        for name in names:
+            getattr(module3, process)(name)
+    return Case(run, len(names), 'images', repeat=2, warmup=0,
+                cleanup=lambda: shutil.rmtree(root, ignore_errors=True))
+
+
+def image_features():
+    return module3_batch('process_and_save_image', lambda m: m.DATASET_DIR)
+
+
+def aruco_segmentation():
+    return module3_batch('process_and_save_aruco', lambda m: m.ARUCO_DATASET_DIR)
+
+
+# --- module4: stitching and SIFT ---
+
+def stitching():
+    from module4 import app as module4
+    return Case(module4.process_stitching, 4, 'images', repeat=2)
+
+
+def stitching_full():
+    # same registration, then the warp + blend on the 12MP originals
+    from module4 import app as module4
+    return Case(module4.process_stitching_full_resolution, 4, 'images', repeat=2)
+
+
+def video_mosaic():
+    # the live mosaic on the demo sweep across 1.jpg, every frame registered + previewed
+    from module4 import app as module4
+    image = module4.load_fixed_width('1.jpg', 1600)
+
+    def run():
+        source, mosaic = module4.PanSource(image), module4.VideoMosaic()
+        while True:
+            ok, frame = source.read()
+            if not ok:
+                break
+            mosaic.process(frame)
+            mosaic.render()
+    return Case(run, len(module4.PanSource(image).path), 'frames', repeat=1, warmup=0)
+
+
+def sift():
+    from module4 import app as module4
+    return Case(module4.compute_sift_logic, 1, 'images', repeat=5)
+
+
+# --- module6: every tracking strategy's update on synthetic frames ---
+
+def tracker(strategy_name, frames=120):
+    def setup():
+        import tracking_strategies
+        clip = synthetic_marker_frames(frames)
+        strategy = getattr(tracking_strategies, strategy_name)()
+        strategy.warm_up()
+
+        def run():
+            strategy.reset()
+            for i, frame in enumerate(clip):
+                # update draws on the frame, so give it a copy like a fresh camera frame
+                strategy.update(frame.copy(), i)
+        return Case(run, len(clip), 'frames', repeat=3, cleanup=strategy.release)
+    return setup
+
+
+# --- module7: pose inference and dense stereo ---
+
+def pose_inference():
+    from inference_policy import InferencePolicy, PoseEstimator
+    frame = cv2.resize(cv2.imread(os.path.join(ROOT, 'module7', 'static', 'left_img.jpg')), (640, 480))
+    estimator = PoseEstimator(InferencePolicy(model='holistic', model_complexity=1))
+
+    def run():
+        estimator.reset()
+        for _ in range(20):
+            estimator.process(frame)
+    return Case(run, 20, 'frames', repeat=3, cleanup=estimator.close)
+
+
+def dense_stereo():
+    from dense_stereo import compute_disparity
+    left = cv2.imread(os.path.join(ROOT, 'module7', 'static', 'left_img.jpg'))
+    right = cv2.imread(os.path.join(ROOT, 'module7', 'static', 'right_img.jpg'))
+    run = lambda: compute_disparity(left, right, backend='sgbm', downscale=0.5, num_disparities=128)
+    return Case(run, left.shape[0] * left.shape[1] / 1e6, 'MP', repeat=3)
+
+
+CASES = {
+    'module2.template_matching': template_matching,
+    'module2.orb_index': feature_index('orb'),
+    'module2.sift_index': feature_index('sift'),
+    'module2.deconvolution': deconvolution,
+    'module3.image_features': image_features,
+    'module3.aruco_segmentation': aruco_segmentation,
+    'module4.stitching': stitching,
+    'module4.stitching_full': stitching_full,
+    'module4.video_mosaic': video_mosaic,
+    'module4.sift': sift,
+    'module6.aruco_tracker': tracker('ArucoStrategy'),
+    'module6.csrt_tracker': tracker('CSRTStrategy'),
+    'module6.sam2_replay': tracker('SAM2Strategy'),
+    'module7.pose_inference': pose_inference,
+    'module7.dense_stereo': dense_stereo,
+}
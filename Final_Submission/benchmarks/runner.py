@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# runs the cases in benchmarks/cases.py, each in its own fresh python process so the peak
+# memory of one case doesn't leak into the next. results go to a JSON file and get compared
+# against benchmarks/baseline.json: anything slower or hungrier than the tolerance fails.
+# usage (from Final_Submission):
+#   python -m benchmarks                    run everything and compare to the baseline
+#   python -m benchmarks --only module4     just the cases whose name contains "module4"
+#   python -m benchmarks --save-baseline    store this run as the new baseline
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BASELINE_PATH = os.path.join(HERE, 'baseline.json')
+RESULTS_PATH = os.path.join(HERE, 'results.json')
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError):
+        return max_rss_mb()
+
+
+def max_rss_mb():
+    # high-water mark of this process (kilobytes on linux, bytes on mac)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+def run_case(name):
+    # inside the child process: set up, warm up, then time `repeat` passes
+    from benchmarks.cases import CASES
+    start_rss = current_rss_mb()
+    case = CASES[name]()
+    try:
+        for _ in range(case.warmup):
+            case.run()
+        times = []
+        for _ in range(case.repeat):
+            t0 = time.perf_counter()
+            case.run()
+            times.append(time.perf_counter() - t0)
+    finally:
+        if case.cleanup:
+            case.cleanup()
+
+    wall = float(np.median(times))
+    return {
+        'wall_s': round(wall, 5),
+        'wall_min_s': round(min(times), 5),
+        'runs': len(times),
+        'throughput': round(case.units / wall, 3),
+        'unit': f"{case.unit}/s",
+        # extra memory the case needed at its peak, on top of the bare interpreter + imports
+        'peak_mb': round(max_rss_mb() - start_rss, 1),
+        'peak_rss_mb': round(max_rss_mb(), 1),
+    }
+
+
+def run_child(name, timeout):
+    proc = subprocess.run([sys.executable, '-m', 'benchmarks', '--child', name], cwd=ROOT,
+                          capture_output=True, text=True, timeout=timeout)
+    # the modules print progress, the result is the last line
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        err = (proc.stderr.strip().splitlines() or ['no output'])[-1]
+        return {'error': err}
+    return json.loads(lines[-1])
+
+
+def machine_info():
+    return {'platform': platform.platform(), 'python': platform.python_version(),
+            'cpus': os.cpu_count(), 'opencv': __import__('cv2').__version__}
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    # returns the list of regressions, printing a table as it goes
+    regressions = []
+    print(f"\n{'case':<30}{'wall s':>9}{'base s':>9}{'change':>9}{'throughput':>20}{'peak MB':>9}{'base MB':>9}")
+    for name, res in results.items():
+        base = baseline.get(name)
+        if 'error' in res:
+            print(f"{name:<30}  error: {res['error']}")
+            if base and 'error' not in base:
+                regressions.append(f"{name}: now fails ({res['error']})")
+            continue
+        if not base or 'error' in base:
+            print(f"{name:<30}{res['wall_s']:>9.3f}{'-':>9}{'new':>9}"
+                  f"{res['throughput']:>12.2f} {res['unit']:<7}{res['peak_mb']:>9.1f}{'-':>9}")
+            continue
+
+        change = res['wall_s'] / base['wall_s'] - 1
+        flag = ''
+        if change > time_tolerance:
+            flag = '  SLOWER'
+            regressions.append(f"{name}: {res['wall_s']:.3f}s vs {base['wall_s']:.3f}s (+{change:.0%})")
+        # a few MB of noise is normal for small cases, only count real growth
+        if res['peak_mb'] > base['peak_mb'] * (1 + memory_tolerance) + 10:
+            flag += '  MORE MEMORY'
+            regressions.append(f"{name}: peak {res['peak_mb']:.0f} MB vs {base['peak_mb']:.0f} MB")
+        print(f"{name:<30}{res['wall_s']:>9.3f}{base['wall_s']:>9.3f}{change:>+9.0%}"
+              f"{res['throughput']:>12.2f} {res['unit']:<7}{res['peak_mb']:>9.1f}{base['peak_mb']:>9.1f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Hot path benchmarks.")
+    parser.add_argument('--only', nargs='*', default=[], help="run cases whose name contains any of these")
+    parser.add_argument('--out', default=RESULTS_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown (0.25 = 25%%)")
+    parser.add_argument('--memory-tolerance', type=float, default=0.25)
+    parser.add_argument('--timeout', type=float, default=600, help="seconds per case")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_case(args.child)), flush=True)
+        # some cases leave daemon threads behind, don't wait on interpreter teardown
+        os._exit(0)
+
+    from benchmarks.cases import CASES
+    names = [n for n in CASES if not args.only or any(o in n for o in args.only)]
+    results = {}
+    for name in names:
+        print(f"running {name} ...", flush=True)
+        try:
+            results[name] = run_child(name, args.timeout)
+        except subprocess.TimeoutExpired:
+            results[name] = {'error': f"timed out after {args.timeout:g}s"}
+
+    report = {'machine': machine_info(), 'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'cases': results}
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.save_baseline:
+        # keep the other cases' baselines when only some were run
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                old = json.load(f)
+            report['cases'] = {**old.get('cases', {}), **results}
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        compare(results, {}, args.tolerance, args.memory_tolerance)
+        print("\nNo baseline yet, run with --save-baseline to store one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('machine', {}).get('cpus') != os.cpu_count():
+        print(f"\nWarning: the baseline was recorded on a different machine ({baseline['machine']['platform']}, "
+              f"{baseline['machine']['cpus']} cpus), timings may not be comparable")
+    regressions = compare(results, baseline.get('cases', {}), args.tolerance, args.memory_tolerance)
+    if regressions:
+        print(f"\nFAIL: {len(regressions)} regression(s) against the baseline")
+        for r in regressions:
+            print(f"  {r}")
+        return 1
+    print("\nPASS: no regressions against the baseline")
+    return 0
@@ -1,8 +1,39 @@
-from flask import Flask, render_template
+from flask import Flask, render_template, jsonify, url_for, send_from_directory, request, abort
+
+from hub.image_cache import image_cache
+from hub.scheduler import scheduler
+from hub import profiler
 
 app = Flask(__name__)
 
 @app.route('/')
 def index():
     # This will load hub/templates/landing.html
-    return render_template('landing.html')
\ No newline at end of file
+    return render_template('landing.html')
+
+@app.route('/image_cache')
+def image_cache_stats():
+    # hit/miss counters of the decoded-image cache modules 2-4 share
+    return jsonify(image_cache.stats())
+
+@app.route('/scheduler')
+def scheduler_stats():
+    # running/queued/rejected heavy jobs per endpoint class and the opencv thread budget
+    return jsonify(scheduler.stats())
+
+@app.route('/profiles')
+def profiles():
+    # the newest request profiles (flamegraph svg / pstats), from every worker process.
+    # 404 unless profiling is on and the request has the profile token (if one is set)
+    if not profiler.authorized(request.environ):
+        abort(404)
+    listing = profiler.list_profiles()
+    for p in listing:
+        p['urls'] = [url_for('profile_file', name=name) for name in p.get('files', [])]
+    return jsonify(enabled=profiler.ENABLED, sample_percent=profiler.SAMPLE_PERCENT, profiles=listing)
+
+@app.route('/profiles/<name>')
+def profile_file(name):
+    if not profiler.authorized(request.environ):
+        abort(404)
+    return send_from_directory(profiler.PROFILE_DIR, name)
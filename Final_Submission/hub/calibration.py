@@ -0,0 +1,152 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# one place for the camera calibrations instead of fx/fy/cx/cy copied into every module.
+# profiles live in calibration_profiles.json (or the file in CV_CALIBRATION), each one is the
+# camera matrix + distortion coefficients at the resolution it was calibrated at.
+# everything that depends on the image size (scaled matrix, undistortion maps) is worked out
+# once per (profile, resolution) and cached, so per frame / per click it's just a lookup.
+# the sizes come from requests (json img_w/img_h, uploaded images), so the caches are small
+# LRUs and sizes outside 1..MAX_DIMENSION are rejected with ValueError.
+
+PROFILES_PATH = os.environ.get('CV_CALIBRATION',
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                            'calibration_profiles.json'))
+MAX_DIMENSION = 16384
+# scaled matrices are tiny, a pair of remap tables is ~6 bytes per pixel
+MAX_MATRICES = 32
+MAX_MAPS = 4
+
+
+def image_size(img_w, img_h):
+    # (w, h) as ints, checked before they become a cache key
+    key = (int(img_w), int(img_h))
+    if not (1 <= key[0] <= MAX_DIMENSION and 1 <= key[1] <= MAX_DIMENSION):
+        raise ValueError(f"Image size {key[0]}x{key[1]} out of range (1 to {MAX_DIMENSION})")
+    return key
+
+
+class CalibrationProfile:
+    def __init__(self, name, camera_matrix, dist_coeffs=None, size=(1280, 720)):
+        self.name = name
+        self.camera_matrix = np.array(camera_matrix, np.float64).reshape(3, 3)
+        self.dist_coeffs = np.zeros(5) if dist_coeffs is None else np.array(dist_coeffs, np.float64).ravel()
+        self.size = (int(size[0]), int(size[1]))
+        # with all-zero coefficients undistorting does nothing, so skip it entirely
+        self.has_distortion = bool(np.any(self.dist_coeffs))
+        self._matrices = OrderedDict()
+        self._maps = OrderedDict()
+        # cache_lock guards the two dicts, lock makes one thread build the maps for a size
+        self.cache_lock = threading.Lock()
+        self.lock = threading.Lock()
+
+    def _cached(self, cache, key):
+        with self.cache_lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _store(self, cache, key, value, limit):
+        with self.cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > limit:
+                cache.popitem(last=False)
+
+    def matrix(self, img_w, img_h):
+        # camera matrix rescaled to another image size (fx, cx by width, fy, cy by height)
+        key = image_size(img_w, img_h)
+        K = self._cached(self._matrices, key)
+        if K is None:
+            K = self.camera_matrix.copy()
+            K[0] *= key[0] / self.size[0]
+            K[1] *= key[1] / self.size[1]
+            K[2] = [0, 0, 1]
+            K.setflags(write=False)
+            self._store(self._matrices, key, K, MAX_MATRICES)
+        return K
+
+    def intrinsics(self, img_w, img_h):
+        K = self.matrix(img_w, img_h)
+        return K[0, 0], K[1, 1], K[0, 2], K[1, 2]
+
+    def undistort_maps(self, img_w, img_h):
+        # the remap lookup tables, built once per resolution (this is the slow part)
+        key = image_size(img_w, img_h)
+        maps = self._cached(self._maps, key)
+        if maps is None:
+            with self.lock:
+                maps = self._cached(self._maps, key)
+                if maps is None:
+                    K = self.matrix(*key)
+                    # same K for the output so pixel coordinates keep their meaning
+                    maps = cv2.initUndistortRectifyMap(K, self.dist_coeffs, None, K, key, cv2.CV_16SC2)
+                    self._store(self._maps, key, maps, MAX_MAPS)
+        return maps
+
+    def undistort(self, img, interpolation=cv2.INTER_LINEAR):
+        if not self.has_distortion:
+            return img
+        h, w = img.shape[:2]
+        map1, map2 = self.undistort_maps(w, h)
+        return cv2.remap(img, map1, map2, interpolation)
+
+    def normalize_points(self, pts, img_w, img_h):
+        # pixels (N, 2) -> ideal normalized camera coordinates (x / z, y / z), distortion removed
+        pts = np.asarray(pts, np.float64).reshape(-1, 2)
+        K = self.matrix(img_w, img_h)
+        if not self.has_distortion:
+            return (pts - [K[0, 2], K[1, 2]]) / [K[0, 0], K[1, 1]]
+        return cv2.undistortPoints(pts.reshape(-1, 1, 2), K, self.dist_coeffs).reshape(-1, 2)
+
+    def undistort_points(self, pts, img_w, img_h):
+        # pixels (N, 2) -> where they'd be in the undistorted image
+        K = self.matrix(img_w, img_h)
+        return self.normalize_points(pts, img_w, img_h) * [K[0, 0], K[1, 1]] + [K[0, 2], K[1, 2]]
+
+    def pixels_to_world(self, pts, Z, img_w, img_h):
+        # back-project pixels to (X, Y) at depth Z, Z can be one value or one per point
+        return self.normalize_points(pts, img_w, img_h) * np.reshape(np.asarray(Z, np.float64), (-1, 1))
+
+
+_profiles = None
+_profiles_lock = threading.Lock()
+
+
+def load_profiles(path=PROFILES_PATH):
+    with open(path) as f:
+        data = json.load(f)
+    return {name: CalibrationProfile(name, p['camera_matrix'], p.get('dist_coeffs'), p.get('size', (1280, 720)))
+            for name, p in data.items()}
+
+
+def get_profile(name):
+    # profiles are loaded once per process and shared, so their caches are too
+    global _profiles
+    if _profiles is None:
+        with _profiles_lock:
+            if _profiles is None:
+                _profiles = load_profiles()
+    if name not in _profiles:
+        raise KeyError(f"Unknown calibration profile: {name}")
+    return _profiles[name]
+
+
+def parse_points(points, img_w=None, img_h=None, normalized=False):
+    # (N, 2) float pixel array from [[x, y], ...], [{"x": .., "y": ..}, ...] or {"x": [...], "y": [...]}
+    # normalized=True means 0-1 coordinates (like mediapipe landmarks), scaled to pixels here
+    if isinstance(points, dict):
+        pts = np.column_stack([np.asarray(points['x'], np.float64), np.asarray(points['y'], np.float64)])
+    elif len(points) and isinstance(points[0], dict):
+        pts = np.array([(p['x'], p['y']) for p in points], np.float64)
+    else:
+        pts = np.asarray(points, np.float64).reshape(-1, 2)
+    if normalized:
+        pts = pts * [img_w, img_h]
+    return pts
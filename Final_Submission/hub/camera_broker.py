@@ -0,0 +1,424 @@
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+# one process owns the webcam and everybody else reads it from shared memory, so module6 and
+# module7 (and any number of worker processes) can all stream at once instead of fighting
+# over cv2.VideoCapture(0).
+#   - the broker reads frames and writes them round robin into a ring of slots in a
+#     SharedMemory block, every slot stamped with the frame's sequence number
+#   - each slot is a seqlock: its stamp is odd while the broker is writing into it and even
+#     once the frame is complete, so a reader that sees the same even stamp before and after
+#     looking at the pixels knows it didn't get a torn frame
+#   - readers attach by name and get numpy views straight onto the shared pixels (read_view,
+#     zero copy), or a private copy with the VideoCapture-style read()
+# start it with `python -m hub.camera_broker` (webcam 0) or `--source some_video.mp4`, which
+# loops forever and stands in for the camera in tests, then run the apps with
+# CV_CAMERA_BROKER=1 (or the block name) and open_camera() attaches instead of opening the device.
+# `python -m hub.camera_broker --self-test` runs the broker against a looping video and checks
+# two reader processes see the same, untorn frames.
+
+DEFAULT_NAME = 'cv_camera'
+DEFAULT_SLOTS = 8
+MAGIC = 0x43564342  # "CVCB"
+
+# header fields, int64 each
+H_MAGIC, H_WIDTH, H_HEIGHT, H_CHANNELS, H_SLOTS, H_LATEST, H_PID, H_CLOSED = range(8)
+HEADER_FIELDS = 8
+# per slot: stamp (2 * seq + 1 while writing, 2 * seq + 2 when done), capture time in ns
+SLOT_FIELDS = 2
+
+
+def layout(width, height, channels, slots):
+    # byte offsets of the header, the slot stamps and the frames inside the block
+    header = HEADER_FIELDS * 8
+    stamps = header + slots * SLOT_FIELDS * 8
+    frame_bytes = width * height * channels
+    return header, stamps, stamps + slots * frame_bytes
+
+
+class FrameRing:
+    # numpy views over the shared block, used by both sides
+    def __init__(self, shm, width, height, channels, slots):
+        header, stamps, total = layout(width, height, channels, slots)
+        self.shm = shm
+        self.header = np.ndarray(HEADER_FIELDS, np.int64, shm.buf)
+        self.stamps = np.ndarray((slots, SLOT_FIELDS), np.int64, shm.buf, offset=header)
+        self.frames = np.ndarray((slots, height, width, channels), np.uint8, shm.buf, offset=stamps)
+        self.slots = slots
+        self.shape = (height, width, channels)
+
+    def close(self):
+        # the views have to go before the block can be closed
+        self.header = self.stamps = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # a caller still holds a view from read_view(), the mapping goes when that does
+            pass
+
+
+class CameraBroker:
+    def __init__(self, source=0, name=DEFAULT_NAME, slots=DEFAULT_SLOTS, size=None, fps=None, loop=None):
+        self.source = source
+        self.name = name
+        self.slots = slots
+        self.size = size
+        # a video file loops by default, a camera index obviously doesn't
+        self.loop = not isinstance(source, int) if loop is None else loop
+        self.cap = cv2.VideoCapture(source)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Could not open camera source {source!r}")
+        ok, first = self.cap.read()
+        if not ok:
+            raise RuntimeError(f"Could not read from camera source {source!r}")
+        first = self.fit(first)
+        # files play back at their own rate, cameras already block in read()
+        source_fps = fps or (self.cap.get(cv2.CAP_PROP_FPS) if not isinstance(source, int) else 0)
+        self.interval = 1.0 / source_fps if source_fps and source_fps > 0 else 0.0
+
+        height, width, channels = first.shape
+        total = layout(width, height, channels, slots)[2]
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=total)
+        except FileExistsError:
+            # left over from a broker that crashed, take it over if nobody is publishing into it
+            # (attached without registering, or our resource tracker would unlink a live broker's block)
+            stale = attach(name)
+            pid = int(np.ndarray(HEADER_FIELDS, np.int64, stale.buf)[H_PID]) if stale.size >= HEADER_FIELDS * 8 else 0
+            stale.close()
+            if pid and pid_alive(pid):
+                raise RuntimeError(f"Another broker (pid {pid}) already publishes '{name}'")
+            resource_tracker.register(stale._name, 'shared_memory')
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=total)
+
+        self.ring = FrameRing(self.shm, width, height, channels, slots)
+        self.ring.stamps[:] = 0
+        self.ring.header[:] = [MAGIC, width, height, channels, slots, -1, os.getpid(), 0]
+        self.seq = 0
+        self.pending = first
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def fit(self, frame):
+        if self.size is not None and frame.shape[1::-1] != tuple(self.size):
+            frame = cv2.resize(frame, tuple(self.size), interpolation=cv2.INTER_AREA)
+        return frame
+
+    def next_frame(self):
+        if self.pending is not None:
+            frame, self.pending = self.pending, None
+            return frame
+        ok, frame = self.cap.read()
+        if not ok and self.loop:
+            # end of the file, start it again
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        return self.fit(frame) if ok else None
+
+    def publish(self, frame):
+        ring = self.ring
+        slot = self.seq % ring.slots
+        ring.stamps[slot, 0] = 2 * self.seq + 1     # odd: being written
+        ring.frames[slot] = frame
+        ring.stamps[slot, 1] = time.time_ns()
+        ring.stamps[slot, 0] = 2 * self.seq + 2     # even: complete
+        ring.header[H_LATEST] = self.seq
+        self.seq += 1
+
+    def run(self):
+        next_time = time.monotonic()
+        try:
+            while not self.stop_event.is_set():
+                frame = self.next_frame()
+                if frame is None:
+                    print("Camera source ended, broker stopping")
+                    break
+                self.publish(frame)
+                if self.interval:
+                    next_time += self.interval
+                    delay = next_time - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        # fell behind (slow decode), don't try to catch up with a burst
+                        next_time = time.monotonic()
+        finally:
+            self.close()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def close(self):
+        if self.ring is None:
+            return
+        self.ring.header[H_CLOSED] = 1
+        self.ring.close()
+        self.ring = None
+        self.shm.unlink()
+        self.cap.release()
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+# attach() swaps a process-wide function, streams in different server threads attach at once
+_attach_lock = threading.Lock()
+
+
+def attach(name):
+    # python < 3.13 registers every attach with the resource tracker, which then unlinks the
+    # broker's block as soon as a reader exits, so attach without registering
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    with _attach_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedCamera:
+    # reader side, a drop-in for cv2.VideoCapture in the frame loops: read() -> (ok, frame)
+    def __init__(self, name=DEFAULT_NAME, timeout=5.0):
+        self.name = name
+        self.timeout = timeout
+        shm = attach(name)
+        header = np.ndarray(HEADER_FIELDS, np.int64, shm.buf)
+        if header[H_MAGIC] != MAGIC:
+            shm.close()
+            raise RuntimeError(f"'{name}' is not a camera broker block")
+        width, height, channels, slots = (int(header[i]) for i in (H_WIDTH, H_HEIGHT, H_CHANNELS, H_SLOTS))
+        del header
+        self.ring = FrameRing(shm, width, height, channels, slots)
+        self.broker_pid = int(self.ring.header[H_PID])
+        self.last_seq = -1
+        self.torn = 0
+        self.dropped = 0
+
+    @property
+    def shape(self):
+        return self.ring.shape
+
+    def isOpened(self):
+        return self.ring is not None and not self.ring.header[H_CLOSED]
+
+    def broker_alive(self):
+        return self.isOpened() and pid_alive(self.broker_pid)
+
+    def wait_for_new(self):
+        # latest published seq once it's newer than the last one we returned, None on timeout
+        deadline = time.monotonic() + self.timeout
+        while self.isOpened():
+            latest = int(self.ring.header[H_LATEST])
+            if latest > self.last_seq:
+                return latest
+            if time.monotonic() > deadline or not pid_alive(self.broker_pid):
+                return None
+            time.sleep(0.002)
+        return None
+
+    def read_view(self):
+        # (seq, read-only view of the shared pixels) of the newest frame, zero copy.
+        # the view is only good until the broker comes round to its slot again (slots frames
+        # later): check is_current(seq) after using it, or use read() to get a copy
+        while True:
+            seq = self.wait_for_new()
+            if seq is None:
+                return None, None
+            slot = seq % self.ring.slots
+            if self.ring.stamps[slot, 0] != 2 * seq + 2:
+                # overwritten (or being written) already, go again with whatever is newest
+                self.torn += 1
+                continue
+            if self.last_seq >= 0:
+                self.dropped += seq - self.last_seq - 1
+            self.last_seq = seq
+            view = self.ring.frames[slot]
+            view.flags.writeable = False
+            return seq, view
+
+    def is_current(self, seq):
+        # the slot still holds that frame, so everything read from its view was consistent
+        return self.ring.stamps[seq % self.ring.slots, 0] == 2 * seq + 2
+
+    def read(self, image=None):
+        # VideoCapture style, a private copy the caller can draw on (into `image` if it fits)
+        while True:
+            seq, view = self.read_view()
+            if view is None:
+                return False, None
+            if image is not None and image.shape == view.shape and image.dtype == view.dtype:
+                np.copyto(image, view)
+                frame = image
+            else:
+                frame = view.copy()
+            if self.is_current(seq):
+                return True, frame
+            self.torn += 1
+
+    def capture_time(self, seq):
+        return self.ring.stamps[seq % self.ring.slots, 1] / 1e9
+
+    def release(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+def broker_name():
+    # CV_CAMERA_BROKER=1 means the default block, anything else is the block name
+    value = os.environ.get('CV_CAMERA_BROKER', '')
+    if value in ('', '0'):
+        return None
+    return DEFAULT_NAME if value == '1' else value
+
+
+def open_camera(index=0):
+    # what the apps call instead of cv2.VideoCapture(0)
+    name = broker_name()
+    if name is None:
+        return cv2.VideoCapture(index)
+    try:
+        return SharedCamera(name)
+    except FileNotFoundError:
+        print(f"No camera broker '{name}' running, opening camera {index} directly")
+        return cv2.VideoCapture(index)
+
+
+def self_test_reader(name, frames, results):
+    # runs in its own process: read frames, note a checksum per seq
+    import zlib
+    cam = SharedCamera(name)
+    sums, seqs = {}, []
+    for _ in range(frames):
+        seq, view = cam.read_view()
+        if view is None:
+            break
+        crc = zlib.crc32(view)
+        if cam.is_current(seq):
+            sums[seq] = crc
+        seqs.append(seq)
+    results.put((os.getpid(), sums, seqs, cam.torn, cam.dropped))
+    cam.release()
+
+
+def self_test(source, frames=150, readers=2):
+    import multiprocessing as mp
+    name = f"cv_camera_test_{os.getpid()}"
+    broker = CameraBroker(source, name=name).start()
+    total = int(broker.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    print(f"broker publishing {source} ({broker.ring.shape[1]}x{broker.ring.shape[0]}, "
+          f"{total} frames, looping) as '{name}'")
+    ctx = mp.get_context('spawn')
+    results = ctx.Queue()
+    procs = [ctx.Process(target=self_test_reader, args=(name, frames, results)) for _ in range(readers)]
+    t0 = time.perf_counter()
+    for p in procs:
+        p.start()
+    outcome = [results.get(timeout=120) for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - t0
+    broker.stop()
+
+    failures = []
+    for pid, sums, seqs, torn, dropped in outcome:
+        print(f"  reader {pid}: {len(seqs)} frames (seq {seqs[0] if seqs else '-'}..{seqs[-1] if seqs else '-'}), "
+              f"{torn} torn reads retried, {dropped} frames skipped")
+        if len(seqs) < frames:
+            failures.append(f"reader {pid} stopped after {len(seqs)} frames")
+        if any(b <= a for a, b in zip(seqs, seqs[1:])):
+            failures.append(f"reader {pid} saw sequence numbers go backwards")
+    # the same frame must look the same in every process
+    common = set(outcome[0][1])
+    for _, sums, _, _, _ in outcome[1:]:
+        common &= set(sums)
+    mismatched = [s for s in common if len({o[1][s] for o in outcome}) > 1]
+    if mismatched:
+        failures.append(f"{len(mismatched)} frames differ between readers")
+    last_seq = max(max(o[2]) for o in outcome if o[2]) if any(o[2] for o in outcome) else -1
+    if total and last_seq < total:
+        failures.append(f"only reached frame {last_seq}, the video never looped")
+    print(f"{len(common)} frames checked across {readers} processes in {elapsed:.1f}s, "
+          f"video looped {max(0, last_seq) // total if total else 0} time(s)")
+
+    try:
+        attach(name).close()
+        failures.append("shared memory block was not removed")
+    except FileNotFoundError:
+        pass
+
+    if failures:
+        print("FAIL:\n  " + "\n  ".join(failures))
+        return 1
+    print("PASS")
+    return 0
+
+
+def parse_source(value):
+    return int(value) if value.isdigit() else value
+
+
+def main(argv=None):
+    default_video = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 'module6', 'static', 'sam2_demo_video.mp4')
+    parser = argparse.ArgumentParser(prog='python -m hub.camera_broker',
+                                     description="Share one camera with every process through shared memory.")
+    parser.add_argument('--source', default='0', help="camera index or video file (video files loop)")
+    parser.add_argument('--name', default=broker_name() or DEFAULT_NAME)
+    parser.add_argument('--slots', type=int, default=DEFAULT_SLOTS)
+    parser.add_argument('--size', help="resize frames to WxH, e.g. 640x480")
+    parser.add_argument('--fps', type=float, help="publish rate for video files (default: the file's)")
+    parser.add_argument('--self-test', action='store_true', help="check the ring with a looping video and 2 readers")
+    parser.add_argument('--frames', type=int, default=150, help="frames per reader in the self-test")
+    args = parser.parse_args(argv)
+
+    if args.self_test:
+        source = default_video if args.source == '0' else args.source
+        return self_test(source, args.frames)
+
+    size = tuple(int(v) for v in args.size.lower().split('x')) if args.size else None
+    broker = CameraBroker(parse_source(args.source), name=args.name, slots=args.slots, size=size, fps=args.fps)
+    h, w, _ = broker.ring.shape
+    print(f"Publishing camera {args.source} ({w}x{h}) as '{args.name}', "
+          f"start the apps with CV_CAMERA_BROKER={args.name if args.name != DEFAULT_NAME else 1}", flush=True)
+    # a broker started in the background ignores ctrl-c, stop cleanly on kill too
+    signal.signal(signal.SIGTERM, lambda *args: broker.stop_event.set())
+    try:
+        broker.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
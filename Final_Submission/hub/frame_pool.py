@@ -0,0 +1,55 @@
+import threading
+
+import numpy as np
+
+# recycled buffers for the streaming loops (module6 get_feed, module7 generate_frames).
+# at 30fps a fresh 640x480 frame, its grayscale/rgb copies and the jpeg bytes are a few MB of
+# allocations per second per stream, which keeps the allocator and the gc busy for nothing.
+# a stream takes a buffer from the pool, reads the camera straight into it
+# (cap.read(buf) reuses it when the size matches), and gives it back once the frame has
+# been sent. conversions keep their own dst= buffers next to the code that uses them.
+
+MULTIPART_HEAD = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+
+
+def mjpeg_part(jpeg):
+    # one multipart chunk, copying the encoded bytes once (no tobytes() + two concatenations)
+    return b''.join((MULTIPART_HEAD, jpeg, b'\r\n'))
+
+
+class FramePool:
+    def __init__(self, size=8):
+        # size = most spare buffers kept around, extras are left to the gc
+        self.size = size
+        self.free = []
+        self.lock = threading.Lock()
+        self.reused = 0
+        self.missed = 0
+
+    def acquire(self, shape=None, dtype=np.uint8):
+        # a spare buffer (with that shape, if given). with no spare: a new array when the shape
+        # is known, otherwise None, and cap.read(None) allocates the first one itself
+        with self.lock:
+            for i in range(len(self.free) - 1, -1, -1):
+                buf = self.free[i]
+                if shape is None or (buf.shape == tuple(shape) and buf.dtype == dtype):
+                    self.reused += 1
+                    return self.free.pop(i)
+            self.missed += 1
+        return None if shape is None else np.empty(shape, dtype)
+
+    def release(self, buf):
+        # only plain writable arrays that own their memory, never views or read-only cache entries
+        if buf is None or not buf.flags.writeable or not buf.flags.owndata:
+            return
+        with self.lock:
+            if len(self.free) < self.size and not any(b is buf for b in self.free):
+                self.free.append(buf)
+
+    def stats(self):
+        with self.lock:
+            return {'free': len(self.free), 'reused': self.reused, 'missed': self.missed}
+
+
+# the camera frames of every stream in the process
+frame_pool = FramePool()
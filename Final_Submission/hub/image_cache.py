@@ -0,0 +1,100 @@
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+
+# decoded images shared by every module in the process (2, 3 and 4 keep re-reading the same
+# static files on every request). entries are keyed by (file, mtime, size on disk, how it was
+# decoded, target size), so editing a file on disk just makes the old entry unreachable and
+# it falls out of the LRU. the arrays are read-only: callers that want to draw on one take a
+# .copy() first, and nobody can change it under another thread by accident.
+# CV_IMAGE_CACHE_MB sets the budget (default 256), 0 turns the cache off.
+
+BUDGET_MB = float(os.environ.get('CV_IMAGE_CACHE_MB', '256'))
+
+
+def target_size(img, size=None, width=None, scale=None):
+    # (w, h) the image should end up at, or None to keep it as decoded
+    h, w = img.shape[:2]
+    if size is not None:
+        return int(size[0]), int(size[1])
+    if width is not None:
+        # same rounding as the modules' own "fixed width" helpers
+        return int(width), int(h * (width / w))
+    if scale is not None:
+        return int(w * scale), int(h * scale)
+    return None
+
+
+class ImageCache:
+    def __init__(self, budget_mb=BUDGET_MB):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, path, flags=cv2.IMREAD_COLOR, size=None, width=None, scale=None,
+            interpolation=cv2.INTER_LINEAR):
+        # like cv2.imread (None if the file is missing or broken), optionally resized to an
+        # exact size=(w, h), a width keeping the aspect ratio, or a scale factor
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (path, stat.st_mtime_ns, stat.st_size, flags, size and tuple(size), width, scale, interpolation)
+
+        with self.lock:
+            img = self.entries.get(key)
+            if img is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return img
+            self.misses += 1
+
+        # decode outside the lock, two threads missing the same key just both decode it
+        img = cv2.imread(path, flags)
+        if img is None:
+            return None
+        new_size = target_size(img, size, width, scale)
+        # a size that rounds down to nothing leaves the image as it was
+        if new_size is not None and new_size != img.shape[1::-1] and min(new_size) > 0:
+            img = cv2.resize(img, new_size, interpolation=interpolation)
+        img.setflags(write=False)
+
+        if img.nbytes <= self.budget:
+            with self.lock:
+                if key not in self.entries:
+                    self.entries[key] = img
+                    self.bytes += img.nbytes
+                    while self.bytes > self.budget:
+                        _, old = self.entries.popitem(last=False)
+                        self.bytes -= old.nbytes
+                        self.evictions += 1
+        return img
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'mb': round(self.bytes / 1024 / 1024, 1),
+                'budget_mb': round(self.budget / 1024 / 1024, 1),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+# one per process, so the hub's modules all share it
+image_cache = ImageCache()
@@ -0,0 +1,55 @@
+import importlib
+import threading
+import time
+
+# a stand-in WSGI app for the dispatcher: the real module app is only imported the first
+# time a request reaches its mount. importing module7 pulls in mediapipe and module6 builds
+# its trackers, so the hub starts in a fraction of the time and a worker that only ever
+# serves module1 never pays for them.
+
+
+class LazyApp:
+    def __init__(self, import_name):
+        # 'module7.app:app' -> import module7.app, use its `app`
+        self.import_name = import_name
+        self.app = None
+        self.load_seconds = None
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.app is not None
+
+    def load(self):
+        if self.app is None:
+            # requests that arrive while it's importing wait here instead of importing twice
+            with self.lock:
+                if self.app is None:
+                    module_name, attr = self.import_name.split(':')
+                    t0 = time.perf_counter()
+                    app = getattr(importlib.import_module(module_name), attr)
+                    self.load_seconds = time.perf_counter() - t0
+                    print(f"Loaded {self.import_name} in {self.load_seconds:.2f}s", flush=True)
+                    self.app = app
+        return self.app
+
+    def __call__(self, environ, start_response):
+        return self.load()(environ, start_response)
+
+
+def prewarm(apps, wait=False):
+    # load some apps ahead of their first request, on a background thread unless wait=True
+    def run():
+        for lazy in apps:
+            try:
+                lazy.load()
+            except Exception as e:
+                # it will be retried (and the error shown) on the first real request
+                print(f"Prewarm of {lazy.import_name} failed: {e}", flush=True)
+
+    if wait:
+        run()
+        return None
+    thread = threading.Thread(target=run, name='hub-prewarm', daemon=True)
+    thread.start()
+    return thread
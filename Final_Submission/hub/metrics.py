@@ -0,0 +1,153 @@
+import os
+import time
+import threading
+import itertools
+from bisect import bisect_left
+from collections import deque
+
+import cv2
+
+# tiny per-frame instrumentation for the streaming modules (6 and 7).
+# each stage of the frame loop (capture, strategy, encode, ...) gets a histogram,
+# and /metrics prints everything in the Prometheus text format.
+# set CV_METRICS=0 to turn it off, then the loops skip all the timing calls.
+
+ENABLED = os.environ.get('CV_METRICS', '1') != '0'
+
+# bucket edges in seconds, frame stages live between ~1ms and ~1s
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.035, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class RollingHistogram:
+    def __init__(self, window=512, buckets=BUCKETS):
+        self.buckets = buckets
+        # all-time bucket counts for Prometheus (must only ever go up)
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        # the last `window` values, for quantiles and the live overlay
+        self.recent = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.bucket_counts[bisect_left(self.buckets, value)] += 1
+            self.total += value
+            self.count += 1
+            self.recent.append(value)
+
+    def quantile(self, q):
+        with self.lock:
+            values = sorted(self.recent)
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def mean(self):
+        with self.lock:
+            return sum(self.recent) / len(self.recent) if self.recent else 0.0
+
+
+class StreamMetrics:
+    def __init__(self, namespace, enabled=ENABLED):
+        self.namespace = namespace
+        self.enabled = enabled
+        self.stages = {}
+        self.counters = {}
+        # when every frame went out, for the fps gauge
+        self.frame_times = deque(maxlen=120)
+        # client id -> time their last frame was sent
+        self.clients = {}
+        self.client_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        hist = self.stages.get(stage)
+        if hist is None:
+            with self.lock:
+                hist = self.stages.setdefault(stage, RollingHistogram())
+        hist.observe(seconds)
+
+    def inc(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    # --- per client bookkeeping ---
+
+    def client_connected(self):
+        client_id = next(self.client_ids)
+        with self.lock:
+            self.clients[client_id] = time.monotonic()
+        return client_id
+
+    def client_frame(self, client_id):
+        now = time.monotonic()
+        self.frame_times.append(now)
+        self.clients[client_id] = now
+        self.inc('frames_total')
+
+    def client_disconnected(self, client_id):
+        with self.lock:
+            self.clients.pop(client_id, None)
+
+    def fps(self):
+        times = list(self.frame_times)
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def draw_overlay(self, frame, stage):
+        # live fps + average latency of one stage, drawn straight onto the frame
+        text = f"{self.fps():.1f} fps | {stage} {self.stages[stage].mean() * 1000:.1f} ms" \
+            if stage in self.stages else f"{self.fps():.1f} fps"
+        cv2.putText(frame, text, (10, frame.shape[0] - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 4)
+        cv2.putText(frame, text, (10, frame.shape[0] - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+
+    # --- text exposition ---
+
+    def render(self):
+        ns = self.namespace
+        lines = []
+
+        name = f"{ns}_stage_seconds"
+        lines.append(f"# HELP {name} Time spent in each stage of the frame loop.")
+        lines.append(f"# TYPE {name} histogram")
+        for stage, hist in sorted(self.stages.items()):
+            with hist.lock:
+                counts = list(hist.bucket_counts)
+                total, count = hist.total, hist.count
+            running = 0
+            for edge, n in zip(hist.buckets, counts):
+                running += n
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{edge}"}} {running}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+        name = f"{ns}_stage_recent_seconds"
+        lines.append(f"# HELP {name} Stage latency quantiles over the last few hundred frames.")
+        lines.append(f"# TYPE {name} gauge")
+        for stage, hist in sorted(self.stages.items()):
+            for q in (0.5, 0.9, 0.99):
+                lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {hist.quantile(q):.6f}')
+
+        with self.lock:
+            counters = dict(self.counters)
+            clients = dict(self.clients)
+        for key, value in sorted(counters.items()):
+            lines.append(f"# TYPE {ns}_{key} counter")
+            lines.append(f"{ns}_{key} {value}")
+
+        lines.append(f"# TYPE {ns}_fps gauge")
+        lines.append(f"{ns}_fps {self.fps():.2f}")
+        lines.append(f"# TYPE {ns}_clients gauge")
+        lines.append(f"{ns}_clients {len(clients)}")
+
+        # how long ago each connected client got its last frame
+        now = time.monotonic()
+        lines.append(f"# HELP {ns}_client_lag_seconds Seconds since each client's last frame.")
+        lines.append(f"# TYPE {ns}_client_lag_seconds gauge")
+        for client_id, last in sorted(clients.items()):
+            lines.append(f'{ns}_client_lag_seconds{{client="{client_id}"}} {now - last:.4f}')
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,393 @@
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import random
+import pstats
+import cProfile
+import itertools
+import threading
+import zlib
+from collections import Counter
+from urllib.parse import parse_qs
+from xml.sax.saxutils import escape
+
+# on-demand request profiling for the whole hub. wraps the DispatcherMiddleware stack, so every
+# module's requests can be profiled without touching its code:
+#   - off unless CV_PROFILING=1, a profile costs the server real cpu and shows its code
+#   - opt in per request with `?_profile=1` or an `X-Profile: 1` header
+#     (`sample` = sampling profiler -> flamegraph, `cprofile` = deterministic -> pstats)
+#   - with CV_PROFILE_TOKEN set (do that anywhere but your own machine) only a header carrying
+#     it counts: `X-Profile: <token>` or `X-Profile: <token>/cprofile`. the query string is
+#     ignored then, and /profiles needs the same header
+#   - CV_PROFILE_SAMPLE=0.5 also profiles 0.5% of all requests with the sampling profiler
+# a profiled response gets an `X-Profile-Id` header, the artifacts land in CV_PROFILE_DIR
+# (profiles/ by default, shared by all worker processes) and /profiles lists them.
+# a request that doesn't ask to be profiled costs one header lookup and a substring check.
+# streaming responses are profiled while their body is produced, for at most
+# CV_PROFILE_MAX_SECONDS, then the artifact is written and the stream carries on.
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENABLED = os.environ.get('CV_PROFILING', '0') == '1'
+TOKEN = os.environ.get('CV_PROFILE_TOKEN', '')
+PROFILE_DIR = os.environ.get('CV_PROFILE_DIR') or os.path.join(HERE, 'profiles')
+SAMPLE_PERCENT = float(os.environ.get('CV_PROFILE_SAMPLE', '0'))
+MAX_SECONDS = float(os.environ.get('CV_PROFILE_MAX_SECONDS', '30'))
+# the sampling profiler looks at the request's stack this often (seconds)
+INTERVAL = float(os.environ.get('CV_PROFILE_INTERVAL_MS', '5')) / 1000
+# oldest profiles are deleted past this many
+KEEP = int(os.environ.get('CV_PROFILE_KEEP', '200'))
+
+MODES = ('sample', 'cprofile')
+DEFAULT_MODE = 'sample'
+
+counter = itertools.count(1)
+
+
+def check_token(value):
+    # 'token' or 'token/mode' -> the part after the token ('' for none), None if it's wrong
+    token, _, rest = value.strip().partition('/')
+    return rest if hmac.compare_digest(token.encode(), TOKEN.encode()) else None
+
+
+def authorized(environ):
+    # may this request read the profiles?
+    if not ENABLED:
+        return False
+    return not TOKEN or check_token(environ.get('HTTP_X_PROFILE', '')) is not None
+
+
+def requested_mode(environ):
+    # the mode a request asks for, or None (the hot path, keep it cheap)
+    value = environ.get('HTTP_X_PROFILE')
+    if TOKEN:
+        # a query string would put the token in access logs and browser history
+        if value is None:
+            return None
+        value = check_token(value)
+        if value is None:
+            return None
+        value = value or DEFAULT_MODE
+    elif value is None:
+        query = environ.get('QUERY_STRING', '')
+        if '_profile' not in query:
+            return None
+        value = parse_qs(query).get('_profile', [''])[0]
+    value = value.strip().lower()
+    if value in ('', '0', 'false', 'no', 'off'):
+        return None
+    return value if value in MODES else DEFAULT_MODE
+
+
+labels = {}
+
+
+def frame_label(code):
+    # 'function (file:line)', cached per code object since the same frames come up every sample
+    label = labels.get(code)
+    if label is not None:
+        return label
+    filename = code.co_filename
+    if filename.startswith(HERE):
+        filename = os.path.relpath(filename, HERE)
+    else:
+        filename = '/'.join(filename.replace('\\', '/').split('/')[-2:])
+    name = getattr(code, 'co_qualname', code.co_name)
+    # ';' separates frames in the folded stack format
+    label = labels[code] = f"{name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+    return label
+
+
+class SamplingProfiler:
+    # samples the stack of whichever thread is working on the request. the request can hop
+    # between threads (the async stream server runs every body chunk in its executor), so the
+    # target thread is set around each piece of work instead of once
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.target = None
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='request-profiler', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            target = self.target
+            if target is None:
+                continue
+            frame = sys._current_frames().get(target)
+            stack = []
+            # walk up to the middleware, the server frames above it are the same every time
+            while frame is not None and frame.f_code not in BOUNDARY:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def enable(self):
+        self.target = threading.get_ident()
+
+    def disable(self):
+        self.target = None
+
+    def save(self, base):
+        self.done.set()
+        self.thread.join()
+        with open(base + '.folded', 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(base + '.svg', 'w') as f:
+            f.write(flamegraph(self.stacks, os.path.basename(base)))
+        return ['.svg', '.folded']
+
+
+class DeterministicProfiler:
+    # cProfile, enabled only while the request's code runs
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.samples = 0
+
+    def enable(self):
+        self.profile.enable()
+
+    def disable(self):
+        self.profile.disable()
+
+    def save(self, base):
+        self.profile.dump_stats(base + '.pstats')
+        with open(base + '.txt', 'w') as f:
+            stats = pstats.Stats(self.profile, stream=f)
+            stats.sort_stats('cumulative').print_stats(60)
+        self.samples = int(stats.total_calls)
+        return ['.txt', '.pstats']
+
+
+class ProfiledRequest:
+    def __init__(self, environ, mode, reason):
+        self.method = environ.get('REQUEST_METHOD', 'GET')
+        self.path = environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', '')
+        self.mode = mode
+        self.reason = reason
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(counter)}"
+        self.status = None
+        self.started = time.perf_counter()
+        self.busy = 0.0
+        self.finished = False
+        try:
+            self.profiler = DeterministicProfiler() if mode == 'cprofile' else SamplingProfiler()
+        except ValueError:
+            # another profiler already owns this interpreter (python 3.12+ allows one)
+            self.profiler = SamplingProfiler()
+            self.mode = 'sample'
+
+    def run(self, fn, *args):
+        # fn(*args) with the profiler on, the sampler stops walking the stack here
+        t0 = time.perf_counter()
+        self.profiler.enable()
+        try:
+            return fn(*args)
+        finally:
+            self.profiler.disable()
+            self.busy += time.perf_counter() - t0
+
+    def expired(self):
+        return time.perf_counter() - self.started > MAX_SECONDS
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        elapsed = time.perf_counter() - self.started
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            slug = re.sub(r'[^A-Za-z0-9]+', '_', self.path).strip('_')[:60] or 'root'
+            name = f"{self.id}-{self.method}-{slug}"
+            base = os.path.join(PROFILE_DIR, name)
+            files = [name + ext for ext in self.profiler.save(base)]
+            meta = {
+                'id': self.id,
+                'method': self.method,
+                'path': self.path,
+                'status': self.status,
+                'mode': self.mode,
+                'reason': self.reason,
+                'wall_ms': round(elapsed * 1000, 1),
+                'profiled_ms': round(self.busy * 1000, 1),
+                'samples' if self.mode == 'sample' else 'calls': self.profiler.samples,
+                'pid': os.getpid(),
+                'time': time.time(),
+                'files': files,
+            }
+            with open(base + '.json', 'w') as f:
+                json.dump(meta, f)
+            prune()
+        except OSError as e:
+            print(f"profiler: could not save {self.id}: {e}")
+
+
+class ProfiledBody:
+    # iterates the response body with the profiler on, then writes the profile
+    def __init__(self, result, request):
+        self.result = result
+        self.iterator = iter(result)
+        self.request = request
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        request = self.request
+        if request.finished:
+            return next(self.iterator)
+        if request.expired():
+            request.finish()
+            return next(self.iterator)
+        try:
+            return request.run(next, self.iterator)
+        except StopIteration:
+            request.finish()
+            raise
+
+    def close(self):
+        try:
+            if hasattr(self.result, 'close'):
+                self.result.close()
+        finally:
+            self.request.finish()
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, sample_percent=SAMPLE_PERCENT, exclude=()):
+        self.app = app
+        self.sample_rate = sample_percent / 100.0
+        # prefixes served by another process, which profiles those requests itself
+        self.exclude = tuple(exclude)
+
+    def __call__(self, environ, start_response):
+        mode = requested_mode(environ)
+        reason = 'requested'
+        if mode is None:
+            if not self.sample_rate or random.random() >= self.sample_rate:
+                return self.app(environ, start_response)
+            mode, reason = 'sample', 'sampled'
+        if self.exclude and environ.get('PATH_INFO', '').startswith(self.exclude):
+            return self.app(environ, start_response)
+
+        request = ProfiledRequest(environ, mode, reason)
+
+        def profiled_start_response(status, headers, exc_info=None):
+            request.status = int(status.split(' ', 1)[0])
+            return start_response(status, list(headers) + [('X-Profile-Id', request.id)], exc_info)
+
+        try:
+            result = request.run(self.app, environ, profiled_start_response)
+        except BaseException:
+            request.status = 500
+            request.finish()
+            raise
+        return ProfiledBody(result, request)
+
+
+# code objects the sampler stops at (the middleware calling into the app)
+BOUNDARY = {ProfiledRequest.run.__code__}
+
+
+def profiled(app, exclude=()):
+    # the app wrapped in the profiling middleware, or unchanged unless CV_PROFILING=1
+    return ProfilingMiddleware(app, exclude=exclude) if ENABLED else app
+
+
+def list_profiles(limit=100):
+    # metadata of the newest profiles, newest first
+    try:
+        names = [n for n in os.listdir(PROFILE_DIR) if n.endswith('.json')]
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in sorted(names, reverse=True):
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda p: p.get('time', 0), reverse=True)
+    return profiles[:limit]
+
+
+def prune(keep=KEEP):
+    # drop the oldest profiles (all their files) past `keep`
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return
+    ids = [n[:-5] for n in names if n.endswith('.json')]
+    if len(ids) <= keep:
+        return
+
+    def age(name):
+        try:
+            return os.path.getmtime(os.path.join(PROFILE_DIR, name + '.json'))
+        except OSError:
+            return 0
+
+    stale = set(sorted(ids, key=age)[:len(ids) - keep])
+    for name in names:
+        if name.rsplit('.', 1)[0] in stale:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name))
+            except FileNotFoundError:
+                pass
+
+
+def flamegraph(stacks, title, width=1200, row=16, min_width=0.5):
+    # a self-contained svg flamegraph (root at the bottom) from folded stacks
+    root = {'count': 0, 'children': {}}
+    for stack, count in stacks.items():
+        root['count'] += count
+        node = root
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'count': 0, 'children': {}})
+            node['count'] += count
+    total = root['count']
+
+    def depth(node):
+        return 1 + max((depth(c) for c in node['children'].values()), default=0)
+
+    levels = depth(root)
+    height = (levels + 2) * row
+    scale = width / total if total else 0
+    rects = []
+
+    def place(name, node, x, level):
+        w = node['count'] * scale
+        if w < min_width:
+            return
+        y = height - (level + 1) * row
+        # warm colours, stable per function
+        h = zlib.crc32(name.encode())
+        color = f"rgb({205 + h % 50},{80 + (h >> 8) % 130},{(h >> 16) % 60})"
+        label = name if w > 7 * len(name) else name[:int(w / 7) - 2] + '..' if w > 35 else ''
+        tip = f"{name}: {node['count']} samples ({100 * node['count'] / total:.1f}%)"
+        rects.append(f'<g><title>{escape(tip)}</title>'
+                     f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" fill="{color}" rx="2"/>'
+                     f'<text x="{x + 3:.1f}" y="{y + row - 4}">{escape(label)}</text></g>')
+        for child_name, child in sorted(node['children'].items()):
+            place(child_name, child, x, level + 1)
+            x += child['count'] * scale
+
+    x = 0.0
+    for name, child in sorted(root['children'].items()):
+        place(name, child, x, 0)
+        x += child['count'] * scale
+
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'font-family="monospace" font-size="11">'
+            f'<rect width="100%" height="100%" fill="#f8f8f8"/>'
+            f'<text x="{width / 2}" y="{row}" text-anchor="middle" font-size="13">'
+            f'{escape(title)} ({total} samples)</text>'
+            + ''.join(rects) + '</svg>\n')
@@ -0,0 +1,64 @@
+import http.client
+
+# forwards requests for some mounts to another local server, used by serve.py so the camera
+# and stream modules can live in their own single worker while the rest of the hub runs in
+# many processes. responses are passed through chunk by chunk, so MJPEG streams keep streaming.
+
+# headers that only mean something for one hop
+HOP_HEADERS = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te',
+               'trailers', 'transfer-encoding', 'upgrade'}
+
+
+class ProxyApp:
+    def __init__(self, host, port, timeout=60):
+        # timeout covers connecting and waiting for the response head (and the body of
+        # normal responses); streams can sit idle for as long as they like
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def __call__(self, environ, start_response):
+        # the dispatcher moved the mount prefix into SCRIPT_NAME, the other server wants it back
+        path = environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', '')
+        if environ.get('QUERY_STRING'):
+            path += '?' + environ['QUERY_STRING']
+
+        headers = {key[5:].replace('_', '-').title(): value
+                   for key, value in environ.items() if key.startswith('HTTP_')}
+        headers = {k: v for k, v in headers.items() if k.lower() not in HOP_HEADERS}
+        if environ.get('CONTENT_TYPE'):
+            headers['Content-Type'] = environ['CONTENT_TYPE']
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        body = environ['wsgi.input'].read(length) if length else None
+        if body is not None:
+            headers['Content-Length'] = str(len(body))
+        headers['X-Forwarded-For'] = environ.get('REMOTE_ADDR', '')
+
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request(environ['REQUEST_METHOD'], path, body=body, headers=headers)
+            # getresponse() may hand the socket over to the response and forget it
+            sock = conn.sock
+            response = conn.getresponse()
+        except OSError as e:
+            conn.close()
+            start_response('502 Bad Gateway', [('Content-Type', 'text/plain')])
+            return [f"Stream worker unavailable: {e}".encode()]
+
+        if response.getheader('Content-Length') is None:
+            # no length = a stream (MJPEG, chunked), don't cut it off when it goes quiet
+            sock.settimeout(None)
+        start_response(f"{response.status} {response.reason}",
+                       [(k, v) for k, v in response.getheaders() if k.lower() not in HOP_HEADERS])
+        return self.stream(conn, response)
+
+    def stream(self, conn, response):
+        # read1 hands back whatever has arrived instead of waiting for a full buffer
+        try:
+            while True:
+                chunk = response.read1(65536)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            conn.close()
@@ -0,0 +1,159 @@
+import os
+import time
+import threading
+import functools
+from contextlib import contextmanager
+
+import cv2
+from flask import request
+from werkzeug.exceptions import ServiceUnavailable
+
+# admission control for the cpu-heavy endpoints (module2 detection, module3 /view, module4
+# stitch/sift). with threaded=True every request used to start its own opencv work with
+# opencv's full thread pool, so a handful of them oversubscribed the cores and everyone's
+# latency fell apart. now:
+#   - each endpoint class has a limit on how many of its jobs run at once, and all classes
+#     together never run more jobs than there are cores
+#   - the rest wait in a per-class queue; a full queue or waiting longer than the class
+#     timeout gets an HTTP 503 with Retry-After instead of piling up more work
+#   - while a job runs, opencv's thread count is the core budget split between the running
+#     jobs (cv2.setNumThreads is process-wide with the pthreads backend, so it's shared
+#     evenly rather than per job), so the total stays at the core count
+# CV_CPU_BUDGET overrides the core count (serve.py sets it per worker), CV_SCHEDULER=0 turns
+# all of this off.
+
+ENABLED = os.environ.get('CV_SCHEDULER', '1') != '0'
+CPU_BUDGET = int(os.environ.get('CV_CPU_BUDGET', '0')) or os.cpu_count() or 1
+
+# class -> most jobs running at once (None = as many as the budget allows), how many more
+# may wait, and how long they wait before giving up (seconds). a class with 'yields' only
+# starts a job while no other class has one waiting, for streams that take a slot per batch
+CLASSES = {
+    'detect': {'running': None, 'queue': 8, 'timeout': 30.0},     # module2 POST, seconds per job
+    'features': {'running': None, 'queue': 16, 'timeout': 15.0},  # module3 /view, /view_aruco
+    'stitch': {'running': None, 'queue': 8, 'timeout': 20.0},     # module4 run_stitch, run_sift
+    'stereo': {'running': None, 'queue': 4, 'timeout': 20.0},     # module7 dense_depth
+    # module4 mosaic_feed, one short job per batch of frames
+    'mosaic': {'running': 2, 'queue': 2, 'timeout': 10.0, 'yields': True},
+}
+
+
+class Overloaded(ServiceUnavailable):
+    def __init__(self, job_class, reason, retry_after=5):
+        super().__init__(f"Server busy ({job_class}: {reason}), try again shortly.")
+        self.retry_after = retry_after
+
+    def get_headers(self, environ=None, scope=None):
+        return super().get_headers(environ, scope) + [('Retry-After', str(self.retry_after))]
+
+
+class JobClass:
+    def __init__(self, name, running, queue, timeout, yields=False):
+        self.name = name
+        self.yields = yields
+        self.limit = running
+        self.queue_limit = queue
+        self.timeout = timeout
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_total = 0.0
+
+
+class ComputeScheduler:
+    def __init__(self, budget=CPU_BUDGET, classes=CLASSES, enabled=ENABLED):
+        self.budget = max(1, int(budget))
+        self.enabled = enabled
+        self.classes = {name: JobClass(name, min(cfg['running'] or self.budget, self.budget),
+                                       cfg['queue'], cfg['timeout'], cfg.get('yields', False))
+                        for name, cfg in classes.items()}
+        self.running = 0
+        self.threads = None
+        self.cond = threading.Condition()
+
+    def _set_threads(self):
+        # the core budget split between whatever is running now, at least one thread each
+        threads = max(1, self.budget // max(1, self.running))
+        if threads != self.threads:
+            cv2.setNumThreads(threads)
+            self.threads = threads
+
+    def _can_run(self, cls):
+        if cls.yields and any(c.waiting for c in self.classes.values() if c is not cls):
+            return False
+        return cls.running < cls.limit and self.running < self.budget
+
+    @contextmanager
+    def job(self, name):
+        if not self.enabled:
+            yield
+            return
+        cls = self.classes[name]
+        with self.cond:
+            if not self._can_run(cls):
+                if cls.waiting >= cls.queue_limit:
+                    cls.rejected += 1
+                    raise Overloaded(name, "queue full")
+                cls.waiting += 1
+                t0 = time.monotonic()
+                deadline = t0 + cls.timeout
+                try:
+                    while not self._can_run(cls):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            cls.timed_out += 1
+                            raise Overloaded(name, "timed out waiting", retry_after=int(cls.timeout))
+                        self.cond.wait(remaining)
+                finally:
+                    cls.waiting -= 1
+                cls.wait_total += time.monotonic() - t0
+            cls.running += 1
+            self.running += 1
+            self._set_threads()
+        try:
+            yield
+        finally:
+            with self.cond:
+                cls.running -= 1
+                cls.completed += 1
+                self.running -= 1
+                self._set_threads()
+                # wake everyone, the free slot might only suit a job from another class
+                self.cond.notify_all()
+
+    def idle(self):
+        # nothing running or queued, background work can go ahead
+        with self.cond:
+            return self.running == 0 and not any(c.waiting for c in self.classes.values())
+
+    def limit(self, name, methods=None):
+        # view decorator: admits the whole request, or only the given methods (GET stays free)
+        def decorate(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if methods and request.method not in methods:
+                    return view(*args, **kwargs)
+                with self.job(name):
+                    return view(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def stats(self):
+        with self.cond:
+            return {
+                'enabled': self.enabled,
+                'cpu_budget': self.budget,
+                'running': self.running,
+                'opencv_threads': self.threads,
+                'classes': {c.name: {'limit': c.limit, 'running': c.running, 'waiting': c.waiting,
+                                     'queue_limit': c.queue_limit, 'completed': c.completed,
+                                     'rejected': c.rejected, 'timed_out': c.timed_out,
+                                     'mean_wait_s': round(c.wait_total / c.completed, 3) if c.completed else 0.0}
+                            for c in self.classes.values()},
+            }
+
+
+# one per process, shared by every module mounted in it
+scheduler = ComputeScheduler()
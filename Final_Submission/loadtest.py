@@ -0,0 +1,158 @@
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+# load test for serve.py: starts the hub with 1 worker and then with N workers, hammers the
+# cpu-heavy module2/3/4 endpoints from many client threads and reports requests/sec and
+# latency percentiles for each. with one worker the opencv work queues up on one GIL,
+# with N it should scale until the cores run out.
+# --server hub runs the plain threaded dev server (run_hub.application) instead, and
+# --scheduler off on runs everything once without and once with the admission control in
+# hub/scheduler.py, to compare the p99s. 503s (queue full / waited too long) count as rejected.
+# usage: python loadtest.py [--workers 1 4] [--clients 8] [--seconds 20]
+#        python loadtest.py --server hub --scheduler off on --clients 16
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def endpoints():
+    # (method, path) pairs, picked round robin by every client
+    targets = [('POST', '/module2/'), ('GET', '/module3/'),
+               ('POST', '/module4/assignment4/run_sift'), ('POST', '/module4/assignment4/run_stitch')]
+    images = sorted(glob.glob(os.path.join(HERE, 'module3', 'dataset', '*.[jp][pn]g')))
+    if images:
+        targets.append(('GET', '/module3/view/' + os.path.basename(images[0])))
+    return targets
+
+
+def request(base, method, path, timeout=120):
+    # (seconds, http status or None if the connection failed)
+    req = urllib.request.Request(base + path, method=method, data=b'' if method == 'POST' else None)
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, OSError):
+        status = None
+    return time.perf_counter() - t0, status
+
+
+def wait_ready(base, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(base + '/', timeout=2):
+                return True
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    return False
+
+
+def run_load(base, targets, clients, seconds):
+    results = {target: [] for target in targets}
+    errors = [0, 0]
+    stop = time.monotonic() + seconds
+    lock = threading.Lock()
+
+    def client(offset):
+        i = offset
+        while time.monotonic() < stop:
+            target = targets[i % len(targets)]
+            i += 1
+            elapsed, status = request(base, *target)
+            with lock:
+                if status is not None and status < 400:
+                    results[target].append(elapsed)
+                elif status == 503:
+                    errors[1] += 1
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors[0], errors[1], time.perf_counter() - t0
+
+
+def report(label, results, errors, rejected, elapsed):
+    total = sum(len(v) for v in results.values())
+    everything = np.concatenate([v for v in results.values() if v] or [np.zeros(1)])
+    print(f"\n{label}: {total / elapsed:.1f} req/s, p50 {np.percentile(everything, 50) * 1000:.0f} ms, "
+          f"p99 {np.percentile(everything, 99) * 1000:.0f} ms, {errors} errors, {rejected} rejected (503)")
+    for (method, path), values in results.items():
+        if values:
+            print(f"  {method:<5}{path:<44}{len(values) / elapsed:>7.1f} req/s  "
+                  f"p50 {np.percentile(values, 50) * 1000:>6.0f} ms  p99 {np.percentile(values, 99) * 1000:>6.0f} ms")
+    return total / elapsed, np.percentile(everything, 99)
+
+
+def start_server(server, workers, port, scheduler):
+    env = dict(os.environ, CV_SCHEDULER='1' if scheduler == 'on' else '0')
+    if server == 'hub':
+        # the dev server setup from run_hub.py: one process, a thread per request
+        code = ("import run_hub; from werkzeug.serving import run_simple; "
+                f"run_simple('127.0.0.1', {port}, run_hub.application, threaded=True)")
+        cmd = [sys.executable, '-c', code]
+    else:
+        cmd = [sys.executable, os.path.join(HERE, 'serve.py'), '--host', '127.0.0.1',
+               '--port', str(port), '--workers', str(workers), '--server', server]
+    return subprocess.Popen(cmd, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test serve.py with different worker counts.")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--port', type=int, default=5070)
+    parser.add_argument('--server', default='auto', choices=['auto', 'gunicorn', 'werkzeug', 'hub'])
+    parser.add_argument('--scheduler', nargs='+', default=['on'], choices=['on', 'off'])
+    args = parser.parse_args(argv)
+
+    targets = endpoints()
+    base = f"http://127.0.0.1:{args.port}"
+    print(f"{os.cpu_count()} cpus, {args.clients} clients, {args.seconds:g}s per run")
+    # the threaded dev server is always a single process
+    worker_counts = [1] if args.server == 'hub' else list(dict.fromkeys(args.workers))
+    summary = []
+    for workers in worker_counts:
+        for scheduler in dict.fromkeys(args.scheduler):
+            label = f"{workers} worker(s), scheduler {scheduler}"
+            proc = start_server(args.server, workers, args.port, scheduler)
+            try:
+                if not wait_ready(base):
+                    print(f"server for {label} did not come up")
+                    continue
+                # every worker imports its apps on start, hit each endpoint once so that isn't measured
+                for target in targets:
+                    for _ in range(workers):
+                        request(base, *target)
+                rps, p99 = report(label, *run_load(base, targets, args.clients, args.seconds))
+                summary.append((workers, scheduler, rps, p99))
+            finally:
+                proc.terminate()
+                proc.wait()
+
+    if len(summary) > 1:
+        base_rps = summary[0][2]
+        print("\nworkers  scheduler  req/s  p99 ms  speedup")
+        for workers, scheduler, rps, p99 in summary:
+            print(f"{workers:>7}{scheduler:>11}{rps:>7.1f}{p99 * 1000:>8.0f}{rps / base_rps:>8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# viewer load test for the live streams: how much memory and cpu does every extra open
+# /video_feed tab cost the server? starts a camera broker on the looping demo clip (so no
+# webcam is needed), then the server, then:
+#   1. one viewer, to load the module and start the feed (the baseline)
+#   2. N viewers that just watch (a dashboard left open), held for --seconds
+# and reads the server's RSS and cpu time from /proc at both points. with --paused the viewers
+# connect and then never read (a background tab), which is the pure cost of keeping one open.
+# on a machine with few cores the clients compete with the server for cpu, so the cpu
+# numbers are only meaningful when there are cores to spare.
+#   --server async    -> stream_server.py, one coroutine per viewer on a shared feed
+#   --server threads  -> the threaded werkzeug dev server (run_hub.py), a thread + frame loop per viewer
+#   --server serve    -> serve.py on its public port, the way it's deployed (stream_server.py in
+#                        front, the compute pool behind it). the numbers add up every process of it
+# usage: python loadtest_streams.py [--clients 500] [--seconds 20] [--server async threads serve] [--paused]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+VIDEO = os.path.join(HERE, 'module6', 'static', 'sam2_demo_video.mp4')
+
+
+def proc_stats(pid):
+    # (rss MB, cpu seconds, threads) of a process, linux only
+    with open(f'/proc/{pid}/status') as f:
+        fields = dict(line.split(':', 1) for line in f if ':' in line)
+    with open(f'/proc/{pid}/stat') as f:
+        stat = f.read().rsplit(')', 1)[1].split()
+    cpu = (int(stat[11]) + int(stat[12])) / os.sysconf('SC_CLK_TCK')
+    return int(fields['VmRSS'].split()[0]) / 1024, cpu, int(fields['Threads'])
+
+
+def tree_stats(pid):
+    # proc_stats summed over pid and all its descendants (serve.py forks its workers)
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    total, todo = [0, 0, 0], [pid]
+    while todo:
+        current = todo.pop()
+        try:
+            stats = proc_stats(current)
+        except OSError:
+            continue
+        total = [a + b for a, b in zip(total, stats)]
+        todo += children.get(current, [])
+    return tuple(total)
+
+
+def wait_ready(base, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(base + '/module6/', timeout=5):
+                return True
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.3)
+    return False
+
+
+class Viewer:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.error = None
+        self.connected = False
+
+
+async def watch(host, port, path, viewer, stop, paused=False):
+    # reads the multipart stream and counts frames until told to stop
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+        await writer.drain()
+        viewer.connected = True
+        if paused:
+            await stop.wait()
+        tail = b''
+        while not stop.is_set():
+            chunk = await reader.read(65536)
+            if not chunk:
+                viewer.error = 'closed'
+                break
+            viewer.bytes += len(chunk)
+            data = tail + chunk
+            viewer.frames += data.count(b'--frame\r\n')
+            tail = data[-10:]
+        writer.close()
+    except (OSError, asyncio.IncompleteReadError) as e:
+        viewer.error = str(e) or type(e).__name__
+
+
+async def run_viewers(host, port, path, count, seconds, pid, paused=False):
+    stop = asyncio.Event()
+    viewers = [Viewer() for _ in range(count)]
+    tasks = []
+    # connect in batches, a listen backlog of 128 (werkzeug) would drop a burst of 500
+    for i in range(0, count, 25):
+        for viewer in viewers[i:i + 25]:
+            tasks.append(asyncio.ensure_future(watch(host, port, path, viewer, stop, paused)))
+        await asyncio.sleep(0.05)
+    # let everyone settle in, then measure a clean window
+    await asyncio.sleep(min(5.0, seconds / 4))
+    rss0, cpu0, _ = tree_stats(pid)
+    frames0 = sum(v.frames for v in viewers)
+    t0 = time.perf_counter()
+    await asyncio.sleep(seconds)
+    elapsed = time.perf_counter() - t0
+    rss1, cpu1, threads = tree_stats(pid)
+    frames1 = sum(v.frames for v in viewers)
+    stop.set()
+    await asyncio.wait(tasks, timeout=10)
+    for task in tasks:
+        task.cancel()
+    return {
+        'connected': sum(v.connected and not v.error for v in viewers),
+        'errors': sum(v.error is not None for v in viewers),
+        'rss_mb': max(rss0, rss1),
+        'cpu_s_per_s': (cpu1 - cpu0) / elapsed,
+        'threads': threads,
+        'fps_per_viewer': (frames1 - frames0) / elapsed / count,
+    }
+
+
+def start(cmd, env, log):
+    return subprocess.Popen(cmd, cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def measure(server, clients, seconds, port, path, paused):
+    env = dict(os.environ, CV_CAMERA_BROKER=f'cv_loadtest_{os.getpid()}', CV_METRICS='0')
+    log = open(os.devnull, 'w')
+    broker = start([sys.executable, '-m', 'hub.camera_broker', '--source', VIDEO, '--size', '640x480',
+                    '--name', env['CV_CAMERA_BROKER']], env, log)
+    if server == 'async':
+        cmd = [sys.executable, os.path.join(HERE, 'stream_server.py'), '--host', '127.0.0.1', '--port', str(port)]
+    elif server == 'serve':
+        cmd = [sys.executable, os.path.join(HERE, 'serve.py'), '--server', 'werkzeug', '--host', '127.0.0.1',
+               '--port', str(port), '--workers', 'compute=1']
+    else:
+        code = ("import run_hub; from werkzeug.serving import run_simple; "
+                f"run_simple('127.0.0.1', {port}, run_hub.application, threaded=True)")
+        cmd = [sys.executable, '-c', code]
+    time.sleep(2)
+    proc = start(cmd, env, log)
+    try:
+        if not wait_ready(f"http://127.0.0.1:{port}"):
+            print(f"{server} server did not come up")
+            return None
+        one = asyncio.run(run_viewers('127.0.0.1', port, path, 1, min(seconds, 10), proc.pid))
+        many = asyncio.run(run_viewers('127.0.0.1', port, path, clients, seconds, proc.pid, paused))
+        return one, many
+    finally:
+        proc.terminate()
+        proc.wait()
+        broker.terminate()
+        broker.wait()
+        log.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memory/cpu per viewer of the live MJPEG streams.")
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--server', nargs='+', default=['async'], choices=['async', 'threads', 'serve'])
+    parser.add_argument('--path', default='/module6/video_feed')
+    parser.add_argument('--port', type=int, default=5072)
+    parser.add_argument('--paused', action='store_true', help="viewers connect but never read")
+    args = parser.parse_args(argv)
+
+    print(f"{os.cpu_count()} cpus, {args.clients} {'paused ' if args.paused else ''}viewers on {args.path}, "
+          f"{args.seconds:g}s window")
+    rows = []
+    for server in args.server:
+        result = measure(server, args.clients, args.seconds, args.port, args.path, args.paused)
+        if result is None:
+            continue
+        one, many = result
+        extra = max(1, args.clients - 1)
+        per_mb = (many['rss_mb'] - one['rss_mb']) / extra
+        per_cpu = (many['cpu_s_per_s'] - one['cpu_s_per_s']) / extra
+        print(f"\n{server}: 1 viewer  -> {one['rss_mb']:.0f} MB, {one['cpu_s_per_s'] * 100:.0f}% cpu, "
+              f"{one['threads']} threads, {one['fps_per_viewer']:.1f} fps")
+        print(f"{server}: {args.clients} viewers -> {many['rss_mb']:.0f} MB, {many['cpu_s_per_s'] * 100:.0f}% cpu, "
+              f"{many['threads']} threads, {many['fps_per_viewer']:.1f} fps each, "
+              f"{many['connected']} connected, {many['errors']} errors")
+        rows.append((server, per_mb * 1024, per_cpu * 100, many['fps_per_viewer'], many['errors']))
+
+    print(f"\n{'server':<9}{'KB/viewer':>11}{'% cpu/viewer':>14}{'fps/viewer':>12}{'errors':>8}")
+    for server, kb, cpu, fps, errors in rows:
+        print(f"{server:<9}{kb:>11.1f}{cpu:>14.3f}{fps:>12.1f}{errors:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,22 @@
 from flask import Flask, render_template, request, jsonify
 import math
+import os
+import sys
+import numpy as np
+
+# the shared hub helpers live one folder up
+PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PARENT_DIR not in sys.path:
+    sys.path.append(PARENT_DIR)
+
+from hub.calibration import get_profile, parse_points
 
 app = Flask(__name__)
 
-# Calibration values for 'rubixcube1.jpg'
-fx = 1667.53
-fy = 1983.20
-cx = 1073.56
-cy = 703.16
+# Calibration values for 'rubixcube1.jpg' (calibrated at 1280x720, scaled to the image size)
+CAMERA = get_profile('rubixcube')
+IMG_W, IMG_H = 2220, 1480
+fx, fy, cx, cy = CAMERA.intrinsics(IMG_W, IMG_H)
 Z = 34.0  # cm, distance from camera to object
 
 @app.route('/')
@@ -24,11 +33,8 @@ def calculate():
     x2, y2 = p2['x'], p2['y']
 
     # Convert image pixel coordinates to world coordinates (at depth Z)
-    # Formula: X = (u - cx) * Z / fx
-    X1 = (x1 - cx) * Z / fx
-    Y1 = (y1 - cy) * Z / fy
-    X2 = (x2 - cx) * Z / fx
-    Y2 = (y2 - cy) * Z / fy
+    # Formula: X = (u - cx) * Z / fx, after removing lens distortion from the clicked pixels
+    (X1, Y1), (X2, Y2) = CAMERA.pixels_to_world([(x1, y1), (x2, y2)], Z, IMG_W, IMG_H)
 
     dX = X2 - X1
     dY = Y2 - Y1
@@ -44,5 +50,27 @@ def calculate():
         "distance": round(distance, 4)
     })
 
+@app.route('/calculate_batch', methods=['POST'])
+def calculate_batch():
+    # same math as /calculate, but for a whole array of point pairs in one go
+    try:
+        data = request.get_json()
+        p1 = parse_points(data['p1'])
+        p2 = parse_points(data['p2'])
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Bad request: {e}"}), 400
+    if p1.shape != p2.shape:
+        return jsonify({"error": "p1 and p2 need the same number of points"}), 400
+
+    # X = (u - cx) * Z / fx for every point at once (distortion removed first)
+    dXY = CAMERA.pixels_to_world(p2, Z, IMG_W, IMG_H) - CAMERA.pixels_to_world(p1, Z, IMG_W, IMG_H)
+    distance = np.hypot(dXY[:, 0], dXY[:, 1])
+
+    return jsonify({
+        "dX": np.round(np.abs(dXY[:, 0]), 4).tolist(),
+        "dY": np.round(np.abs(dXY[:, 1]), 4).tolist(),
+        "distance": np.round(distance, 4).tolist()
+    })
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -4,8 +4,21 @@ import glob
 import numpy as np
 import shutil
 import traceback
+import sys
 from flask import Flask, render_template, request, url_for
 
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+# the shared hub helpers live one folder up
+PARENT_DIR = os.path.dirname(current_dir)
+if PARENT_DIR not in sys.path:
+    sys.path.append(PARENT_DIR)
+
+from feature_index import FEATURES, SCENE_WIDTH, get_index
+from hub.image_cache import image_cache
+from hub.scheduler import scheduler
+
 app = Flask(__name__)
 
 # setting up paths
@@ -22,6 +35,11 @@ MAX_WIDTH = 1200
 
 IGNORE_FILES = ['test_scene.jpg', 'task2_source.jpg', 'task1_result.jpg', 'result.jpg', '.DS_Store']
 
+# how objects get found: 'template' is the multi-scale matchTemplate sweep,
+# 'orb' / 'sift' use the precomputed keypoint index in feature_index.py (any scale or rotation)
+BACKENDS = ('template',) + FEATURES
+DETECTION_BACKEND = os.environ.get('CV_DETECTOR', 'template')
+
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
@@ -35,9 +53,13 @@ def resize_image_and_get_ratio(image, target_width):
     return resized, scale
 
 @app.route('/', methods=['GET', 'POST'])
+@scheduler.limit('detect', methods=('POST',))
 def index():
     original_display = None
     processed_display = None
+    backend = request.form.get('backend', DETECTION_BACKEND)
+    if backend not in BACKENDS:
+        return f"Unknown detection backend: {backend}", 400
 
     try:
         if os.path.exists(SCENE_SOURCE):
@@ -48,7 +70,7 @@ def index():
         if request.method == 'POST':
             if os.path.exists(SCENE_SOURCE):
                 print("Starting processing...")
-                process_image_and_blur(SCENE_SOURCE)
+                process_image_and_blur(SCENE_SOURCE, backend)
                 processed_display = url_for('static', filename='result.jpg')
                 print("Processing done.")
 
@@ -56,72 +78,32 @@ def index():
         print("CRASH PREVENTED IN MODULE 2:")
         traceback.print_exc()
 
-    return render_template('index.html', original=original_display, processed=processed_display)
+    return render_template('index.html', original=original_display, processed=processed_display,
+                           backends=BACKENDS, backend=backend)
 
-def process_image_and_blur(image_path):
+def process_image_and_blur(image_path, backend='template'):
     try:
-        main_img = cv2.imread(image_path)
+        # decoded once per process, the result below is drawn on a copy
+        main_img = image_cache.get(image_path)
         if main_img is None: return
 
-        # resize scene to save RAM
-        main_img, ratio = resize_image_and_get_ratio(main_img, MAX_WIDTH)
-        
-        gray_main = cv2.cvtColor(main_img, cv2.COLOR_BGR2GRAY)
-        final_img = main_img.copy()
+        final_img, found = detect_objects(main_img, backend)
+        final_img = final_img.copy()
 
-        all_files = glob.glob(os.path.join(TEMPLATES_DIR, "*"))
-        
-        for t_path in all_files:
-            t_name = os.path.basename(t_path)
-            if t_name in IGNORE_FILES or not t_name.lower().endswith(('.jpg', '.png', '.jpeg')):
+        for t_name, outline, score in found:
+            x0, y0 = np.maximum(outline.min(axis=0), 0)
+            x1, y1 = np.minimum(outline.max(axis=0), final_img.shape[1::-1])
+            if x1 <= x0 or y1 <= y0:
                 continue
+            roi = final_img[y0:y1, x0:x1]
 
-            template = cv2.imread(t_path)
-            if template is None: continue
-            
-            # shrink template to match the new scene size
-            if ratio < 1.0:
-                h, w = template.shape[:2]
-                new_w = int(w * ratio)
-                new_h = int(h * ratio)
-                if new_w > 0 and new_h > 0:
-                    template = cv2.resize(template, (new_w, new_h))
-
-            gray_temp = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
-            (tH, tW) = gray_temp.shape[:2]
-
-            if tH > gray_main.shape[0] or tW > gray_main.shape[1]:
-                continue
+            blurred_roi = cv2.GaussianBlur(roi, (23, 23), 30)
+            # keypoint outlines can be rotated or skewed, so only blur inside the outline
+            mask = np.zeros(roi.shape[:2], np.uint8)
+            cv2.fillConvexPoly(mask, outline - [x0, y0], 255)
+            roi[mask > 0] = blurred_roi[mask > 0]
 
-            best_match = None
-            
-            # Restricted range (0.8 to 1.2) stops "giant/tiny" false positives
-            # 20 steps ensures we hit the exact size needed for the remote
-            for scale in np.linspace(0.8, 1.2, 20): 
-                resized_w = int(tW * scale)
-                resized_h = int(tH * scale)
-                
-                if resized_w > gray_main.shape[1] or resized_h > gray_main.shape[0]:
-                    continue
-
-                resized_t = cv2.resize(gray_temp, (resized_w, resized_h))
-                res = cv2.matchTemplate(gray_main, resized_t, cv2.TM_CCOEFF_NORMED)
-                (_, max_val, _, max_loc) = cv2.minMaxLoc(res)
-
-                if best_match is None or max_val > best_match[0]:
-                    best_match = (max_val, max_loc, resized_w, resized_h)
-
-            if best_match:
-                (score, (x, y), w, h) = best_match
-                
-                if score >= MATCH_THRESHOLD:
-                    print(f"Match: {t_name} ({score:.2f})")
-                    roi = final_img[y:y+h, x:x+w]
-                    
-                    blurred_roi = cv2.GaussianBlur(roi, (23, 23), 30)
-                    final_img[y:y+h, x:x+w] = blurred_roi
-                    
-                    cv2.rectangle(final_img, (x, y), (x + w, y + h), (0, 0, 255), 3)
+            cv2.polylines(final_img, [outline], True, (0, 0, 255), 3)
 
         result_path = os.path.join(UPLOAD_FOLDER, 'result.jpg')
         cv2.imwrite(result_path, final_img)
@@ -130,5 +112,79 @@ def process_image_and_blur(image_path):
         print(f"Error processing image: {e}")
         traceback.print_exc()
 
+def detect_objects(main_img, backend='template'):
+    # returns (the resized scene, [(template name, 4 corner outline in scene pixels, score)])
+    if backend == 'template':
+        return find_with_templates(main_img)
+    return find_with_features(main_img, backend)
+
+def box_outline(x, y, w, h):
+    return np.array([(x, y), (x + w, y), (x + w, y + h), (x, y + h)], np.int32)
+
+def find_with_templates(main_img):
+    # resize scene to save RAM
+    main_img, ratio = resize_image_and_get_ratio(main_img, MAX_WIDTH)
+    
+    gray_main = cv2.cvtColor(main_img, cv2.COLOR_BGR2GRAY)
+    found = []
+
+    all_files = glob.glob(os.path.join(TEMPLATES_DIR, "*"))
+    
+    for t_path in all_files:
+        t_name = os.path.basename(t_path)
+        if t_name in IGNORE_FILES or not t_name.lower().endswith(('.jpg', '.png', '.jpeg')):
+            continue
+
+        # shrink template to match the new scene size (cached already shrunk)
+        template = image_cache.get(t_path, scale=ratio if ratio < 1.0 else None)
+        if template is None: continue
+
+        gray_temp = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+        (tH, tW) = gray_temp.shape[:2]
+
+        if tH > gray_main.shape[0] or tW > gray_main.shape[1]:
+            continue
+
+        best_match = None
+        
+        # Restricted range (0.8 to 1.2) stops "giant/tiny" false positives
+        # 20 steps ensures we hit the exact size needed for the remote
+        for scale in np.linspace(0.8, 1.2, 20): 
+            resized_w = int(tW * scale)
+            resized_h = int(tH * scale)
+            
+            if resized_w > gray_main.shape[1] or resized_h > gray_main.shape[0]:
+                continue
+
+            resized_t = cv2.resize(gray_temp, (resized_w, resized_h))
+            res = cv2.matchTemplate(gray_main, resized_t, cv2.TM_CCOEFF_NORMED)
+            (_, max_val, _, max_loc) = cv2.minMaxLoc(res)
+
+            if best_match is None or max_val > best_match[0]:
+                best_match = (max_val, max_loc, resized_w, resized_h)
+
+        if best_match:
+            (score, (x, y), w, h) = best_match
+            
+            if score >= MATCH_THRESHOLD:
+                print(f"Match: {t_name} ({score:.2f})")
+                found.append((t_name, box_outline(x, y, w, h), float(score)))
+
+    return main_img, found
+
+def find_with_features(main_img, feature):
+    # keypoint backend: one index lookup for all templates instead of a sweep per template
+    scene, ratio = resize_image_and_get_ratio(main_img, SCENE_WIDTH[feature])
+    gray = cv2.cvtColor(scene, cv2.COLOR_BGR2GRAY)
+    # built once and saved, only rebuilt when the template files change
+    index = get_index(feature, TEMPLATES_DIR, IGNORE_FILES, SCENE_SOURCE)
+
+    found = []
+    for t_name, corners, inliers, matches in index.detect(gray):
+        print(f"Match: {t_name} ({inliers}/{matches} inliers)")
+        # score = share of the matches that agree with the homography
+        found.append((t_name, corners.astype(np.int32), inliers / matches))
+    return scene, found
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
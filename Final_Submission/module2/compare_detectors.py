@@ -0,0 +1,109 @@
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import app
+from feature_index import FEATURES, get_index
+
+# compares the detection backends on test_scene.jpg: latency and recall against hand-checked
+# boxes for all 10 objects. the scene is also rotated/shrunk to show where the template sweep
+# (0.8-1.2x, no rotation) stops working and the keypoint index keeps going.
+# usage: python compare_detectors.py [runs per backend, default 2]
+
+# where every object really is, as fractions of the scene (x0, y0, x1, y1), checked by eye
+GROUND_TRUTH = {
+    'brochure.jpg': (0.573, 0.062, 0.721, 0.441),
+    'card.jpg': (0.614, 0.501, 0.730, 0.596),
+    'clipboard.jpg': (0.364, 0.063, 0.486, 0.270),
+    'key.jpg': (0.283, 0.496, 0.335, 0.663),
+    'letter.jpg': (0.549, 0.686, 0.827, 0.871),
+    'marker.jpg': (0.517, 0.063, 0.537, 0.250),
+    'remote.jpg': (0.392, 0.298, 0.449, 0.594),
+    'sweet.jpg': (0.262, 0.703, 0.482, 0.930),
+    'wallet.jpg': (0.218, 0.281, 0.345, 0.483),
+    'watch.jpg': (0.485, 0.284, 0.547, 0.706),
+}
+
+# (name, rotation degrees, scale) applied to the scene
+VARIANTS = [('original', 0, 1.0), ('rotated 90', 90, 1.0), ('rotated 30', 30, 1.0), ('scaled 0.6', 0, 0.6)]
+
+MIN_IOU = 0.5
+
+
+def transform_scene(img, angle, scale):
+    # rotate about the centre into a canvas big enough to hold it, returns (image, 2x3 matrix)
+    h, w = img.shape[:2]
+    M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, scale)
+    cos, sin = abs(M[0, 0]), abs(M[0, 1])
+    new_w, new_h = int(h * sin + w * cos), int(h * cos + w * sin)
+    M[0, 2] += new_w / 2 - w / 2
+    M[1, 2] += new_h / 2 - h / 2
+    # carpet-ish grey outside the photo so the borders don't make strong edges
+    return cv2.warpAffine(img, M, (new_w, new_h), borderValue=(120, 120, 130)), M
+
+
+def truth_boxes(img_shape, M):
+    # ground truth corners through the same transform, as axis aligned boxes in the new image
+    h, w = img_shape[:2]
+    boxes = {}
+    for name, (x0, y0, x1, y1) in GROUND_TRUTH.items():
+        corners = np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]]) * [w, h]
+        moved = corners @ M[:, :2].T + M[:, 2]
+        boxes[name] = np.concatenate([moved.min(axis=0), moved.max(axis=0)])
+    return boxes
+
+
+def iou(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def score(found, scene_shape, image_shape, truth):
+    # detections are in the resized scene, truth in the full image
+    s = image_shape[1] / scene_shape[1]
+    hits, false = 0, 0
+    for name, outline, _ in found:
+        box = np.concatenate([outline.min(axis=0), outline.max(axis=0)]) * s
+        if name in truth and iou(box, truth[name]) >= MIN_IOU:
+            hits += 1
+        else:
+            false += 1
+    return hits, false
+
+
+def main(runs=2):
+    image = cv2.imread(app.SCENE_SOURCE)
+    if image is None:
+        print(f"Could not read {app.SCENE_SOURCE}")
+        return 1
+
+    backends = ['template'] + list(FEATURES)
+    # build the indexes up front so the timings are the per-request cost
+    for feature in FEATURES:
+        t0 = time.perf_counter()
+        get_index(feature, app.TEMPLATES_DIR, app.IGNORE_FILES)
+        print(f"{feature} index ready in {time.perf_counter() - t0:.2f}s")
+
+    print(f"\n{'scene':<14}{'backend':<10}{'median ms':>11}{'recall':>9}{'false':>7}")
+    for variant, angle, scale in VARIANTS:
+        img, M = transform_scene(image, angle, scale)
+        truth = truth_boxes(image.shape, M)
+        for backend in backends:
+            times = []
+            for _ in range(runs):
+                t0 = time.perf_counter()
+                scene, found = app.detect_objects(img, backend)
+                times.append(time.perf_counter() - t0)
+            hits, false = score(found, scene.shape, img.shape, truth)
+            print(f"{variant:<14}{backend:<10}{np.median(times) * 1000:>11.0f}"
+                  f"{hits:>6}/{len(truth):<3}{false:>6}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2))
@@ -0,0 +1,232 @@
+import glob
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# second detection backend for the blurring page: keypoints + descriptors instead of the
+# multi-scale matchTemplate sweep. works at any scale and rotation (the sweep only covers
+# 0.8-1.2x and no rotation), but needs textured objects: plain ones like the key or the
+# marker don't give enough keypoints.
+#   1. every template's keypoints/descriptors are computed once and saved into one index file
+#   2. the scene's features are computed once per image
+#   3. all template descriptors are matched against the scene in a single knn query
+#   4. each template with enough matches is verified with a RANSAC homography
+# the index lives in feature_index/<feature>.npz and is rebuilt when the templates change.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_DIR = os.path.join(BASE_DIR, 'feature_index')
+
+FEATURES = ('orb', 'sift')
+# the scene gets resized to this width before extracting features
+SCENE_WIDTH = {'orb': 2000, 'sift': 1200}
+# the templates were cut out of photos from the same camera as the scene, so they get shrunk
+# by the same amount (SCENE_WIDTH / the camera's width, read off the reference scene photo);
+# anything else in scale or rotation is up to the features themselves.
+# except that a thin template never goes below this many pixels wide (or above its own
+# size): at the sift scale the 106px marker would be ~30px, too small for any keypoints
+MIN_TEMPLATE_WIDTH = 64
+TEMPLATE_FEATURES = 2000
+RATIO_TEST = 0.75
+MIN_MATCHES = 8
+MIN_INLIERS = 10
+RANSAC_THRESHOLD = 5.0
+
+
+def make_detector(feature, nfeatures):
+    if feature == 'orb':
+        return cv2.ORB_create(nfeatures=nfeatures)
+    return cv2.SIFT_create(nfeatures=nfeatures)
+
+
+def make_matcher(feature):
+    # approximate nearest neighbours, brute force over ~10k x 20k descriptors takes seconds
+    if feature == 'orb':
+        # locality sensitive hashing for the binary ORB descriptors
+        return cv2.FlannBasedMatcher(dict(algorithm=6, table_number=6, key_size=12, multi_probe_level=1),
+                                     dict(checks=64))
+    # kd-trees for the float SIFT descriptors
+    return cv2.FlannBasedMatcher(dict(algorithm=1, trees=4), dict(checks=64))
+
+
+def template_scale(feature, template_width, camera_width):
+    scale = SCENE_WIDTH[feature] / camera_width
+    return min(1.0, max(scale, MIN_TEMPLATE_WIDTH / template_width))
+
+
+def build_settings(feature, camera_width):
+    # everything the scales depend on, an index built with other values is stale
+    return (float(camera_width), float(SCENE_WIDTH[feature]), float(MIN_TEMPLATE_WIDTH))
+
+
+_widths = {}
+
+
+def image_width(path):
+    # pixel width of a photo, decoded once per process (and again if the file changes)
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime)
+    if key not in _widths:
+        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise ValueError(f"Can't read the reference scene {path}")
+        _widths[key] = img.shape[1]
+    return _widths[key]
+
+
+def template_files(templates_dir, ignore):
+    paths = glob.glob(os.path.join(templates_dir, '*'))
+    return sorted(p for p in paths
+                  if os.path.basename(p) not in ignore and p.lower().endswith(('.jpg', '.png', '.jpeg')))
+
+
+class FeatureIndex:
+    def __init__(self, feature, names, sizes, points, descriptors, owners, scales, settings, sources):
+        self.feature = feature
+        self.names = list(names)
+        self.sizes = sizes                  # (T, 2) template width, height at its scale
+        self.points = points                # (N, 2) keypoint positions inside their template
+        self.descriptors = descriptors      # (N, D) every template's descriptors stacked
+        self.owners = owners                # (N,) which template each descriptor came from
+        self.scales = scales                # (T,) how much each template was shrunk
+        self.settings = settings            # (camera width, scene width, min template width) used
+        self.sources = sources              # (T, 2) file size, mtime, to notice edits
+
+    @classmethod
+    def build(cls, feature, paths, camera_width):
+        detector = make_detector(feature, TEMPLATE_FEATURES)
+        names, sizes, points, descriptors, owners, scales, sources = [], [], [], [], [], [], []
+        for path in paths:
+            template = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if template is None:
+                continue
+            # same scale the scene will be at, so the features meet in the middle of the pyramid
+            scale = template_scale(feature, template.shape[1], camera_width)
+            if scale < 1.0:
+                template = cv2.resize(template, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            keypoints, desc = detector.detectAndCompute(template, None)
+            t = len(names)
+            names.append(os.path.basename(path))
+            sizes.append(template.shape[::-1])
+            scales.append(scale)
+            stat = os.stat(path)
+            sources.append((stat.st_size, stat.st_mtime))
+            if desc is None:
+                continue
+            points.append(np.float32([k.pt for k in keypoints]))
+            descriptors.append(desc)
+            owners.append(np.full(len(desc), t, np.int32))
+
+        dtype = np.uint8 if feature == 'orb' else np.float32
+        width = 32 if feature == 'orb' else 128
+        return cls(feature, names, np.array(sizes, np.float32).reshape(-1, 2),
+                   np.concatenate(points) if points else np.zeros((0, 2), np.float32),
+                   np.concatenate(descriptors) if descriptors else np.zeros((0, width), dtype),
+                   np.concatenate(owners) if owners else np.zeros(0, np.int32),
+                   np.array(scales, np.float64), build_settings(feature, camera_width),
+                   np.array(sources, np.float64).reshape(-1, 2))
+
+    def save(self, path):
+        # written to a temp file and renamed, so a reader never loads half an index
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path[:-4]}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, feature=self.feature, names=np.array(self.names), sizes=self.sizes,
+                 points=self.points, descriptors=self.descriptors, owners=self.owners,
+                 scales=self.scales, settings=self.settings, sources=self.sources)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(str(data['feature']), data['names'].tolist(), data['sizes'], data['points'],
+                       data['descriptors'], data['owners'], data['scales'], tuple(data['settings'].tolist()),
+                       data['sources'])
+
+    def is_current(self, paths, camera_width):
+        # same files, unchanged, and built with the current settings
+        if [os.path.basename(p) for p in paths] != self.names:
+            return False
+        if tuple(self.settings) != build_settings(self.feature, camera_width):
+            return False
+        stats = np.array([(os.stat(p).st_size, os.stat(p).st_mtime) for p in paths], np.float64)
+        return stats.shape == self.sources.shape and np.allclose(stats, self.sources)
+
+    def detect(self, scene_gray, scene_features=None):
+        # returns [(template name, 4x2 corners in scene pixels, inliers, matches)]
+        if scene_features is None:
+            scene_features = extract(self.feature, scene_gray)
+        scene_points, scene_desc = scene_features
+        if scene_desc is None or len(scene_desc) < 2 or len(self.descriptors) == 0:
+            return []
+
+        # one query for every template at once, then split the matches up by template
+        pairs = make_matcher(self.feature).knnMatch(self.descriptors, scene_desc, k=2)
+        pairs = [p for p in pairs if len(p) == 2]
+        if not pairs:
+            return []
+        query = np.array([a.queryIdx for a, _ in pairs], np.int32)
+        train = np.array([a.trainIdx for a, _ in pairs], np.int32)
+        good = np.array([a.distance < RATIO_TEST * b.distance for a, b in pairs], bool)
+        query, train = query[good], train[good]
+
+        found = []
+        owners = self.owners[query]
+        for t in np.unique(owners):
+            sel = owners == t
+            if sel.sum() < MIN_MATCHES:
+                continue
+            src = self.points[query[sel]]
+            dst = scene_points[train[sel]]
+            H, mask = cv2.findHomography(src, dst, cv2.RANSAC, RANSAC_THRESHOLD)
+            if H is None:
+                continue
+            inliers = int(mask.sum())
+            if inliers < MIN_INLIERS:
+                continue
+            w, h = self.sizes[t]
+            corners = cv2.perspectiveTransform(np.float32([[[0, 0]], [[w, 0]], [[w, h]], [[0, h]]]), H)
+            corners = corners.reshape(4, 2)
+            # a twisted or collapsed quad means RANSAC settled on nonsense
+            if not cv2.isContourConvex(corners.astype(np.float32)) or cv2.contourArea(corners) < 100:
+                continue
+            found.append((self.names[t], corners, inliers, int(sel.sum())))
+        return found
+
+
+def extract(feature, gray):
+    # scene keypoint positions + descriptors, computed once per image
+    keypoints, desc = make_detector(feature, 20000 if feature == 'orb' else 0).detectAndCompute(gray, None)
+    return np.float32([k.pt for k in keypoints]).reshape(-1, 2), desc
+
+
+def index_path(feature):
+    return os.path.join(INDEX_DIR, f"{feature}.npz")
+
+
+_cache = {}
+# one build at a time, concurrent first requests wait for it instead of each building and
+# writing the same file
+_lock = threading.Lock()
+
+
+def get_index(feature, templates_dir, ignore, reference=None):
+    # in-memory, then the saved file, then a rebuild, whichever is still current.
+    # reference = a full photo from the camera the templates were cut from (the test scene)
+    if feature not in FEATURES:
+        raise ValueError(f"Unknown feature type: {feature}")
+    camera_width = image_width(reference or os.path.join(templates_dir, 'test_scene.jpg'))
+    with _lock:
+        paths = template_files(templates_dir, ignore)
+        index = _cache.get(feature)
+        if index is None and os.path.exists(index_path(feature)):
+            try:
+                index = FeatureIndex.load(index_path(feature))
+            except (OSError, KeyError, ValueError):
+                index = None
+        if index is None or not index.is_current(paths, camera_width):
+            index = FeatureIndex.build(feature, paths, camera_width)
+            index.save(index_path(feature))
+            print(f"Built {feature} index: {len(index.names)} templates, {len(index.descriptors)} descriptors")
+        _cache[feature] = index
+        return index
@@ -1,8 +1,9 @@
+import os
 import cv2
 import numpy as np
 from matplotlib import pyplot as plt
 
-IMAGE_PATH = 'dataset/task2_source.jpg'
+IMAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dataset', 'task2_source.jpg')
 KERNEL_SIZE = 21
 SIGMA = 5
 SNR = 0.005 
@@ -47,28 +48,32 @@ def recover_channel(channel, ksize, sigma):
     
     return restored
 
-img = cv2.imread(IMAGE_PATH)
-if img is None:
-    print(f"Error: {IMAGE_PATH} not found.")
-    exit()
+def main():
+    img = cv2.imread(IMAGE_PATH)
+    if img is None:
+        print(f"Error: {IMAGE_PATH} not found.")
+        return
 
-img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
-# Blur
-blurred = cv2.GaussianBlur(img_rgb, (KERNEL_SIZE, KERNEL_SIZE), SIGMA)
+    # Blur
+    blurred = cv2.GaussianBlur(img_rgb, (KERNEL_SIZE, KERNEL_SIZE), SIGMA)
 
-# Restore
-restored_channels = []
-for i in range(3):
-    restored_channels.append(recover_channel(blurred[:,:,i], KERNEL_SIZE, SIGMA))
+    # Restore
+    restored_channels = []
+    for i in range(3):
+        restored_channels.append(recover_channel(blurred[:,:,i], KERNEL_SIZE, SIGMA))
 
-restored = np.stack(restored_channels, axis=2)
+    restored = np.stack(restored_channels, axis=2)
 
-restored = cv2.convertScaleAbs(restored, alpha=1.2, beta=-10)
+    restored = cv2.convertScaleAbs(restored, alpha=1.2, beta=-10)
 
-# Display
-plt.figure(figsize=(15, 6))
-plt.subplot(1, 3, 1); plt.imshow(img_rgb); plt.title("Original")
-plt.subplot(1, 3, 2); plt.imshow(blurred); plt.title("Blurred")
-plt.subplot(1, 3, 3); plt.imshow(restored); plt.title("Restored (Ultra Sharp)")
-plt.show()
\ No newline at end of file
+    # Display
+    plt.figure(figsize=(15, 6))
+    plt.subplot(1, 3, 1); plt.imshow(img_rgb); plt.title("Original")
+    plt.subplot(1, 3, 2); plt.imshow(blurred); plt.title("Blurred")
+    plt.subplot(1, 3, 3); plt.imshow(restored); plt.title("Restored (Ultra Sharp)")
+    plt.show()
+
+if __name__ == '__main__':
+    main()
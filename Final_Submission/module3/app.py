@@ -1,17 +1,52 @@
 import cv2
 import numpy as np
 import os
-import glob
-from flask import Flask, render_template, url_for, abort
+import sys
+from flask import Flask, render_template, url_for, abort, jsonify
+
+# the shared hub helpers live one folder up
+PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PARENT_DIR not in sys.path:
+    sys.path.append(PARENT_DIR)
+
+from hub.image_cache import image_cache
+from hub.scheduler import scheduler
 
 app = Flask(__name__)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+
+from dataset_index import DatasetIndex, Source
 
 DATASET_DIR = os.path.join(BASE_DIR, 'dataset')
 ARUCO_DATASET_DIR = os.path.join(BASE_DIR, 'dataset_aruco')
 OUTPUT_DIR = os.path.join(BASE_DIR, 'static', 'output')
+THUMB_DIR = os.path.join(BASE_DIR, 'static', 'thumbs')
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+def source_stamp(input_path):
+    st = os.stat(input_path)
+    return f"{st.st_size} {st.st_mtime_ns}"
+
+def stamp_path(output_name_base):
+    return os.path.join(OUTPUT_DIR, f"{output_name_base}.stamp")
+
+def is_processed(output_name_base, input_path):
+    # done if the outputs were made from the input as it is now: the process_* functions write
+    # the input's size/mtime next to them last, a replaced image doesn't match and is redone
+    try:
+        with open(stamp_path(output_name_base)) as f:
+            return f.read() == source_stamp(input_path)
+    except OSError:
+        return False
+
+def mark_processed(output_name_base, stamp):
+    tmp = stamp_path(output_name_base) + f".{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(stamp)
+    os.replace(tmp, stamp_path(output_name_base))
+
 def process_and_save_image(filename):
     input_path = os.path.join(DATASET_DIR, filename)
     if not os.path.exists(input_path):
@@ -30,16 +65,16 @@ def process_and_save_image(filename):
     }
 
     # check if done
-    if os.path.exists(output_paths["boundary"]):
+    if is_processed(output_name_base, input_path):
         return output_name_base
+    # taken before reading, if the file changes while we work the stamp won't match it
+    stamp = source_stamp(input_path)
         
-    frame = cv2.imread(input_path)
-    if frame is None:
-        return None
-
-    # resize and grayscale
+    # resize and grayscale (the resized frame comes from the shared cache, read-only)
     h, w = 360, 480
-    frame_small = cv2.resize(frame, (w, h))
+    frame_small = image_cache.get(input_path, size=(w, h))
+    if frame_small is None:
+        return None
     gray = cv2.cvtColor(frame_small, cv2.COLOR_BGR2GRAY)
     blur = cv2.GaussianBlur(gray, (5, 5), 0)
     cv2.imwrite(output_paths["original"], frame_small)
@@ -93,6 +128,7 @@ def process_and_save_image(filename):
             cv2.drawContours(boundary_image, [largest_contour], -1, (0, 255, 0), 3)
 
     cv2.imwrite(output_paths["boundary"], boundary_image)
+    mark_processed(output_name_base, stamp)
 
     return output_name_base
 
@@ -110,13 +146,13 @@ def process_and_save_aruco(filename):
         "original": os.path.join(OUTPUT_DIR, f"{output_name_base}_original.jpg"),
         "segmented": os.path.join(OUTPUT_DIR, f"{output_name_base}_segmented.jpg"),
     }
-    if os.path.exists(output_paths["segmented"]):
+    if is_processed(output_name_base, input_path):
         return output_name_base
+    stamp = source_stamp(input_path)
         
-    frame = cv2.imread(input_path)
+    frame = image_cache.get(input_path, size=(640, 480))
     if frame is None: return None
     
-    frame = cv2.resize(frame, (640, 480))
     cv2.imwrite(output_paths["original"], frame)
     aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_6X6_250)
     parameters = cv2.aruco.DetectorParameters()
@@ -137,21 +173,45 @@ def process_and_save_aruco(filename):
         cv2.drawContours(segmented_image, [hull], -1, (0, 255, 0), 3)
     
     cv2.imwrite(output_paths["segmented"], segmented_image)
+    mark_processed(output_name_base, stamp)
     
     return output_name_base
 
+# both galleries render from this manifest, which also builds their thumbnails and runs the
+# analysis on new images in the background (see dataset_index.py)
+dataset_index = DatasetIndex({
+    'dataset': Source(DATASET_DIR, process_and_save_image),
+    'dataset_aruco': Source(ARUCO_DATASET_DIR, process_and_save_aruco),
+}, THUMB_DIR, 'thumbs', is_idle=scheduler.idle, job=lambda: scheduler.job('features'))
+
+def process_locked(source_name, filename, process, processed):
+    # the indexer may be computing the same image, its file lock keeps the two from writing
+    # the same outputs at once. only pages that still need computing go through the scheduler.
+    # names the manifest doesn't know are turned away before taking a lock or a slot
+    if not dataset_index.has(source_name, filename):
+        return None
+    with dataset_index.file_lock(source_name, filename):
+        if processed():
+            return process(filename)
+    with scheduler.job('features'), dataset_index.file_lock(source_name, filename):
+        return process(filename)
+
+@app.before_request
+def start_dataset_index():
+    # started with the first request rather than on import, so the benchmarks don't get it
+    dataset_index.start()
+
 @app.route('/')
 def index():
     #Home page for Parts 1-3
-
-    image_paths = glob.glob(os.path.join(DATASET_DIR, '*.[jp][pn]g'))
-    image_filenames = [os.path.basename(p) for p in image_paths]
-    return render_template('index.html', filenames=image_filenames)
+    return render_template('index.html', images=dataset_index.entries('dataset'))
 
 @app.route('/view/<filename>')
 def view_image(filename):
     #Results page for Parts 1-3
-    output_name = process_and_save_image(filename)
+    output_name = process_locked('dataset', filename, process_and_save_image,
+                                 lambda: is_processed(os.path.splitext(filename)[0],
+                                                      os.path.join(DATASET_DIR, filename)))
     if output_name is None:
         return abort(404, "Image not found in dataset.")
     return render_template('result.html', output_name=output_name)
@@ -159,18 +219,23 @@ def view_image(filename):
 @app.route('/aruco')
 def index_aruco():
     #Home page for Part 4
-    image_paths = glob.glob(os.path.join(ARUCO_DATASET_DIR, '*.[jp][pn]g'))
-    image_filenames = [os.path.basename(p) for p in image_paths]
-    return render_template('aruco_index.html', filenames=image_filenames)
+    return render_template('aruco_index.html', images=dataset_index.entries('dataset_aruco'))
 
 @app.route('/view_aruco/<filename>')
 def view_aruco(filename):
     #Results page for Part 4
-    output_name = process_and_save_aruco(filename)
+    output_name = process_locked('dataset_aruco', filename, process_and_save_aruco,
+                                 lambda: is_processed(os.path.splitext(filename)[0] + "_aruco",
+                                                      os.path.join(ARUCO_DATASET_DIR, filename)))
     if output_name is None:
         return abort(404, "ArUco image not found in dataset.")
     return render_template('aruco_result.html', output_name=output_name)
 
+@app.route('/dataset_index')
+def dataset_index_stats():
+    # images, thumbnails and precomputed pages per dataset folder
+    return jsonify(dataset_index.stats())
+
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,251 @@
+import os
+import hashlib
+import threading
+from contextlib import nullcontext
+
+import cv2
+
+from hub.scheduler import Overloaded
+
+# in-memory manifest of module3's datasets, kept up to date by a background thread:
+#   1. every POLL_SECONDS the dataset folders are listed (os.scandir, no decoding), new or
+#      changed files (size/mtime) get queued, deleted ones dropped along with their thumbnails
+#   2. a queued image is hashed, decoded once for its dimensions, and shrunk into a pyramid of
+#      webp thumbnails (640 -> 320 -> 160 px wide, each level from the one above)
+#   3. then the source's precompute function (module3's analysis) runs on it, so clicking an
+#      image finds its outputs already there. it runs in a scheduler slot and under the image's
+#      file_lock, which the /view pages take too, so the two never write the same outputs
+# the gallery pages render from the manifest and only ever load thumbnails. the thread runs
+# at the lowest cpu priority and waits while the scheduler has heavy requests running, so it
+# only soaks up idle time. thumbnails are named after the file's hash, so a replaced image
+# gets new urls and browsers can cache them forever.
+
+POLL_SECONDS = float(os.environ.get('CV_DATASET_POLL', '5'))
+THUMB_WIDTHS = (640, 320, 160)
+WEBP_QUALITY = 80
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def lower_priority():
+    # nice 19 for the calling thread only (linux applies setpriority per thread id)
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+class Source:
+    # one watched folder: where it is and what to precompute for each image in it
+    def __init__(self, directory, precompute=None):
+        self.directory = directory
+        self.precompute = precompute
+
+
+class DatasetIndex:
+    def __init__(self, sources, thumb_dir, thumb_url_prefix, poll=POLL_SECONDS, is_idle=None, job=None):
+        # sources: name -> Source. thumbnails are written to thumb_dir and served under
+        # thumb_url_prefix (relative to the app's static folder). job() is the context a
+        # precompute runs in (a scheduler slot)
+        self.sources = sources
+        self.thumb_dir = thumb_dir
+        self.thumb_url_prefix = thumb_url_prefix
+        self.poll = poll
+        self.is_idle = is_idle or (lambda: True)
+        self.job = job or nullcontext
+        self.manifest = {name: {} for name in sources}
+        self.pending = []
+        self.file_locks = {}
+        self.lock = threading.Lock()
+        self.scanned = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.thumbnails_built = 0
+        self.precomputed = 0
+        self.errors = 0
+
+    def scan(self):
+        # stat both folders and bring the manifest up to date, no file contents are read here
+        for source_name, source in self.sources.items():
+            try:
+                listing = {e.name: e.stat() for e in os.scandir(source.directory)
+                           if e.is_file() and e.name.lower().endswith(IMAGE_EXTENSIONS)}
+            except FileNotFoundError:
+                listing = {}
+            with self.lock:
+                entries = self.manifest[source_name]
+                for name in list(entries):
+                    if name not in listing:
+                        self.remove_thumbnails(entries.pop(name))
+                        self.file_locks.pop((source_name, name), None)
+                for name, st in listing.items():
+                    entry = entries.get(name)
+                    if entry is not None and (entry['size'], entry['mtime']) == (st.st_size, st.st_mtime_ns):
+                        continue
+                    entries[name] = {'name': name, 'size': st.st_size, 'mtime': st.st_mtime_ns,
+                                     'hash': None, 'width': None, 'height': None, 'thumbs': {},
+                                     'precomputed': False}
+                    if entry is not None:
+                        self.remove_thumbnails(entry)
+                    self.pending.append((source_name, name))
+        self.scanned.set()
+
+    def entries(self, source_name):
+        # the manifest of one folder, sorted by file name (copies, safe to hand to a template)
+        if not self.scanned.is_set():
+            self.scan()
+        with self.lock:
+            return [dict(e, thumbs=dict(e['thumbs'])) for _, e in sorted(self.manifest[source_name].items())]
+
+    def has(self, source_name, name):
+        if not self.scanned.is_set():
+            self.scan()
+        with self.lock:
+            return name in self.manifest[source_name]
+
+    def file_lock(self, source_name, name):
+        # held while an image's outputs are computed. take it inside the scheduler slot, never
+        # around one, or a view and the indexer could each hold what the other waits for.
+        # only for names in the manifest (check with has()), the locks go when the file does
+        with self.lock:
+            return self.file_locks.setdefault((source_name, name), threading.Lock())
+
+    def thumbnail_path(self, digest, width):
+        return os.path.join(self.thumb_dir, f"{digest[:16]}_{width}.webp")
+
+    def remove_thumbnails(self, entry):
+        # (called with the lock held, after the entry left the manifest)
+        if entry['hash'] is None:
+            return
+        # identical files share their thumbnails, keep them while a copy is still around
+        if any(e['hash'] == entry['hash'] for entries in self.manifest.values() for e in entries.values()):
+            return
+        for width in entry['thumbs']:
+            try:
+                os.remove(self.thumbnail_path(entry['hash'], width))
+            except FileNotFoundError:
+                pass
+
+    def build_thumbnails(self, path, digest):
+        # (width, height, thumbnail widths) of the image, writing whatever thumbnails aren't on
+        # disk yet. images narrower than a level just get a smaller pyramid
+        img = cv2.imread(path)
+        if img is None:
+            return None
+        h, w = img.shape[:2]
+        widths = sorted({min(width, w) for width in THUMB_WIDTHS}, reverse=True)
+        level = img
+        for width in widths:
+            level = cv2.resize(level, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+            out = self.thumbnail_path(digest, width)
+            if os.path.exists(out):
+                continue
+            # written next to the final name first, a half-written file is never served
+            tmp = out[:-5] + f".{os.getpid()}.tmp.webp"
+            cv2.imwrite(tmp, level, [cv2.IMWRITE_WEBP_QUALITY, WEBP_QUALITY])
+            os.replace(tmp, out)
+            with self.lock:
+                self.thumbnails_built += 1
+        return w, h, widths
+
+    def index_image(self, source_name, name):
+        source = self.sources[source_name]
+        path = os.path.join(source.directory, name)
+        with self.lock:
+            entry = self.manifest[source_name].get(name)
+        if entry is None:
+            return
+        if entry['hash'] is None:
+            digest = file_hash(path)
+            built = self.build_thumbnails(path, digest)
+            if built is None:
+                print(f"dataset index: could not read {path}")
+                with self.lock:
+                    self.errors += 1
+                return
+            with self.lock:
+                # the file may have changed or gone while we were reading it
+                if self.manifest[source_name].get(name) is not entry:
+                    return
+                entry['hash'] = digest
+                entry['width'], entry['height'], widths = built
+                entry['thumbs'] = {width: f"{self.thumb_url_prefix}/{digest[:16]}_{width}.webp" for width in widths}
+
+    def precompute(self, source_name, name):
+        source = self.sources[source_name]
+        with self.lock:
+            entry = self.manifest[source_name].get(name)
+        if entry is None or entry['precomputed'] or source.precompute is None:
+            return
+        try:
+            with self.job(), self.file_lock(source_name, name):
+                result = source.precompute(name)
+        except Overloaded:
+            # requests got there first, try again next pass
+            with self.lock:
+                self.pending.append((source_name, name))
+            return
+        with self.lock:
+            if result is None:
+                self.errors += 1
+            # the file may have been replaced meanwhile, then the new entry still needs it
+            elif self.manifest[source_name].get(name) is entry:
+                entry['precomputed'] = True
+                self.precomputed += 1
+
+    def wait_idle(self):
+        # back off while requests are running heavy jobs, False once we're told to stop
+        while not self.is_idle():
+            if self.stop_event.wait(0.25):
+                return False
+        return not self.stop_event.is_set()
+
+    def run(self):
+        lower_priority()
+        while not self.stop_event.is_set():
+            self.scan()
+            with self.lock:
+                work, self.pending = self.pending, []
+            # thumbnails for everything first (the galleries need them), then the analysis
+            for step in (self.index_image, self.precompute):
+                for source_name, name in work:
+                    if not self.wait_idle():
+                        return
+                    try:
+                        step(source_name, name)
+                    except Exception as e:
+                        print(f"dataset index: {step.__name__} failed for {name}: {e}")
+                        with self.lock:
+                            self.errors += 1
+            self.stop_event.wait(self.poll)
+
+    def start(self):
+        # starts the background thread once, cheap to call on every request
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is not None:
+                return
+            os.makedirs(self.thumb_dir, exist_ok=True)
+            self.thread = threading.Thread(target=self.run, name='dataset-index', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def stats(self):
+        with self.lock:
+            sources = {name: {'images': len(entries),
+                              'indexed': sum(e['hash'] is not None for e in entries.values()),
+                              'precomputed': sum(e['precomputed'] for e in entries.values())}
+                       for name, entries in self.manifest.items()}
+            return {'running': self.thread is not None, 'poll_seconds': self.poll, 'sources': sources,
+                    'pending': len(self.pending), 'thumbnails_built': self.thumbnails_built,
+                    'precomputed': self.precomputed, 'errors': self.errors}
@@ -1,12 +1,50 @@
-from flask import Flask, render_template, jsonify, redirect, url_for
+from flask import Flask, render_template, jsonify, redirect, url_for, request, Response
 import cv2
 import numpy as np
 import base64
 import os
+import re
+import sys
+import time
+import uuid
+import threading
+from collections import OrderedDict
 
-app = Flask(__name__)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+# the shared hub helpers live one folder up
+PARENT_DIR = os.path.dirname(BASE_DIR)
+if PARENT_DIR not in sys.path:
+    sys.path.append(PARENT_DIR)
+
+from panorama import estimate_homography, stitch_two_resolution
+from mosaic import VideoMosaic, PanSource
+from hub.image_cache import image_cache
+from hub.scheduler import scheduler, Overloaded
+from hub.camera_broker import open_camera
+from hub.frame_pool import mjpeg_part
+
+app = Flask(__name__)
 IMAGE_FOLDER = os.path.join(BASE_DIR, 'static', 'images')
+OUTPUT_DIR = os.path.join(BASE_DIR, 'static', 'output')
+PANORAMA_FILES = ['1.jpg', '2.jpg', '3.jpg', '4.jpg']
+# the low resolution stitch (and the registration of the full resolution one) works at this width
+STITCH_WIDTH = 600
+# the full resolution panorama is saved, the page shows a copy this wide
+PREVIEW_WIDTH = 1600
+# uploaded videos for the live mosaic, deleted once they've been mosaicked, or after
+# UPLOAD_TTL seconds if their feed is never opened
+UPLOAD_DIR = os.path.join(OUTPUT_DIR, 'uploads')
+UPLOAD_TTL = 15 * 60
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+# live mosaic sessions by id, so the page can poll their progress and get the finished file.
+# only the newest ones are kept (their saved mosaics go with them)
+mosaics = OrderedDict()
+mosaics_lock = threading.Lock()
+MAX_MOSAIC_SESSIONS = 16
+# frames read per scheduler job, the stream gives way to requests between batches
+MOSAIC_BATCH = 5
 
 def mat_to_base64(mat):
     #convert OpenCV matrix to base64 string for web display
@@ -20,6 +58,11 @@ def resize_image_fixed_width(img, target_width=800):
     scale = target_width / w
     return cv2.resize(img, (target_width, int(h * scale)), interpolation=cv2.INTER_AREA)
 
+def load_fixed_width(fname, target_width=800):
+    # decoded + resized once per process, same result as resize_image_fixed_width(imread(...))
+    return image_cache.get(os.path.join(IMAGE_FOLDER, fname), width=target_width,
+                           interpolation=cv2.INTER_AREA)
+
 def crop_black_borders(img):
     #Crops black borders to prevent the canvas from getting huge
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
@@ -35,32 +78,11 @@ def stitch_two_manually(img1, img2):
   
     #Stitches img2 onto img1
     print(f"Stitching pair: {img1.shape} and {img2.shape}")
-    
-    sift = cv2.SIFT_create()
-    kp1, des1 = sift.detectAndCompute(img1, None)
-    kp2, des2 = sift.detectAndCompute(img2, None)
-
-    index_params = dict(algorithm=1, trees=5)
-    search_params = dict(checks=50)
-    flann = cv2.FlannBasedMatcher(index_params, search_params)
-    matches = flann.knnMatch(des1, des2, k=2)
-
-    good = []
-    for m, n in matches:
-        if m.distance < 0.75 * n.distance:
-            good.append(m)
-
-    if len(good) < 4:
-        print("Not enough matches (manual). Returning img1.")
-        return img1
-
-    src_pts = np.float32([kp2[m.trainIdx].pt for m in good]).reshape(-1, 1, 2)
-    dst_pts = np.float32([kp1[m.queryIdx].pt for m in good]).reshape(-1, 1, 2)
 
-    H, status = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
-    
+    # sift + flann + ratio test + ransac, shared with the full resolution stitch (panorama.py)
+    H = estimate_homography(img1, img2)
     if H is None:
-        print("Homography failed.")
+        print("Not enough matches (manual). Returning img1.")
         return img1
 
     h1, w1 = img1.shape[:2]
@@ -94,14 +116,12 @@ def stitch_two_manually(img1, img2):
 
 #stitching
 def process_stitching():
-    filenames = ['1.jpg', '2.jpg', '3.jpg', '4.jpg']
     images = []
 
-    for fname in filenames:
-        path = os.path.join(IMAGE_FOLDER, fname)
-        img = cv2.imread(path)
+    for fname in PANORAMA_FILES:
+        img = load_fixed_width(fname, STITCH_WIDTH)
         if img is None: return None, f"Missing {fname}"
-        images.append(resize_image_fixed_width(img, 600))
+        images.append(img)
 
     print("Trying Auto Stitch...")
     try:
@@ -123,13 +143,122 @@ def process_stitching():
         traceback.print_exc()
         return None, str(e)
 
+def process_stitching_full_resolution():
+    # registration on the same 600px copies, warp + blend on the original photos (panorama.py).
+    # the photos are read straight from disk, 12MP each would crowd everything else out of the cache
+    small, full = [], []
+    for fname in PANORAMA_FILES:
+        img = load_fixed_width(fname, STITCH_WIDTH)
+        if img is None: return None, f"Missing {fname}"
+        small.append(img)
+        full.append(cv2.imread(os.path.join(IMAGE_FOLDER, fname)))
+    try:
+        return stitch_two_resolution(full, small)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return None, str(e)
+
+def save_panorama(pano):
+    # written next to the other static files (temp file + rename, two requests can run at once)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(OUTPUT_DIR, 'panorama_full.jpg')
+    tmp = os.path.join(OUTPUT_DIR, f".panorama_full_{os.getpid()}_{time.monotonic_ns()}.jpg")
+    cv2.imwrite(tmp, pano, [cv2.IMWRITE_JPEG_QUALITY, 92])
+    os.replace(tmp, path)
+    return url_for('static', filename='output/panorama_full.jpg', v=int(os.path.getmtime(path)))
+
+#live video mosaic
+def valid_session(session):
+    # session ids end up in file names
+    return re.fullmatch(r'[A-Za-z0-9_-]{1,32}', session or '') is not None
+
+def mosaic_path(session):
+    return os.path.join(OUTPUT_DIR, f"mosaic_{session}.jpg")
+
+def uploaded_video(session):
+    for ext in VIDEO_EXTENSIONS:
+        path = os.path.join(UPLOAD_DIR, session + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+def expire_uploads():
+    # uploads whose mosaic was never started
+    if not os.path.isdir(UPLOAD_DIR):
+        return
+    cutoff = time.time() - UPLOAD_TTL
+    for entry in os.scandir(UPLOAD_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+def open_mosaic_source(source, session):
+    # 'demo' sweeps across 1.jpg, 'camera' is the webcam (or the camera broker), 'upload' a posted video
+    if source == 'demo':
+        return PanSource(load_fixed_width('1.jpg', 1600))
+    if source == 'camera':
+        return open_camera(0)
+    if source == 'upload':
+        path = uploaded_video(session)
+        return cv2.VideoCapture(path) if path else None
+    return None
+
+def add_mosaic_session(session, mosaic):
+    with mosaics_lock:
+        mosaics[session] = mosaic
+        while len(mosaics) > MAX_MOSAIC_SESSIONS:
+            old, _ = mosaics.popitem(last=False)
+            if os.path.exists(mosaic_path(old)):
+                os.remove(mosaic_path(old))
+
+def generate_mosaic(cap, mosaic, session):
+    # one preview frame per video frame; the mosaic is saved when the video ends or the viewer leaves.
+    # frames are read outside the scheduler (a camera read is mostly waiting) and matched in one
+    # 'mosaic' job per batch, which waits whenever a request is queued
+    jpeg = None
+    try:
+        ended = False
+        while not ended:
+            frames = []
+            while len(frames) < MOSAIC_BATCH:
+                ok, frame = cap.read()
+                if not ok:
+                    ended = True
+                    break
+                frames.append(frame)
+            parts = []
+            try:
+                with scheduler.job('mosaic'):
+                    for frame in frames:
+                        mosaic.process(frame)
+                        _, jpeg = cv2.imencode('.jpg', mosaic.render())
+                        parts.append(mjpeg_part(jpeg))
+            except Overloaded:
+                # busy the whole time, these frames are dropped. sending the last preview again
+                # notices a viewer who left
+                if jpeg is not None:
+                    parts.append(mjpeg_part(jpeg))
+            yield from parts
+        _, jpeg = cv2.imencode('.jpg', mosaic.render(done=True))
+        yield mjpeg_part(jpeg)
+    finally:
+        cap.release()
+        image = mosaic.finish()
+        if image is not None:
+            os.makedirs(OUTPUT_DIR, exist_ok=True)
+            cv2.imwrite(mosaic_path(session), image)
+        upload = uploaded_video(session)
+        if upload:
+            os.remove(upload)
+
 #SIFT
 def compute_sift_logic():
-    path = os.path.join(IMAGE_FOLDER, '2.jpg')
-    img = cv2.imread(path)
+    img = load_fixed_width('2.jpg', 600)
     if img is None: return None, None, None, None, "Missing 2.jpg"
 
-    img = resize_image_fixed_width(img, 600)
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 # my logic from scratch sift
     g1 = cv2.GaussianBlur(gray, (3, 3), 1.3)
@@ -169,16 +298,68 @@ def home(): return redirect(url_for('assignment4_index'))
 def assignment4_index(): return render_template('assignment4.html')
 
 @app.route('/assignment4/run_stitch', methods=['POST'])
+@scheduler.limit('stitch')
 def run_stitch():
-    pano, error = process_stitching()
+    # ?full=1 -> panorama at the photos' own resolution, saved to static/output
+    full = request.args.get('full') == '1'
+    pano, error = process_stitching_full_resolution() if full else process_stitching()
     if error: return jsonify({'success': False, 'error': error})
     
-    phone_img = cv2.imread(os.path.join(IMAGE_FOLDER, 'phone.jpg'))
-    phone_b64 = mat_to_base64(resize_image_fixed_width(phone_img, 600)) if phone_img is not None else ""
-
-    return jsonify({'success': True, 'pano_image': mat_to_base64(pano), 'phone_image': phone_b64})
+    phone_img = load_fixed_width('phone.jpg', 600)
+    phone_b64 = mat_to_base64(phone_img) if phone_img is not None else ""
+
+    result = {'success': True, 'phone_image': phone_b64}
+    if full:
+        result['pano_url'] = save_panorama(pano)
+        result['pano_size'] = [pano.shape[1], pano.shape[0]]
+        pano = resize_image_fixed_width(pano, PREVIEW_WIDTH) if pano.shape[1] > PREVIEW_WIDTH else pano
+    result['pano_image'] = mat_to_base64(pano)
+    return jsonify(result)
+
+@app.route('/assignment4/mosaic_upload', methods=['POST'])
+def mosaic_upload():
+    video = request.files.get('video')
+    if video is None or not video.filename:
+        return jsonify({'success': False, 'error': 'No video uploaded'})
+    ext = os.path.splitext(video.filename)[1].lower()
+    if ext not in VIDEO_EXTENSIONS:
+        return jsonify({'success': False, 'error': f"Unsupported video type {ext or '(none)'}"})
+    session = uuid.uuid4().hex[:12]
+    expire_uploads()
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    video.save(os.path.join(UPLOAD_DIR, session + ext))
+    return jsonify({'success': True, 'session': session})
+
+@app.route('/assignment4/mosaic_feed')
+def mosaic_feed():
+    # ?source=demo|camera|upload&session=<id>, streams the growing mosaic
+    source = request.args.get('source', 'demo')
+    session = request.args.get('session', '')
+    if not valid_session(session):
+        return "Bad session id", 400
+    expire_uploads()
+    cap = open_mosaic_source(source, session)
+    if cap is None or not cap.isOpened():
+        return f"Could not open the {source} source", 404
+    mosaic = VideoMosaic()
+    add_mosaic_session(session, mosaic)
+    response = Response(generate_mosaic(cap, mosaic, session), mimetype='multipart/x-mixed-replace; boundary=frame')
+    # the generator's finally only runs if it was started, a viewer can leave before that
+    response.call_on_close(cap.release)
+    return response
+
+@app.route('/assignment4/mosaic_status/<session>')
+def mosaic_status(session):
+    mosaic = mosaics.get(session)
+    if mosaic is None:
+        return jsonify({'error': 'Unknown session'}), 404
+    result = mosaic.stats()
+    if mosaic.done and os.path.exists(mosaic_path(session)):
+        result['mosaic_url'] = url_for('static', filename=f"output/mosaic_{session}.jpg")
+    return jsonify(result)
 
 @app.route('/assignment4/run_sift', methods=['POST'])
+@scheduler.limit('stitch')
 def run_sift():
     scratch, cv_ver, count_scratch, count_cv, error = compute_sift_logic()
     if error: return jsonify({'success': False, 'error': error})
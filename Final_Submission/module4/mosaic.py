@@ -0,0 +1,292 @@
+import time
+
+import cv2
+import numpy as np
+
+from panorama import Layer, corners, detect_features, match_homography, scale_matrix
+
+# live mosaicking of a video or camera stream. every frame is matched against the last
+# keyframe only, and becomes a keyframe itself once it has moved far enough away from it:
+#   overlap > KEYFRAME_OVERLAP   -> hasn't moved enough, just show where the camera is
+#   overlap < MIN_OVERLAP        -> moved too far / bad match, wait for a better frame
+#   in between                   -> new keyframe, blended into the mosaic
+# the mosaic is a sparse grid of tiles that a keyframe only touches where it lands, and the
+# preview keeps one thumbnail per tile, so adding a keyframe costs the same whether the
+# mosaic has 3 keyframes or 300 (nothing gets recomposed). the full mosaic is only put
+# together once, when the stream ends.
+
+# frames are mosaicked at this width, and registered at half of it
+WORK_WIDTH = 640
+REGISTRATION_SCALE = 0.5
+FEATURES = 1000
+TILE = 256
+# fraction of the last keyframe the current frame still covers
+KEYFRAME_OVERLAP = 0.6
+MIN_OVERLAP = 0.15
+# a tile is ~450KB (color + blend weights), this keeps a mosaic under ~300MB
+MAX_TILES = 600
+PREVIEW_SIZE = (1280, 720)
+
+
+def quad_area(quad):
+    return cv2.contourArea(quad.reshape(-1, 2).astype(np.float32))
+
+
+def plausible(quad, shape, low, high):
+    # a warped frame should stay a convex quad of roughly the frame's size
+    pts = quad.reshape(-1, 2).astype(np.float32)
+    if not cv2.isContourConvex(pts):
+        return False
+    h, w = shape[:2]
+    return low <= quad_area(pts) / (w * h) <= high
+
+
+def overlap_fraction(quad, shape):
+    # how much of a frame-sized rectangle the warped quad covers
+    h, w = shape[:2]
+    rect = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    area, _ = cv2.intersectConvexConvex(quad.reshape(-1, 2).astype(np.float32), rect)
+    return area / (w * h)
+
+
+class TiledCanvas:
+    # the mosaic as {(col, row): (color, blend weight total)}, tiles only exist where something landed
+    def __init__(self, tile=TILE, max_tiles=MAX_TILES):
+        self.tile = tile
+        self.max_tiles = max_tiles
+        self.tiles = {}
+        self.extent = None         # (x0, y0, x1, y1) of everything added so far
+        self.grid = None           # (first col, first row, last col, last row) of the tiles
+        self.color = np.empty((tile, tile, 3), np.uint8)
+        self.weight = np.empty((tile, tile), np.float32)
+
+    def tile_range(self, bbox):
+        x0, y0, x1, y1 = bbox
+        return range(y0 // self.tile, -(-y1 // self.tile)), range(x0 // self.tile, -(-x1 // self.tile))
+
+    def add(self, layer):
+        # blends the layer into the tiles under it, returns the tiles that changed
+        # (None if the mosaic would get bigger than max_tiles)
+        rows, cols = self.tile_range(layer.bbox)
+        missing = sum((c, r) not in self.tiles for r in rows for c in cols)
+        if len(self.tiles) + missing > self.max_tiles:
+            return None
+        changed = []
+        for r in rows:
+            for c in cols:
+                color, weight = layer.warp(c * self.tile, r * self.tile, self.tile, self.tile, self.color, self.weight)
+                if cv2.countNonZero(weight) == 0:
+                    # inside the bounding box but not under the (tilted) frame
+                    continue
+                if (c, r) not in self.tiles:
+                    self.tiles[(c, r)] = (np.zeros((self.tile, self.tile, 3), np.uint8),
+                                          np.zeros((self.tile, self.tile), np.float32))
+                    g = self.grid or (c, r, c, r)
+                    self.grid = (min(g[0], c), min(g[1], r), max(g[2], c), max(g[3], r))
+                blend, total = self.tiles[(c, r)]
+                cv2.blendLinear(blend, color, total, weight, dst=blend)
+                total += weight
+                changed.append((c, r))
+        x0, y0, x1, y1 = layer.bbox
+        if self.extent is not None:
+            x0, y0 = min(x0, self.extent[0]), min(y0, self.extent[1])
+            x1, y1 = max(x1, self.extent[2]), max(y1, self.extent[3])
+        self.extent = (x0, y0, x1, y1)
+        return changed
+
+    def bounds(self):
+        # (first col, first row, cols, rows) of the grid, kept up to date instead of scanning the tiles
+        c0, r0, c1, r1 = self.grid
+        return c0, r0, c1 - c0 + 1, r1 - r0 + 1
+
+    def compose(self):
+        # the whole mosaic as one image (cropped to what was added), only done once at the end
+        if not self.tiles:
+            return None
+        c0, r0, cols, rows = self.bounds()
+        image = np.zeros((rows * self.tile, cols * self.tile, 3), np.uint8)
+        for (c, r), (color, _) in self.tiles.items():
+            x, y = (c - c0) * self.tile, (r - r0) * self.tile
+            image[y:y + self.tile, x:x + self.tile] = color
+        x0, y0, x1, y1 = self.extent
+        ox, oy = c0 * self.tile, r0 * self.tile
+        return image[max(0, y0 - oy):y1 - oy, max(0, x0 - ox):x1 - ox]
+
+
+class MosaicPreview:
+    # a small copy of the mosaic with one thumbnail per tile. only the tiles a keyframe changed
+    # get re-thumbnailed; when the mosaic outgrows max_size the thumbnails shrink by half
+    def __init__(self, tile=TILE, max_size=PREVIEW_SIZE):
+        self.tile = tile
+        self.thumb = tile // 2
+        self.max_w, self.max_h = max_size
+        self.image = None
+        self.origin = (0, 0)
+        self.cols = self.rows = 0
+
+    def update(self, canvas, changed):
+        c0, r0, cols, rows = canvas.bounds()
+        if self.image is None or (c0, r0) != self.origin or (cols, rows) != (self.cols, self.rows):
+            self.grow(c0, r0, cols, rows)
+        t = self.thumb
+        for c, r in changed:
+            x, y = (c - self.origin[0]) * t, (r - self.origin[1]) * t
+            self.image[y:y + t, x:x + t] = cv2.resize(canvas.tiles[(c, r)][0], (t, t), interpolation=cv2.INTER_AREA)
+
+    def grow(self, c0, r0, cols, rows):
+        old, old_origin, old_thumb = self.image, self.origin, self.thumb
+        while self.thumb > 1 and (cols * self.thumb > self.max_w or rows * self.thumb > self.max_h):
+            self.thumb //= 2
+        image = np.zeros((rows * self.thumb, cols * self.thumb, 3), np.uint8)
+        if old is not None:
+            if self.thumb != old_thumb:
+                old = cv2.resize(old, (self.cols * self.thumb, self.rows * self.thumb), interpolation=cv2.INTER_AREA)
+            x, y = (old_origin[0] - c0) * self.thumb, (old_origin[1] - r0) * self.thumb
+            image[y:y + old.shape[0], x:x + old.shape[1]] = old
+        self.image, self.origin, self.cols, self.rows = image, (c0, r0), cols, rows
+
+    def to_preview(self, quad):
+        # mosaic coordinates -> preview pixels
+        scale = self.thumb / self.tile
+        offset = np.float64([self.origin[0] * self.tile, self.origin[1] * self.tile])
+        return (quad.reshape(-1, 2) - offset) * scale
+
+
+class VideoMosaic:
+    def __init__(self):
+        self.canvas = TiledCanvas()
+        self.preview = MosaicPreview()
+        self.key_features = None
+        self.key_H = None          # last keyframe -> mosaic
+        self.quad = None           # where the current frame is on the mosaic
+        self.status = 'waiting for frames'
+        self.frames = 0
+        self.keyframes = 0
+        self.lost = 0
+        self.full = False
+        self.done = False
+        self.tile_count = 0
+        self.keyframe_seconds = []
+
+    def work_frames(self, frame):
+        # (frame at WORK_WIDTH, its registration copy, work -> registration coordinates)
+        h, w = frame.shape[:2]
+        if w != WORK_WIDTH:
+            frame = cv2.resize(frame, (WORK_WIDTH, round(h * WORK_WIDTH / w)), interpolation=cv2.INTER_AREA)
+        small = cv2.resize(frame, None, fx=REGISTRATION_SCALE, fy=REGISTRATION_SCALE, interpolation=cv2.INTER_AREA)
+        to_small = scale_matrix(small.shape[1] / frame.shape[1], small.shape[0] / frame.shape[0])
+        return frame, small, to_small
+
+    def process(self, frame):
+        self.frames += 1
+        if self.full:
+            return
+        work, small, to_small = self.work_frames(frame)
+        features = detect_features(small, FEATURES)
+        if self.key_features is None:
+            self.add_keyframe(work, features, np.eye(3))
+            return
+
+        H_small = match_homography(self.key_features, features)
+        if H_small is None:
+            self.lost += 1
+            self.status = 'lost, move back over the mosaic'
+            return
+        # registration coordinates -> frame -> last keyframe -> mosaic
+        H = np.linalg.inv(to_small) @ H_small @ to_small
+        on_key = cv2.perspectiveTransform(corners(work.shape), H)
+        self.quad = cv2.perspectiveTransform(on_key, self.key_H)
+        if not plausible(on_key, work.shape, 0.5, 2.0) or not plausible(self.quad, work.shape, 0.2, 5.0):
+            self.lost += 1
+            self.status = 'bad match, skipping frame'
+            return
+        overlap = overlap_fraction(on_key, work.shape)
+        if overlap > KEYFRAME_OVERLAP:
+            self.status = 'tracking'
+        elif overlap < MIN_OVERLAP:
+            self.lost += 1
+            self.status = 'moved too far, move back'
+        else:
+            self.add_keyframe(work, features, self.key_H @ H)
+
+    def add_keyframe(self, work, features, H):
+        t0 = time.perf_counter()
+        changed = self.canvas.add(Layer(work, H))
+        if changed is None:
+            self.full = True
+            self.status = f'mosaic full ({self.canvas.max_tiles} tiles)'
+            return
+        self.preview.update(self.canvas, changed)
+        self.key_features, self.key_H = features, H
+        self.quad = cv2.perspectiveTransform(corners(work.shape), H)
+        self.keyframes += 1
+        self.keyframe_seconds.append(time.perf_counter() - t0)
+        self.status = 'new keyframe'
+
+    def render(self, done=False):
+        # the preview with the camera's current position and a status line
+        if self.preview.image is None:
+            view = np.zeros((240, 320, 3), np.uint8)
+        else:
+            view = self.preview.image.copy()
+            if self.quad is not None and not done:
+                pts = np.int32(np.round(self.preview.to_preview(self.quad)))
+                tracking = self.status in ('tracking', 'new keyframe')
+                cv2.polylines(view, [pts], True, (0, 255, 0) if tracking else (0, 0, 255), 2)
+        text = 'done' if done else self.status
+        text = f"{text} | keyframes {self.keyframes} | tiles {len(self.canvas.tiles)}"
+        cv2.putText(view, text, (8, 22), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (0, 0, 0), 3, cv2.LINE_AA)
+        cv2.putText(view, text, (8, 22), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (255, 255, 255), 1, cv2.LINE_AA)
+        return view
+
+    def finish(self):
+        # the full mosaic, then the tiles are let go (the stats stay)
+        image = self.canvas.compose()
+        self.tile_count = len(self.canvas.tiles)
+        self.canvas.tiles.clear()
+        self.done = True
+        return image
+
+    def stats(self):
+        times = self.keyframe_seconds
+        first, last = times[:10], times[-10:]
+        return {
+            'status': 'done' if self.done else self.status,
+            'done': self.done,
+            'frames': self.frames,
+            'keyframes': self.keyframes,
+            'lost_frames': self.lost,
+            'tiles': self.tile_count if self.done else len(self.canvas.tiles),
+            'first_keyframes_ms': round(1000 * sum(first) / len(first), 1) if first else None,
+            'last_keyframes_ms': round(1000 * sum(last) / len(last), 1) if last else None,
+        }
+
+
+class PanSource:
+    # a camera sweeping across a photo (two rows, there and back), so the mosaic can be tried
+    # without a camera or a video. reads like cv2.VideoCapture
+    def __init__(self, image, size=(640, 480), step=10):
+        self.image = image
+        w, h = size
+        H, W = image.shape[:2]
+        rows = [int(H * 0.2), int(H * 0.2) + int(h * 0.55)]
+        path = [(x, rows[0]) for x in range(0, W - w, step)]
+        path += [(path[-1][0], y) for y in range(rows[0], rows[1], step)]
+        path += [(x, rows[1]) for x in range(path[-1][0], -1, -step)]
+        self.path = path
+        self.size = size
+        self.index = 0
+
+    def read(self, image=None):
+        if self.index >= len(self.path):
+            return False, None
+        x, y = self.path[self.index]
+        self.index += 1
+        w, h = self.size
+        return True, self.image[y:y + h, x:x + w].copy()
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
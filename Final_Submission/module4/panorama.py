@@ -0,0 +1,214 @@
+import math
+
+import cv2
+import numpy as np
+
+# two-resolution panorama stitching. everything that needs features (SIFT, matching, RANSAC)
+# runs on the small copies the page already stitches, and only the final warp + blend touches
+# the original photos:
+#   1. register the small copies: homography of every image into the middle one's frame,
+#      chained through its neighbours (features found once per image, capped at 4000)
+#   2. rescale those homographies to full resolution (H_full = S_ref^-1 * H_small * S_i)
+#   3. render the full resolution canvas one tile at a time: each tile warps only the part of
+#      every photo that lands in it and feathers the overlaps
+# apart from the source photos and the finished panorama, only a tile's worth of memory is
+# ever allocated, instead of canvas-sized warps and masks for every pair.
+
+TILE = 1024
+# strongest SIFT features kept per image for registration, plenty for RANSAC and ~3x faster
+# to detect + match than all of them (~10k on these photos)
+REGISTRATION_FEATURES = 4000
+# the feather weights are warped from a copy this many times smaller than the photo
+WEIGHT_STEP = 8
+# same rule as the manual stitch: a small canvas bigger than this means a bad match
+MAX_SMALL_CANVAS = 6000
+# refuse to allocate panoramas bigger than this (megapixels)
+MAX_MEGAPIXELS = 200
+
+
+def detect_features(img, nfeatures=0):
+    # (keypoints, descriptors), nfeatures=0 keeps all of them
+    return cv2.SIFT_create(nfeatures=nfeatures).detectAndCompute(img, None)
+
+
+def match_homography(features1, features2):
+    # H mapping the second image's pixels onto the first, or None when they don't match well enough
+    (kp1, des1), (kp2, des2) = features1, features2
+    if des1 is None or des2 is None or len(kp1) < 2 or len(kp2) < 2:
+        return None
+
+    index_params = dict(algorithm=1, trees=5)
+    search_params = dict(checks=50)
+    flann = cv2.FlannBasedMatcher(index_params, search_params)
+    matches = flann.knnMatch(des1, des2, k=2)
+
+    good = [m for m, n in (p for p in matches if len(p) == 2) if m.distance < 0.75 * n.distance]
+    if len(good) < 4:
+        return None
+
+    src_pts = np.float32([kp2[m.trainIdx].pt for m in good]).reshape(-1, 1, 2)
+    dst_pts = np.float32([kp1[m.queryIdx].pt for m in good]).reshape(-1, 1, 2)
+    H, _ = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
+    return H
+
+
+def estimate_homography(img1, img2):
+    # H mapping img2 onto img1 with every feature, what the manual stitch uses
+    return match_homography(detect_features(img1), detect_features(img2))
+
+
+def scale_matrix(sx, sy):
+    # original pixel coordinates -> resized ones, with cv2.resize's pixel-center convention
+    return np.array([[sx, 0, 0.5 * sx - 0.5],
+                     [0, sy, 0.5 * sy - 0.5],
+                     [0, 0, 1]])
+
+
+def translation(tx, ty):
+    return np.array([[1, 0, tx], [0, 1, ty], [0, 0, 1]], dtype=np.float64)
+
+
+def corners(shape):
+    h, w = shape[:2]
+    return np.float64([[0, 0], [w, 0], [w, h], [0, h]]).reshape(-1, 1, 2)
+
+
+def bounds(homographies, shapes):
+    # (xmin, ymin, xmax, ymax) of all the images once warped
+    pts = np.concatenate([cv2.perspectiveTransform(corners(s), H) for H, s in zip(homographies, shapes)])
+    xmin, ymin = np.floor(pts.min(axis=(0, 1)))
+    xmax, ymax = np.ceil(pts.max(axis=(0, 1)))
+    return int(xmin), int(ymin), int(xmax), int(ymax)
+
+
+def register(small_images):
+    # homography of every small image into the middle one's frame. each image is matched only
+    # against its neighbour towards the middle; a pair that doesn't match (or blows up the
+    # canvas) ends the chain on that side, like the manual stitch skips bad pairs
+    n = len(small_images)
+    ref = n // 2
+    homographies = {ref: np.eye(3)}
+    features = {}
+
+    def features_of(i):
+        # the middle image is matched on both sides, detect it once
+        if i not in features:
+            features[i] = detect_features(small_images[i], REGISTRATION_FEATURES)
+        return features[i]
+
+    for step in (1, -1):
+        i = ref + step
+        while 0 <= i < n:
+            pair = match_homography(features_of(i - step), features_of(i))
+            if pair is None:
+                print(f"Images {i - step} and {i} don't match, leaving out {i} and beyond.")
+                break
+            H = homographies[i - step] @ pair
+            placed = sorted(homographies)
+            xmin, ymin, xmax, ymax = bounds([homographies[j] for j in placed] + [H],
+                                            [small_images[j].shape for j in placed + [i]])
+            if xmax - xmin > MAX_SMALL_CANVAS or ymax - ymin > MAX_SMALL_CANVAS:
+                print(f"Canvas too big with image {i} (bad match detected), leaving it out.")
+                break
+            homographies[i] = H
+            i += step
+    return homographies
+
+
+def full_resolution_homographies(homographies, small_shapes, full_shapes, ref):
+    # rescale the small-image homographies to the original photos
+    def to_small(i):
+        (hs, ws), (hf, wf) = small_shapes[i][:2], full_shapes[i][:2]
+        return scale_matrix(ws / wf, hs / hf)
+    back = np.linalg.inv(to_small(ref))
+    return {i: back @ H @ to_small(i) for i, H in homographies.items()}
+
+
+def feather_weight(shape, step=WEIGHT_STEP):
+    # 1 in the middle of the photo falling towards 0 at its edges, stored step times smaller
+    h, w = shape[:2]
+    sh, sw = max(2, math.ceil(h / step)), max(2, math.ceil(w / step))
+    wy = 1.0 - np.abs(2.0 * (np.arange(sh) + 0.5) / sh - 1.0)
+    wx = 1.0 - np.abs(2.0 * (np.arange(sw) + 0.5) / sw - 1.0)
+    weight = np.outer(wy, wx).astype(np.float32)
+    # canvas -> weight pixel coordinates, composed after canvas -> photo
+    return weight, scale_matrix(sw / w, sh / h)
+
+
+class Layer:
+    # one photo placed on a canvas: its homography, bounding box and feather weights
+    def __init__(self, image, H):
+        self.image = image
+        self.H = H
+        self.bbox = bounds([H], [image.shape])
+        self.weight, to_weight = feather_weight(image.shape)
+        self.canvas_to_weight = to_weight @ np.linalg.inv(H)
+
+    def overlaps(self, tx, ty, tw, th):
+        x0, y0, x1, y1 = self.bbox
+        return x0 < tx + tw and x1 > tx and y0 < ty + th and y1 > ty
+
+    def warp(self, tx, ty, tw, th, color=None, weight=None, border=cv2.BORDER_REPLICATE):
+        # (color, feather weight) of the part of the photo that lands in the canvas tile at (tx, ty).
+        # the weight is 0 outside the photo, so the replicated border never shows
+        c = cv2.warpPerspective(self.image, translation(-tx, -ty) @ self.H, (tw, th), dst=color,
+                                flags=cv2.INTER_LINEAR, borderMode=border)
+        w = cv2.warpPerspective(self.weight, self.canvas_to_weight @ translation(tx, ty), (tw, th), dst=weight,
+                                flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                                borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+        return c, w
+
+
+def render_tiles(images, homographies, canvas_size, tile=TILE):
+    # the panorama, blended tile by tile. homographies map every photo onto the canvas
+    width, height = canvas_size
+    pano = np.zeros((height, width, 3), np.uint8)
+    layers = [Layer(images[i], H) for i, H in homographies.items()]
+
+    # working buffers, reused for every tile
+    blend = np.empty((tile, tile, 3), np.uint8)
+    color = np.empty((tile, tile, 3), np.uint8)
+    total = np.empty((tile, tile), np.float32)
+    weight_tile = np.empty((tile, tile), np.float32)
+    for ty in range(0, height, tile):
+        for tx in range(0, width, tile):
+            tw, th = min(tile, width - tx), min(tile, height - ty)
+            hits = [l for l in layers if l.overlaps(tx, ty, tw, th)]
+            if not hits:
+                continue
+            if len(hits) == 1:
+                # only one photo here, nothing to blend
+                pano[ty:ty + th, tx:tx + tw] = cv2.warpPerspective(hits[0].image, translation(-tx, -ty) @ hits[0].H,
+                                                                   (tw, th), dst=color[:th, :tw], flags=cv2.INTER_LINEAR)
+                continue
+            b, t = blend[:th, :tw], total[:th, :tw]
+            for k, layer in enumerate(hits):
+                c, w = layer.warp(tx, ty, tw, th, color[:th, :tw], weight_tile[:th, :tw])
+                if k == 0:
+                    b[:] = c
+                    t[:] = w
+                else:
+                    # running feather: (total * blend + w * c) / (total + w), same as summing every layer
+                    b = cv2.blendLinear(b, c, t, w, dst=b)
+                    t += w
+            pano[ty:ty + th, tx:tx + tw] = b
+    return pano
+
+
+def stitch_two_resolution(full_images, small_images, tile=TILE):
+    # (panorama at the photos' own resolution, error) using homographies found on small_images
+    homographies = register(small_images)
+    if len(homographies) < 2:
+        return None, "Images could not be registered"
+    ref = len(small_images) // 2
+    full = full_resolution_homographies(homographies, [s.shape for s in small_images],
+                                        [f.shape for f in full_images], ref)
+
+    xmin, ymin, xmax, ymax = bounds(list(full.values()), [full_images[i].shape for i in full])
+    width, height = xmax - xmin, ymax - ymin
+    if width * height > MAX_MEGAPIXELS * 1e6:
+        return None, f"Panorama would be {width}x{height}, too big"
+    origin = translation(-xmin, -ymin)
+    canvas = {i: origin @ H for i, H in full.items()}
+    print(f"Rendering {width}x{height} panorama from {len(canvas)} images in {tile}px tiles")
+    return render_tiles(full_images, canvas, (width, height), tile), None
@@ -2,50 +2,163 @@ from flask import Flask, render_template, Response, request, jsonify
 import cv2
 import sys
 import os
+import time
+import threading
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.append(current_dir)
+# the shared hub helpers live one folder up
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
 
 from tracking_strategies import ArucoStrategy, CSRTStrategy, SAM2Strategy
+from strategy_registry import StrategyRegistry
+from hub.metrics import StreamMetrics
+from hub.camera_broker import open_camera
+from hub.frame_pool import frame_pool, mjpeg_part
 
 app = Flask(__name__)
+metrics = StreamMetrics('module6')
+
+# every mode the page can ask for
+STRATEGIES = {
+    'marker': ArucoStrategy,
+    'markerless': CSRTStrategy,
+    'sam2': SAM2Strategy,
+}
+# modes that get built and warmed up in the background as soon as we start
+PREWARM_MODES = ['marker', 'markerless', 'sam2']
 
 class CameraContext:
-    def __init__(self):
-        self.cap = cv2.VideoCapture(0)
-        self.strategy = ArucoStrategy() 
+    def __init__(self, cap=None, prewarm=PREWARM_MODES):
+        # the webcam is only opened when a stream starts and let go when the last one ends,
+        # so importing the app (or just loading the page) never touches the device
+        self.external_cap = cap
+        self.cap = None
+        self.streams = 0
+        self.registry = StrategyRegistry(STRATEGIES)
+
+        self.mode = 'marker'
+        self.strategy = self.registry.get(self.mode)
+        self.registry.prewarm(prewarm)
+        # the request thread only writes this, the frame loop does the actual swap
+        self.requested_mode = self.mode
         self.frame_counter = 0
+        self.error_count = 0
+        # held while reading + processing a frame so strategies only change between frames
+        self.lock = threading.Lock()
 
     def switch_strategy(self, mode):
-        self.frame_counter = 0 
-        if mode == 'marker':
-            self.strategy = ArucoStrategy()
-        elif mode == 'markerless':
-            self.strategy = CSRTStrategy()
-        elif mode == 'sam2':
-            self.strategy = SAM2Strategy()
+        if mode not in self.registry:
+            print(f"Unknown strategy: {mode}")
+            return False
+        # start warming it now (no-op if it's already pooled), the swap happens on the next frame
+        self.registry.prepare(mode)
+        self.requested_mode = mode
         print(f"Switched to strategy: {mode}")
+        return True
+
+    def apply_pending_switch(self):
+        # called from the frame loop with the lock held
+        mode = self.requested_mode
+        if mode == self.mode:
+            return
+        strategy = self.registry.get_if_ready(mode)
+        if strategy is None:
+            if self.registry.has_failed(mode):
+                # the build blew up, stay on the current mode (switching again retries it)
+                print(f"Strategy {mode} failed to build, staying on {self.mode}")
+                self.requested_mode = self.mode
+            # still warming up, keep streaming the current mode until it's ready
+            return
+        strategy.reset()
+        self.strategy = strategy
+        self.mode = mode
+        self.frame_counter = 0
+
+    def acquire_camera(self):
+        with self.lock:
+            self.streams += 1
+            if self.cap is None:
+                # the webcam itself, or the shared camera broker's frames with CV_CAMERA_BROKER set
+                self.cap = self.external_cap if self.external_cap is not None else open_camera(0)
+
+    def release_camera(self):
+        with self.lock:
+            self.streams -= 1
+            if self.streams == 0 and self.cap is not None:
+                self.cap.release()
+                self.cap = None
+
+    def release(self):
+        self.registry.release_all()
+        with self.lock:
+            if self.cap is not None:
+                self.cap.release()
+                self.cap = None
 
-    def get_feed(self):
-        while True:
-            ret, frame = self.cap.read()
-            if not ret:
-                break
+    def get_feed(self, overlay=False):
+        # overlay = draw live fps/latency onto the frames (only works for camera modes)
+        timing = metrics.enabled
+        client_id = metrics.client_connected() if timing else None
+        self.acquire_camera()
+        frame = None
+        try:
+            while True:
+                processed_frame = None
+                # the last frame has been sent by now, its buffer can take the next one
+                frame_pool.release(frame)
+                frame = None
+                with self.lock:
+                    self.apply_pending_switch()
+                    strategy = self.strategy
+                    use_camera = strategy.uses_camera
+
+                    if use_camera:
+                        if timing: t0 = time.perf_counter()
+                        # read straight into a recycled buffer instead of a fresh array every frame
+                        ret, frame = self.cap.read(frame_pool.acquire())
+                        if timing: metrics.observe('capture', time.perf_counter() - t0)
+                        if not ret:
+                            break
+
+                        try:
+                            if timing: t0 = time.perf_counter()
+                            processed_frame = strategy.update(frame, self.frame_counter)
+                            if timing: metrics.observe('strategy', time.perf_counter() - t0)
+                            self.frame_counter += 1
+                        except Exception as e:
+                            self.error_count += 1
+                            if timing: metrics.inc('strategy_errors_total')
+                            print(f"Error in strategy: {e}")
+                            continue
+
+                if not use_camera:
+                    # replaying pre-encoded frames at the clip's own frame rate, nothing to process
+                    jpeg = strategy.encoded_frame()
+                    yield mjpeg_part(jpeg)
+                    if timing: metrics.client_frame(client_id)
+                    time.sleep(strategy.frame_interval)
+                    continue
 
-            try:
-                processed_frame = self.strategy.update(frame, self.frame_counter)
-                self.frame_counter += 1
-                
                 if processed_frame is None:
+                    if timing: metrics.inc('dropped_frames_total')
                     continue
 
+                if overlay and timing:
+                    metrics.draw_overlay(processed_frame, 'strategy')
+
+                if timing: t0 = time.perf_counter()
                 _, buffer = cv2.imencode('.jpg', processed_frame)
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-            except Exception as e:
-                print(f"Error in strategy: {e}")
-                continue
+                if timing: metrics.observe('encode', time.perf_counter() - t0)
+                yield mjpeg_part(buffer)
+                if timing: metrics.client_frame(client_id)
+        finally:
+            frame_pool.release(frame)
+            self.release_camera()
+            if timing: metrics.client_disconnected(client_id)
 
 cam_context = CameraContext()
 
@@ -55,12 +168,18 @@ def index():
 
 @app.route('/video_feed')
 def video_feed():
-    return Response(cam_context.get_feed(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    overlay = request.args.get('overlay') == '1'
+    return Response(cam_context.get_feed(overlay), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/select_mode', methods=['POST'])
 def select_mode():
     mode = request.form.get('mode')
-    cam_context.switch_strategy(mode)
+    if not cam_context.switch_strategy(mode):
+        return "Unknown mode", 400
     return "OK", 200
 
 if __name__ == '__main__':
@@ -0,0 +1,163 @@
+import cv2
+import numpy as np
+import os
+import json
+import sys
+import time
+import subprocess
+
+# the SAM2 masks come as one compressed npz, which means every mask gets inflated
+# into RAM at startup and then converted + contoured again on every frame.
+# this file converts them once into:
+#   masks.npy     -> bit-packed masks (8 pixels per byte), uncompressed so it can be memory-mapped
+#   contours.npz  -> contour points for every frame, found at conversion time
+#   source.json   -> size/mtime of the npz they came from, a regenerated npz gets converted again
+# so playback only has to draw, and a single mask is only decoded if someone asks for it
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NPZ_PATH = os.path.join(BASE_DIR, 'static', 'segmentation.npz')
+STORE_DIR = os.path.join(BASE_DIR, 'static', 'sam2_store')
+
+
+def source_stamp(npz_path):
+    st = os.stat(npz_path)
+    return {'size': st.st_size, 'mtime': st.st_mtime_ns}
+
+
+def convert_npz(npz_path=NPZ_PATH, store_dir=STORE_DIR):
+    stamp = source_stamp(npz_path)
+    masks = np.load(npz_path)['masks']
+    count, height, width = masks.shape
+    os.makedirs(store_dir, exist_ok=True)
+    # everything is written to temp names and moved into place, source.json last: a crash or
+    # another process converting at the same time never leaves a half-written store that passes
+    # store_exists(). the stamp goes first so a store caught mid-swap doesn't count as current
+    try:
+        os.remove(os.path.join(store_dir, 'source.json'))
+    except FileNotFoundError:
+        pass
+    tmp = f".{os.getpid()}.tmp"
+
+    # writing the packed masks straight into a memmap so we never hold two copies
+    packed = np.lib.format.open_memmap(os.path.join(store_dir, f'masks{tmp}.npy'), mode='w+',
+                                       dtype=np.uint8, shape=(count, height, (width + 7) // 8))
+
+    points, contour_offsets, frame_offsets = [], [0], [0]
+    for i in range(count):
+        mask = masks[i].astype(np.uint8)
+        packed[i] = np.packbits(mask, axis=-1)
+
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        for c in contours:
+            points.append(c.reshape(-1, 2))
+            contour_offsets.append(contour_offsets[-1] + len(c))
+        frame_offsets.append(len(contour_offsets) - 1)
+
+    packed.flush()
+    del packed
+
+    points = np.concatenate(points).astype(np.int32) if points else np.zeros((0, 2), np.int32)
+    np.savez(os.path.join(store_dir, f'contours{tmp}.npz'), points=points,
+             contour_offsets=np.array(contour_offsets, dtype=np.int64),
+             frame_offsets=np.array(frame_offsets, dtype=np.int64),
+             mask_shape=np.array([height, width]))
+    with open(os.path.join(store_dir, f'source{tmp}.json'), 'w') as f:
+        json.dump(stamp, f)
+    for name, ext in (('masks', '.npy'), ('contours', '.npz'), ('source', '.json')):
+        os.replace(os.path.join(store_dir, name + tmp + ext), os.path.join(store_dir, name + ext))
+    print(f"Converted {count} SAM2 masks into {store_dir}")
+
+
+def store_exists(store_dir=STORE_DIR, npz_path=NPZ_PATH):
+    # the store is there and was converted from the npz as it is now
+    if not (os.path.exists(os.path.join(store_dir, 'masks.npy')) and
+            os.path.exists(os.path.join(store_dir, 'contours.npz'))):
+        return False
+    try:
+        with open(os.path.join(store_dir, 'source.json')) as f:
+            stamp = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if not os.path.exists(npz_path):
+        # nothing to compare against, the store is all there is
+        return True
+    return stamp == source_stamp(npz_path)
+
+
+class MaskStore:
+    def __init__(self, store_dir=STORE_DIR):
+        # mmap means opening is instant and only the pages we touch get read
+        self.packed = np.load(os.path.join(store_dir, 'masks.npy'), mmap_mode='r')
+        data = np.load(os.path.join(store_dir, 'contours.npz'))
+        self.points = data['points']
+        self.contour_offsets = data['contour_offsets']
+        self.frame_offsets = data['frame_offsets']
+        self.height, self.width = [int(v) for v in data['mask_shape']]
+
+        # cutting the flat points array into per-contour views once, these are tiny
+        self.frame_contours = []
+        for i in range(len(self)):
+            first, last = self.frame_offsets[i], self.frame_offsets[i + 1]
+            self.frame_contours.append([
+                self.points[self.contour_offsets[c]:self.contour_offsets[c + 1]].reshape(-1, 1, 2)
+                for c in range(first, last)
+            ])
+
+    def __len__(self):
+        return len(self.frame_offsets) - 1
+
+    def mask(self, idx):
+        # decode just this one mask from the packed bits
+        return np.unpackbits(self.packed[idx], axis=-1, count=self.width)
+
+    def contours(self, idx, size=None):
+        # size = (w, h) of the frame we are drawing on, contours are scaled if it differs
+        contours = self.frame_contours[idx]
+        if size is None or size == (self.width, self.height):
+            return contours
+        scale = np.array([size[0] / self.width, size[1] / self.height])
+        return [(c * scale).astype(np.int32) for c in contours]
+
+
+# --- startup/memory report ---
+
+def current_rss_mb():
+    # resident memory right now (linux), falls back to peak rss elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except OSError:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1e6 if sys.platform == 'darwin' else rss / 1e3
+
+
+def measure(loader):
+    # runs inside a fresh process so the numbers don't leak into each other
+    rss_before = current_rss_mb()
+    t0 = time.perf_counter()
+    if loader == 'npz':
+        masks = np.load(NPZ_PATH)['masks']
+        current_mask = masks[0].astype(np.uint8)
+        contours, _ = cv2.findContours(current_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    else:
+        store = MaskStore()
+        contours = store.contours(0)
+    elapsed = time.perf_counter() - t0
+    print(f"{elapsed * 1000:.1f} {current_rss_mb() - rss_before:.1f}")
+
+
+def report():
+    print(f"{'loader':<8}{'startup (ms)':>14}{'RSS added (MB)':>16}")
+    for loader in ['npz', 'store']:
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', loader],
+                             capture_output=True, text=True, check=True).stdout.split()
+        print(f"{loader:<8}{float(out[0]):>14.1f}{float(out[1]):>16.1f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--measure':
+        measure(sys.argv[2])
+    else:
+        convert_npz()
+        report()
@@ -0,0 +1,134 @@
+import cv2
+import numpy as np
+import os
+import time
+import threading
+
+from mask_store import MaskStore, convert_npz, store_exists
+
+# the SAM2 demo is the same pre-recorded clip for everybody, so there is no point
+# decoding the video, drawing the masks and encoding jpegs again for every client.
+# this builds every finished jpeg once per process and replays them on a clock.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+VIDEO_PATH = os.path.join(BASE_DIR, 'static', 'sam2_demo_video.mp4')
+NPZ_PATH = os.path.join(BASE_DIR, 'static', 'segmentation.npz')
+STORE_DIR = os.path.join(BASE_DIR, 'static', 'sam2_store')
+
+# how much RAM the encoded frames are allowed to use
+MEMORY_BUDGET = 64 * 1024 * 1024
+JPEG_QUALITY = 80
+
+
+class SAM2Playback:
+    def __init__(self, video_path=VIDEO_PATH, store_dir=STORE_DIR, memory_budget=MEMORY_BUDGET,
+                 quality=JPEG_QUALITY, build=True):
+        self.video_path = video_path
+        self.store_dir = store_dir
+        self.memory_budget = memory_budget
+        self.quality = quality
+        self.frames = []
+        self.fps = 30.0
+        self.nbytes = 0
+        # every client shares this start time, so they all see the same frame
+        self.start_time = time.monotonic()
+        if build:
+            self.build()
+
+    def load_masks(self):
+        if not store_exists(self.store_dir, NPZ_PATH):
+            if not os.path.exists(NPZ_PATH):
+                print(f"ERROR: NPZ file not found at {NPZ_PATH}")
+                return None
+            convert_npz(NPZ_PATH, self.store_dir)
+        return MaskStore(self.store_dir)
+
+    def render(self, masks, scale):
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            print(f"ERROR: Video file not found at {self.video_path}")
+            return [], 0
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if fps > 0:
+            self.fps = fps
+
+        frames, total = [], 0
+        pos = 0
+        while True:
+            ret, video_frame = cap.read()
+            if not ret:
+                break
+            pos += 1
+
+            if scale < 1.0:
+                video_frame = cv2.resize(video_frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+            if masks is not None and len(masks) > 0:
+                # same pairing as the old live version: frame N gets mask N+1 (wrapping)
+                idx = pos % len(masks)
+                contours = masks.contours(idx, (video_frame.shape[1], video_frame.shape[0]))
+                cv2.drawContours(video_frame, contours, -1, (255, 255, 0), 3)
+                cv2.putText(video_frame, "SAM2", (10, 30),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
+
+            _, buffer = cv2.imencode('.jpg', video_frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            frames.append(buffer.tobytes())
+            total += len(frames[-1])
+            if total > self.memory_budget:
+                cap.release()
+                return None, total
+        cap.release()
+        return frames, total
+
+    def build(self):
+        t0 = time.perf_counter()
+        masks = self.load_masks()
+
+        # if the full size clip doesn't fit the budget, shrink it until it does
+        scale = 1.0
+        while True:
+            frames, total = self.render(masks, scale)
+            if frames is not None or scale < 0.1:
+                break
+            print(f"SAM2 playback over budget ({total / 1e6:.1f} MB) at scale {scale:.2f}, shrinking")
+            scale /= 2
+
+        self.frames = frames or []
+        self.nbytes = sum(len(f) for f in self.frames)
+        print(f"SAM2 playback cached {len(self.frames)} frames ({self.nbytes / 1e6:.1f} MB) "
+              f"in {time.perf_counter() - t0:.2f}s")
+
+    @property
+    def frame_interval(self):
+        return 1.0 / self.fps
+
+    def current_index(self):
+        # playback position comes from the clock, not from any per-client state
+        return int((time.monotonic() - self.start_time) * self.fps) % len(self.frames)
+
+    def current_jpeg(self):
+        return self.frames[self.current_index()]
+
+    def current_frame(self):
+        # decoded copy for callers that want pixels instead of jpeg bytes
+        return cv2.imdecode(np.frombuffer(self.current_jpeg(), np.uint8), cv2.IMREAD_COLOR)
+
+
+_playback = None
+_playback_lock = threading.Lock()
+
+
+def get_playback():
+    # one shared cache per process, built by whoever asks first
+    global _playback
+    with _playback_lock:
+        if _playback is None:
+            try:
+                _playback = SAM2Playback()
+            except Exception as e:
+                # cache an empty playback, the strategy shows its error overlay for it
+                # instead of the stream dying (and nobody retries the load every frame)
+                print(f"ERROR: could not load the SAM2 video or masks: {e}")
+                _playback = SAM2Playback(build=False)
+        return _playback
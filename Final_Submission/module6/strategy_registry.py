@@ -0,0 +1,78 @@
+import threading
+
+# keeps one warmed-up instance of every tracking strategy around, so switching modes
+# just means pointing at a different object instead of building a new one.
+# building/warming happens on a background thread; the frame loop only ever picks up
+# strategies that are already ready, so it never stalls waiting for one.
+
+class StrategyRegistry:
+    def __init__(self, factories):
+        # factories = {mode name: class or function that builds the strategy}
+        self.factories = factories
+        self.instances = {}
+        self.building = set()
+        # modes whose factory raised, so the frame loop stops waiting for them
+        self.failed = set()
+        self.lock = threading.Lock()
+
+    def __contains__(self, mode):
+        return mode in self.factories
+
+    def build(self, mode):
+        try:
+            strategy = self.factories[mode]()
+            try:
+                strategy.warm_up()
+            except Exception as e:
+                print(f"Warm-up failed for {mode}: {e}")
+            with self.lock:
+                self.instances[mode] = strategy
+            return strategy
+        except Exception:
+            with self.lock:
+                self.failed.add(mode)
+            raise
+        finally:
+            # whatever happened, a later prepare() may try again
+            with self.lock:
+                self.building.discard(mode)
+
+    def build_in_background(self, mode):
+        try:
+            self.build(mode)
+        except Exception as e:
+            print(f"Could not build strategy {mode}: {e}")
+
+    def get(self, mode):
+        # blocking version: builds it right here if it isn't pooled yet
+        with self.lock:
+            strategy = self.instances.get(mode)
+        return strategy if strategy is not None else self.build(mode)
+
+    def get_if_ready(self, mode):
+        # non-blocking version for the frame loop, None while it's still warming up
+        with self.lock:
+            return self.instances.get(mode)
+
+    def has_failed(self, mode):
+        with self.lock:
+            return mode in self.failed
+
+    def prepare(self, mode):
+        # start warming a mode in the background if nobody has yet
+        with self.lock:
+            if mode in self.instances or mode in self.building:
+                return
+            self.building.add(mode)
+            self.failed.discard(mode)
+        threading.Thread(target=self.build_in_background, args=(mode,), daemon=True).start()
+
+    def prewarm(self, modes):
+        for mode in modes:
+            self.prepare(mode)
+
+    def release_all(self):
+        with self.lock:
+            instances, self.instances = self.instances, {}
+        for strategy in instances.values():
+            strategy.release()
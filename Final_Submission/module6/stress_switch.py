@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+import random
+import sys
+import threading
+import time
+
+from app import CameraContext, STRATEGIES
+
+# stress test for hot-swapping strategies: one thread pulls frames from a live
+# synthetic stream while another keeps switching modes as fast as it can.
+# fails if any strategy throws, the stream dies, or switching causes a big stall.
+# usage: python stress_switch.py [seconds]
+
+FPS = 30
+# a gap this many frames long counts as a latency spike
+MAX_GAP_FRAMES = 4
+
+
+class SyntheticCapture:
+    # stands in for cv2.VideoCapture(0): a marker sliding across a noisy background at 30fps
+    def __init__(self, width=640, height=480):
+        self.width, self.height = width, height
+        dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+        self.marker = cv2.aruco.generateImageMarker(dictionary, 7, 120)
+        self.background = np.random.randint(90, 160, (height, width, 3), np.uint8)
+        self.count = 0
+        self.next_time = time.monotonic()
+
+    def read(self, image=None):
+        # pace like a real camera
+        self.next_time += 1.0 / FPS
+        time.sleep(max(0.0, self.next_time - time.monotonic()))
+
+        # like VideoCapture.read, fill the caller's buffer when it fits
+        if image is not None and image.shape == self.background.shape:
+            frame = image
+            np.copyto(frame, self.background)
+        else:
+            frame = self.background.copy()
+        x = 40 + (self.count * 4) % (self.width - 200)
+        y = 150 + int(60 * np.sin(self.count / 15))
+        frame[y:y + 120, x:x + 120] = self.marker[..., None]
+        self.count += 1
+        return True, frame
+
+    def release(self):
+        pass
+
+
+def run(seconds=10.0):
+    context = CameraContext(cap=SyntheticCapture())
+    stop = threading.Event()
+    frame_times = []
+    switches = [0]
+
+    def consume():
+        for _ in context.get_feed():
+            frame_times.append(time.monotonic())
+            if stop.is_set():
+                break
+
+    def toggle():
+        modes = list(STRATEGIES)
+        while not stop.is_set():
+            context.switch_strategy(random.choice(modes))
+            switches[0] += 1
+            time.sleep(random.uniform(0.0, 0.05))
+
+    consumer = threading.Thread(target=consume)
+    toggler = threading.Thread(target=toggle)
+    consumer.start()
+    # give the stream a moment to get going before we start hammering it
+    time.sleep(0.5)
+    toggler.start()
+    time.sleep(seconds)
+    stop.set()
+    toggler.join()
+    consumer.join(timeout=5)
+
+    gaps = np.diff(frame_times) if len(frame_times) > 1 else np.zeros(1)
+    print(f"frames={len(frame_times)}  switches={switches[0]}  errors={context.error_count}")
+    print(f"frame gap ms: mean={gaps.mean() * 1000:.1f}  p99={np.percentile(gaps, 99) * 1000:.1f}  "
+          f"max={gaps.max() * 1000:.1f}")
+
+    ok = (context.error_count == 0 and not consumer.is_alive() and
+          len(frame_times) > seconds * FPS * 0.5 and gaps.max() < MAX_GAP_FRAMES / FPS)
+    print("PASS" if ok else "FAIL")
+    context.release()
+    return ok
+
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    sys.exit(0 if run(seconds) else 1)
@@ -1,43 +1,136 @@
 import cv2
 import numpy as np
 from abc import ABC, abstractmethod
-import os
+
+from sam2_playback import get_playback
 
 # making a template for my trackers so they all follow the same rules
 class TrackerStrategy(ABC):
+    # strategies that make their own frames (like the SAM2 replay) set this to False
+    # and hand out ready-made jpegs from encoded_frame() instead
+    uses_camera = True
+
     @abstractmethod
     def update(self, frame, frame_count):
         # every tracker needs to take a frame and return it processed
         pass
 
+    # lifecycle hooks, strategies get pooled and reused so these replace the constructor
+    def warm_up(self):
+        # do any slow one-time setup here, before the strategy goes live
+        pass
+
+    def reset(self):
+        # forget per-session state when the strategy gets switched back in
+        pass
+
+    def release(self):
+        # free heavy resources when the pool shuts down
+        pass
+
 # strategy 1: ArUco Marker Tracker
 # this one looks for those square QR-like markers
 class ArucoStrategy(TrackerStrategy):
-    def __init__(self):
+    def __init__(self, full_scan_every=15, roi_pad=0.5):
         # setting up the dictionary so it knows which markers to look for (4x4)
         self.dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
         self.params = cv2.aruco.DetectorParameters()
+        # building the detector once instead of on every frame
+        self.detector = cv2.aruco.ArucoDetector(self.dictionary, self.params)
+
+        # tracking mode: after a full scan, only search around where the markers were
+        # full_scan_every = K frames between forced full-frame scans
+        # roi_pad = how much to grow each marker box (fraction of its size) so fast motion stays inside
+        self.full_scan_every = full_scan_every
+        self.roi_pad = roi_pad
+        self.prev_corners = None
+        self.frames_since_scan = 0
+        # grayscale buffer reused every frame (cvtColor writes into it while the size matches)
+        self.gray = None
+
+    def warm_up(self):
+        # the first detect call sets up a bunch of internal buffers, get it out of the way
+        self.detector.detectMarkers(np.zeros((480, 640), np.uint8))
+
+    def reset(self):
+        self.prev_corners = None
+        self.frames_since_scan = 0
+
+    def detect_full(self, gray):
+        corners, ids, _ = self.detector.detectMarkers(gray)
+        if ids is None or len(corners) == 0:
+            return None, None
+        # stack everything into one (N, 4, 2) array so the rest is vectorized
+        return np.concatenate(corners).reshape(-1, 4, 2), ids.reshape(-1)
+
+    def detect_in_rois(self, gray):
+        h, w = gray.shape[:2]
+
+        # padded boxes around every previous marker, all at once
+        mins = self.prev_corners.min(axis=1)
+        maxs = self.prev_corners.max(axis=1)
+        pad = (maxs - mins) * self.roi_pad + 8
+        x0, y0 = np.clip(mins - pad, 0, [w, h]).astype(np.int32).T
+        x1, y1 = np.clip(maxs + pad, 0, [w, h]).astype(np.int32).T
+
+        found_corners, found_ids = [], []
+        for i in range(len(x0)):
+            if x1[i] - x0[i] < 16 or y1[i] - y0[i] < 16:
+                continue
+            corners, ids, _ = self.detector.detectMarkers(gray[y0[i]:y1[i], x0[i]:x1[i]])
+            if ids is None:
+                continue
+            # shift the corners from ROI coordinates back to full frame coordinates
+            found_corners.append(np.concatenate(corners).reshape(-1, 4, 2) + [x0[i], y0[i]])
+            found_ids.append(ids.reshape(-1))
+
+        if not found_ids:
+            return None, None
+
+        corners = np.concatenate(found_corners).astype(np.float32)
+        ids = np.concatenate(found_ids)
+        # overlapping ROIs can see the same marker twice. drop a detection only if an earlier one
+        # has the same id at the same spot, two printed copies of one id are both kept
+        centers = corners.mean(axis=1)
+        keep = []
+        for i in range(len(ids)):
+            if not any(ids[j] == ids[i] and np.abs(centers[j] - centers[i]).max() < 4 for j in keep):
+                keep.append(i)
+        return corners[keep], ids[keep]
 
     def update(self, frame, frame_count):
         if frame is None: return frame
-        
-        # magic function that finds the corners and IDs of markers
-        corners, ids, _ = cv2.aruco.detectMarkers(frame, self.dictionary, parameters=self.params)
-        
-        if ids is not None:
-            # if we found any markers, loop through them
-            for corner_set in corners:
-                # convert corners to int so we can draw them
-                pts = corner_set[0].astype(np.int32)
-                
-                # draw a cool neon green box around the marker
-                cv2.polylines(frame, [pts], True, (57, 255, 20), 3)
-                
-                # find the center point just for fun
-                c_x = int(np.mean(pts[:, 0]))
-                c_y = int(np.mean(pts[:, 1]))
-                cv2.circle(frame, (c_x, c_y), 5, (0, 0, 255), -1)
-                
+
+        # detection works on grayscale anyway, converting once lets every ROI reuse it
+        gray = self.gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+
+        corners = None
+        if self.prev_corners is not None and self.frames_since_scan < self.full_scan_every:
+            corners, ids = self.detect_in_rois(gray)
+            self.frames_since_scan += 1
+            # a marker slipped out of its ROI, look for it everywhere right away
+            if corners is not None and len(corners) < len(self.prev_corners):
+                corners = None
+
+        # fall back to scanning the whole frame every K frames or when markers vanish
+        if corners is None:
+            corners, ids = self.detect_full(gray)
+            self.frames_since_scan = 0
+
+        self.prev_corners = corners
+
+        if corners is not None:
+            # convert corners to int so we can draw them
+            pts = corners.astype(np.int32)
+
+            # draw a cool neon green box around every marker in one call
+            cv2.polylines(frame, list(pts), True, (57, 255, 20), 3)
+
+            # find the center points just for fun
+            centers = corners.mean(axis=1).astype(np.int32)
+            for c_x, c_y in centers:
+                cv2.circle(frame, (int(c_x), int(c_y)), 5, (0, 0, 255), -1)
+
         return frame
 
 # strategy 2: CSRT Tracker
@@ -48,6 +141,22 @@ class CSRTStrategy(TrackerStrategy):
         self.initialized = False
         self.bbox_color = (255, 0, 255)
 
+    def warm_up(self):
+        # running the tracker once on a dummy frame loads everything it needs
+        dummy = np.zeros((240, 320, 3), np.uint8)
+        cv2.rectangle(dummy, (110, 70), (210, 170), (255, 255, 255), -1)
+        tracker = cv2.TrackerCSRT_create()
+        tracker.init(dummy, (100, 60, 120, 120))
+        tracker.update(dummy)
+
+    def reset(self):
+        # start over with the "place object here" guide
+        self.tracker = None
+        self.initialized = False
+
+    def release(self):
+        self.reset()
+
     def init_tracker(self, frame):
         # grabbing the frame size to find the center
         h, w = frame.shape[:2]
@@ -96,77 +205,35 @@ class CSRTStrategy(TrackerStrategy):
 # strategy 3: SAM2 Segmentation
 # plays a pre-recorded video with masks because SAM2 is heavy
 class SAM2Strategy(TrackerStrategy):
+    # the whole clip is pre-rendered, so the camera isn't needed while this mode is on
     def __init__(self):
-        self.masks = []
-        self.video_cap = None
-        
-        # need absolute paths so Flask doesn't get confused
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        self.video_path = os.path.join(base_dir, 'static', 'sam2_demo_video.mp4')
-        self.mask_path = os.path.join(base_dir, 'static', 'segmentation.npz')
-        
-        print(f"DEBUG: SAM2 looking for video at: {self.video_path}")
-        self.load_data()
-
-    def load_data(self):
-        # loading the pre-calculated segmentation masks
-        if os.path.exists(self.mask_path):
-            try:
-                data = np.load(self.mask_path)
-                if 'masks' in data:
-                    self.masks = data['masks']
-                print(f"Loaded {len(self.masks)} SAM2 masks.")
-            except Exception as e:
-                print(f"Error loading NPZ: {e}")
-        else:
-            print(f"ERROR: NPZ file not found at {self.mask_path}")
-        
-        # loading the video file
-        if os.path.exists(self.video_path):
-            self.video_cap = cv2.VideoCapture(self.video_path)
-        else:
-            print(f"ERROR: Video file not found at {self.video_path}")
+        self.playback = None
 
-    def update(self, frame, frame_count):
-        # if the video isn't open, try to open it again
-        if self.video_cap is None or not self.video_cap.isOpened():
-            if os.path.exists(self.video_path):
-                self.video_cap = cv2.VideoCapture(self.video_path)
-            
-            # if it still fails, tell the user something is wrong
-            if self.video_cap is None or not self.video_cap.isOpened():
-                if frame is not None:
-                    cv2.putText(frame, "Video File Error - Check Terminal", (50,50), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,0,255), 2)
-                    return frame
-                return None
-
-        # read the next frame from the video file
-        ret, video_frame = self.video_cap.read()
-
-        # if the video ends, loop back to the start
-        if not ret:
-            self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            ret, video_frame = self.video_cap.read()
-            
-        if not ret:
-            return frame
+    def warm_up(self):
+        # shared by every client and every mode switch, only built once per process
+        self.playback = get_playback()
 
-        # apply the mask corresponding to the current frame
-        if len(self.masks) > 0:
-            idx = int(self.video_cap.get(cv2.CAP_PROP_POS_FRAMES)) % len(self.masks)
+    @property
+    def uses_camera(self):
+        # with nothing to replay, fall back to drawing the error on the camera feed
+        return self.playback is None or not self.playback.frames
 
-            if idx < len(self.masks):
-                # make sure mask size matches video frame size
-                current_mask = self.masks[idx].astype(np.uint8)
-                if current_mask.shape[:2] != video_frame.shape[:2]:
-                    current_mask = cv2.resize(current_mask, (video_frame.shape[1], video_frame.shape[0]))
+    @property
+    def frame_interval(self):
+        return self.playback.frame_interval
 
-                # find contours on the mask and draw them on the video
-                contours, _ = cv2.findContours(current_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                cv2.drawContours(video_frame, contours, -1, (255, 255, 0), 3)
-            
-            cv2.putText(video_frame, "SAM2", (10, 30), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
-            return video_frame
-        return video_frame
\ No newline at end of file
+    def encoded_frame(self):
+        # already a finished jpeg, the feed can send it as-is
+        return self.playback.current_jpeg()
+
+    def update(self, frame, frame_count):
+        if self.playback is None:
+            self.warm_up()
+        if not self.playback.frames:
+            # tell the user something is wrong
+            if frame is not None:
+                cv2.putText(frame, "Video File Error - Check Terminal", (50,50), 
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,0,255), 2)
+                return frame
+            return None
+        return self.playback.current_frame()
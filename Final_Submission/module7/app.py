@@ -1,44 +1,75 @@
 from flask import Flask, render_template, request, jsonify, Response, send_file
 import cv2
-import mediapipe as mp
-import csv
+import numpy as np
 import time
 import math
 import os
+import io
+import base64
+import sys
 import traceback
 
+# the shared hub helpers live one folder up
+PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PARENT_DIR not in sys.path:
+    sys.path.append(PARENT_DIR)
+
+from hub.metrics import StreamMetrics
+from hub.calibration import get_profile, parse_points
+from hub.camera_broker import open_camera
+from hub.scheduler import scheduler
+from hub.frame_pool import frame_pool, mjpeg_part
+from pose_writer import PoseWriter, list_sessions, session_csv_path, stream_file
+from pose_recorder import CSV_HEADER, RecorderSessions
+from inference_policy import InferencePolicy, PoseEstimator, draw_landmarks
+from dense_stereo import compute_disparity, disparity_to_depth, colorize, MAX_TILES
+
 app = Flask(__name__)
+metrics = StreamMetrics('module7')
+# every landmark of every stream, kept in memory for the /sessions query api
+sessions = RecorderSessions()
 
 # setting up paths so we know where to save the csv file
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CSV_FILE_PATH = os.path.join(BASE_DIR, 'pose_data.csv')
 
-# camera calibration values from my experiment
-ORIG_FX = 1102.12  
-ORIG_FY = 1105.95
-ORIG_CX = 618.990
-ORIG_CY = 342.080
-CALIB_W = 1280
-CALIB_H = 720
+# camera calibration values from my experiment (hub/calibration_profiles.json)
+CAMERA = get_profile('stereo')
 BASELINE = 10.0 # distance between the two camera positions
 
-# setting up mediapipe tools for detection and drawing
-mp_holistic = mp.solutions.holistic
-mp_drawing = mp.solutions.drawing_utils
+# how much pose inference to run per frame, see inference_policy.py
+# the default is the original behaviour: full holistic on every full-size frame.
+# /video_feed takes overrides like ?model=pose&complexity=0&downscale=0.5&every=3&motion=2
+INFERENCE_POLICY = InferencePolicy(model='holistic', model_complexity=1, downscale=1.0, every_n=1)
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
 # helper to adjust camera numbers if the image resolution changes
+# the profile caches them per resolution since the browser keeps sending the same image size
 def get_scaled_intrinsics(img_w, img_h):
-    scale_x = img_w / CALIB_W
-    scale_y = img_h / CALIB_H
-    fx = ORIG_FX * scale_x
-    fy = ORIG_FY * scale_y
-    cx = ORIG_CX * scale_x
-    cy = ORIG_CY * scale_y
-    return fx, fy, cx, cy
+    return CAMERA.intrinsics(img_w, img_h)
+
+# --- vectorized versions of the stereo math, for many points at once ---
+
+def stereo_depth(x_left, x_right, fx):
+    # Z = (f * B) / d for every point, NaN where the disparity is under a pixel
+    disparity = np.abs(x_left - x_right)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        Z = np.where(disparity >= 1.0, (fx * BASELINE) / disparity, np.nan)
+    return Z, disparity
+
+def metric_distance(p1, p2, Z, img_w, img_h):
+    # back-project both points at depth Z and measure between them (Z can be one value or one per pair)
+    XY1 = CAMERA.pixels_to_world(p1, Z, img_w, img_h)
+    XY2 = CAMERA.pixels_to_world(p2, Z, img_w, img_h)
+    return np.hypot(*(XY2 - XY1).T)
+
+def json_numbers(values, digits):
+    # NaN isn't valid json, send null instead
+    values = np.round(values, digits)
+    return np.where(np.isnan(values), None, values).tolist()
 
 @app.route('/calculate_stereo', methods=['POST'])
 def calculate_stereo():
@@ -59,6 +90,29 @@ def calculate_stereo():
         calculated_Z = (fx * BASELINE) / disparity
         print(f"Stereo: Disparity={disparity:.2f} px | Z={calculated_Z:.2f} cm")
         return jsonify({"Z": round(calculated_Z, 4), "disparity": round(disparity, 2)})
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Bad request: {e}"}), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/calculate_stereo_batch', methods=['POST'])
+def calculate_stereo_batch():
+    # same as /calculate_stereo but for arrays of point pairs (or whole landmark tracks)
+    try:
+        data = request.get_json()
+        img_w, img_h = int(data['img_w']), int(data['img_h'])
+        normalized = bool(data.get('normalized', False))
+        p_left = parse_points(data['p_left'], img_w, img_h, normalized)
+        p_right = parse_points(data['p_right'], img_w, img_h, normalized)
+        if p_left.shape != p_right.shape:
+            return jsonify({"error": "p_left and p_right need the same number of points"}), 400
+
+        fx, _, _, _ = get_scaled_intrinsics(img_w, img_h)
+        Z, disparity = stereo_depth(p_left[:, 0], p_right[:, 0], fx)
+        return jsonify({"Z": json_numbers(Z, 4), "disparity": json_numbers(disparity, 2)})
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Bad request: {e}"}), 400
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
@@ -68,85 +122,234 @@ def calculate_dist():
     try:
         data = request.get_json()
         p1, p2, Z = data['p1'], data['p2'], data['Z']
-        fx, fy, cx, cy = get_scaled_intrinsics(data['img_w'], data['img_h'])
 
         # convert 2d pixel points to 3d real-world coordinates using depth Z
-        X1 = (p1['x'] - cx) * Z / fx
-        Y1 = (p1['y'] - cy) * Z / fy
-        X2 = (p2['x'] - cx) * Z / fx
-        Y2 = (p2['y'] - cy) * Z / fy
+        # (X = (u - cx) * Z / fx, with lens distortion taken out of the pixels first)
+        (X1, Y1), (X2, Y2) = CAMERA.pixels_to_world([(p1['x'], p1['y']), (p2['x'], p2['y'])], Z,
+                                                    data['img_w'], data['img_h'])
 
         # simple distance formula in 3d space
         dist = math.sqrt((X2 - X1)**2 + (Y2 - Y1)**2)
-        return jsonify({"dist_cm": round(dist, 2)})
+        return jsonify({"dist_cm": round(float(dist), 2)})
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Bad request: {e}"}), 400
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
-def generate_frames():
-    # opening the webcam
-    cap = cv2.VideoCapture(0)
-    
-    # create a fresh csv file with headers
+@app.route('/calculate_dist_batch', methods=['POST'])
+def calculate_dist_batch():
+    # same as /calculate_dist but for arrays of point pairs, Z is one depth or one per pair
     try:
-        with open(CSV_FILE_PATH, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['timestamp', 'nose_x', 'nose_y', 'right_wrist_x', 'right_wrist_y'])
+        data = request.get_json()
+        img_w, img_h = int(data['img_w']), int(data['img_h'])
+        normalized = bool(data.get('normalized', False))
+        p1 = parse_points(data['p1'], img_w, img_h, normalized)
+        p2 = parse_points(data['p2'], img_w, img_h, normalized)
+        Z = np.asarray(data['Z'], np.float64)
+        if p1.shape != p2.shape or Z.size not in (1, len(p1)):
+            return jsonify({"error": "p1, p2 and Z need matching lengths"}), 400
+
+        dist = metric_distance(p1, p2, Z, img_w, img_h)
+        return jsonify({"dist_cm": json_numbers(dist, 2)})
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Bad request: {e}"}), 400
     except Exception as e:
-        print(f"CSV Init Error: {e}")
-
-    # using mediapipe holistic model to track body and hands
-    with mp_holistic.Holistic(min_detection_confidence=0.5, min_tracking_confidence=0.5) as holistic:
-        while True:
-            success, frame = cap.read()
-            if not success: break
-
-            # mediapipe needs rgb images, but opencv gives bgr
-            image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = holistic.process(image_rgb)
-            
-            # draw the stick figure lines on top of the video
-            mp_drawing.draw_landmarks(frame, results.pose_landmarks, mp_holistic.POSE_CONNECTIONS)
-            mp_drawing.draw_landmarks(frame, results.left_hand_landmarks, mp_holistic.HAND_CONNECTIONS)
-            mp_drawing.draw_landmarks(frame, results.right_hand_landmarks, mp_holistic.HAND_CONNECTIONS)
-
-            # try to save the keypoints to the csv
-            try:
-                row = [time.time()]
-                
-                # save nose coordinates if found
-                if results.pose_landmarks:
-                    nose = results.pose_landmarks.landmark[mp_holistic.PoseLandmark.NOSE]
-                    row.extend([nose.x, nose.y])
-                else: row.extend([0, 0])
-
-                # save right wrist coordinates if found
-                if results.right_hand_landmarks:
-                    wrist = results.right_hand_landmarks.landmark[0]
-                    row.extend([wrist.x, wrist.y])
-                else: row.extend([0, 0])
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+def read_upload(name, default_path):
+    # uploaded image if there is one, otherwise the bundled stereo pair
+    f = request.files.get(name)
+    if f is not None and f.filename:
+        return cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(default_path)
+
+@app.route('/dense_depth', methods=['POST'])
+@scheduler.limit('stereo')
+def dense_depth():
+    # full disparity + depth map for a rectified pair (uploads 'left'/'right', or the static images)
+    # form/query knobs: backend=bm|sgbm, downscale, num_disparities, block_size, tiles
+    try:
+        left = read_upload('left', os.path.join(BASE_DIR, 'static', 'left_img.jpg'))
+        right = read_upload('right', os.path.join(BASE_DIR, 'static', 'right_img.jpg'))
+        if left is None or right is None:
+            return jsonify({"error": "Could not read the stereo images"}), 400
+
+        args = request.values
+        downscale = float(args.get('downscale', 0.5))
+        h, w = left.shape[:2]
+        # take the lens distortion out first (cached remap tables, a no-op without distortion)
+        left, right = CAMERA.undistort(left), CAMERA.undistort(right)
+
+        t0 = time.perf_counter()
+        disparity = compute_disparity(left, right, backend=args.get('backend', 'sgbm'), downscale=downscale,
+                                      num_disparities=int(args.get('num_disparities', 128)),
+                                      block_size=int(args.get('block_size', 5)),
+                                      tiles=int(args.get('tiles', min(os.cpu_count() or 1, MAX_TILES))))
+        # focal length scaled to the input size, then to the size the matching ran at
+        fx = get_scaled_intrinsics(w, h)[0] * (disparity.shape[1] / w)
+        depth = disparity_to_depth(disparity, fx, BASELINE)
+        elapsed = time.perf_counter() - t0
+
+        valid = ~np.isnan(depth)
+        return jsonify({
+            "disparity_image": mat_to_base64(colorize(disparity)),
+            "depth_image": mat_to_base64(colorize(depth)),
+            "median_depth_cm": round(float(np.median(depth[valid])), 2) if valid.any() else None,
+            "valid_fraction": round(float(valid.mean()), 4),
+            "seconds": round(elapsed, 4),
+            "megapixels_per_sec": round(w * h / 1e6 / elapsed, 2),
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+def mat_to_base64(mat):
+    # png so the colors survive
+    _, buffer = cv2.imencode('.png', mat)
+    return base64.b64encode(buffer).decode('utf-8')
+
+def generate_frames(overlay=False, policy=None):
+    # overlay = draw live fps/latency onto the frames
+    # policy = InferencePolicy to use, defaults to INFERENCE_POLICY
+    policy = policy or INFERENCE_POLICY
+    timing = metrics.enabled
+    client_id = metrics.client_connected() if timing else None
+
+    # opening the webcam (or attaching to the camera broker, so module6 can stream at the same time)
+    cap = open_camera(0)
+    
+    # every stream records into its own session files from a background thread
+    writer = PoseWriter(CSV_HEADER)
+    writer.start()
+    recorder = sessions.new(writer.session_id)
+    print(f"Recording pose session {writer.session_id} ({policy.describe()})")
+
+    # running the mediapipe model the way the policy says (model size, downscale, skipping frames)
+    frame = None
+    try:
+        with PoseEstimator(policy) as estimator:
+            while True:
+                # the last frame has been sent, its buffer takes the next read
+                frame_pool.release(frame)
+                frame = None
+                if timing: t0 = time.perf_counter()
+                success, frame = cap.read(frame_pool.acquire())
+                if timing: metrics.observe('capture', time.perf_counter() - t0)
+                if not success:
+                    if timing: metrics.inc('dropped_frames_total')
+                    break
+
+                if timing: t0 = time.perf_counter()
+                landmarks, inferred = estimator.process(frame)
+                if timing:
+                    metrics.observe('inference' if inferred else 'tracking', time.perf_counter() - t0)
+                    if not inferred: metrics.inc('inference_skipped_total')
                 
-                # write the row to the file
-                with open(CSV_FILE_PATH, 'a', newline='') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(row)
-            except: pass
+                # draw the stick figure lines on top of the video
+                if timing: t0 = time.perf_counter()
+                draw_landmarks(frame, landmarks)
+                if timing: metrics.observe('draw', time.perf_counter() - t0)
+
+                # record every landmark (NaN when a part wasn't found) and save the row to disk
+                if timing: t0 = time.perf_counter()
+                try:
+                    timestamp = time.time()
+                    recorder.append(timestamp, landmarks)
 
-            # encode the frame to jpg so the browser can display it
-            ret, buffer = cv2.imencode('.jpg', frame)
-            frame_bytes = buffer.tobytes()
-            yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+                    # hand the row to the writer thread, it batches the disk writes and recycles the rows
+                    row = writer.new_row()
+                    row[0] = timestamp
+                    row[1:] = landmarks.ravel()
+                    writer.submit(row)
+                except Exception as e:
+                    print(f"Recording error: {e}")
+                if timing: metrics.observe('record', time.perf_counter() - t0)
 
-    cap.release()
+                if overlay and timing:
+                    metrics.draw_overlay(frame, 'inference')
+
+                # encode the frame to jpg so the browser can display it
+                if timing: t0 = time.perf_counter()
+                ret, buffer = cv2.imencode('.jpg', frame)
+                if timing: metrics.observe('encode', time.perf_counter() - t0)
+                yield mjpeg_part(buffer)
+                if timing: metrics.client_frame(client_id)
+    finally:
+        frame_pool.release(frame)
+        cap.release()
+        writer.close()
+        sessions.finish(recorder.session_id)
+        if timing: metrics.client_disconnected(client_id)
 
 @app.route('/video_feed')
 def video_feed():
     # standard flask way to stream the video frames
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    overlay = request.args.get('overlay') == '1'
+    try:
+        policy = InferencePolicy.from_args(request.args, INFERENCE_POLICY)
+    except ValueError as e:
+        return str(e), 400
+    return Response(generate_frames(overlay, policy), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/sessions')
+def list_recorded_sessions():
+    return jsonify(sessions.list())
+
+@app.route('/sessions/<session_id>/landmarks')
+def query_landmarks(session_id):
+    # ?start=&end= (unix seconds), ?landmarks=nose,right_hand_wrist, ?format=json|npz
+    recorder = sessions.get(session_id)
+    if recorder is None:
+        return jsonify({"error": "Unknown session"}), 404
+
+    try:
+        start = request.args.get('start', type=float)
+        end = request.args.get('end', type=float)
+        names = [n for n in request.args.get('landmarks', '').split(',') if n]
+        timestamps, landmarks, names = recorder.query(start, end, names)
+    except KeyError as e:
+        return jsonify({"error": str(e.args[0])}), 400
+
+    if request.args.get('format') == 'npz':
+        # binary: arrays straight into numpy, no text parsing on the other side
+        buf = io.BytesIO()
+        np.savez(buf, timestamps=timestamps, landmarks=landmarks, names=np.array(names))
+        return Response(buf.getvalue(), mimetype='application/octet-stream',
+                        headers={'Content-Disposition': f'attachment; filename=pose_{session_id}.npz'})
+
+    # json: NaN isn't valid json so missing values become null
+    values = landmarks.astype(object)
+    values[np.isnan(landmarks)] = None
+    return jsonify({
+        "session": session_id,
+        "fields": ['x', 'y', 'z', 'visibility'],
+        "timestamps": timestamps.tolist(),
+        "landmarks": {name: values[:, i].tolist() for i, name in enumerate(names)},
+    })
 
 @app.route('/download_csv')
 def download_csv():
     # lets the user download the data we recorded
+    # ?session=<id> picks a session, otherwise it's the most recent one
+    saved = list_sessions()
+    session_id = request.args.get('session') or (saved[-1] if saved else None)
+
+    if session_id is not None:
+        if session_id not in saved:
+            return "Unknown session.", 404
+        # streamed in chunks straight from disk, the writer thread keeps going meanwhile
+        return Response(stream_file(session_csv_path(session_id)), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename=pose_{session_id}.csv'})
+
+    # nothing recorded yet by the web app, fall back to the old single file
     if os.path.exists(CSV_FILE_PATH):
         return send_file(CSV_FILE_PATH, as_attachment=True)
     else:
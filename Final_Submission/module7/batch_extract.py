@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from inference_policy import InferencePolicy, PoseEstimator
+from pose_recorder import NUM_LANDMARKS
+
+# offline pose extraction for recorded videos, as fast as the cpu allows instead of real time.
+# every video is cut into chunks of frames, the chunks go to a pool of worker processes
+# (each worker loads its own mediapipe model once), and the landmarks are written into
+# <out>/<video name>_landmarks.npy  (frames, 75, 4) float32, NaN = missing
+# <out>/<video name>_timestamps.npy (frames,) seconds from the start of the video, NaN = the
+#                                   frame couldn't be read (its landmarks are NaN too)
+# videos with the same name from different folders get a hash of their path added to the name
+# usage: python batch_extract.py a.mp4 b.mp4 --workers 4 --out extracted
+
+
+# one model per worker process, made by init_worker
+_estimator = None
+
+
+def init_worker(policy_args):
+    global _estimator
+    # every process already gets its own core, so keep opencv from spawning more threads
+    cv2.setNumThreads(1)
+    _estimator = PoseEstimator(InferencePolicy(**policy_args))
+
+
+def process_chunk(path, start, end):
+    cap = cv2.VideoCapture(path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    # tracking state from the previous chunk doesn't apply here
+    _estimator.reset()
+
+    timestamps, tracks = [], []
+    for _ in range(start, end):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
+        landmarks, _ = _estimator.process(frame)
+        tracks.append(landmarks.copy())
+    cap.release()
+
+    if not tracks:
+        return np.zeros(0), np.zeros((0, NUM_LANDMARKS, 4), np.float32)
+    return np.array(timestamps), np.stack(tracks)
+
+
+def count_frames(path):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        return 0
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if count <= 0:
+        # some containers don't say, so count by hand
+        count = 0
+        while cap.grab():
+            count += 1
+    cap.release()
+    return count
+
+
+def output_stems(videos):
+    # file name stem per video, unique even when two folders have a clip of the same name
+    stems = {path: os.path.splitext(os.path.basename(path))[0] for path in videos}
+    taken = {}
+    for path, stem in stems.items():
+        taken.setdefault(stem, []).append(path)
+    for stem, paths in taken.items():
+        if len(paths) > 1:
+            for path in paths:
+                digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]
+                stems[path] = f"{stem}_{digest}"
+    return stems
+
+
+def extract(videos, out_dir, workers, chunk_frames, policy_args):
+    os.makedirs(out_dir, exist_ok=True)
+    # the same file listed twice is extracted once
+    videos = list(dict.fromkeys(os.path.abspath(path) for path in videos))
+    stems = output_stems(videos)
+
+    # plan: output arrays preallocated on disk, chunks write straight into their slice
+    outputs, tasks = {}, []
+    for path in videos:
+        frames = count_frames(path)
+        if frames == 0:
+            print(f"Skipping {path}: could not read it")
+            continue
+        stem = stems[path]
+        landmarks = np.lib.format.open_memmap(os.path.join(out_dir, f"{stem}_landmarks.npy"), mode='w+',
+                                              dtype=np.float32, shape=(frames, NUM_LANDMARKS, 4))
+        landmarks[:] = np.nan
+        timestamps = np.lib.format.open_memmap(os.path.join(out_dir, f"{stem}_timestamps.npy"), mode='w+',
+                                               dtype=np.float64, shape=(frames,))
+        timestamps[:] = np.nan
+        # which frames a chunk actually returned, a chunk can come back short anywhere
+        outputs[path] = {'stem': stem, 'landmarks': landmarks, 'timestamps': timestamps,
+                         'frames': frames, 'valid': np.zeros(frames, bool), 'chunks_left': 0}
+        for start in range(0, frames, chunk_frames):
+            tasks.append((path, start, min(frames, start + chunk_frames)))
+            outputs[path]['chunks_left'] += 1
+
+    total = sum(o['frames'] for o in outputs.values())
+    print(f"{len(outputs)} videos, {total} frames, {len(tasks)} chunks, {workers} workers")
+
+    done = 0
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(policy_args,)) as pool:
+        futures = {pool.submit(process_chunk, *task): task for task in tasks}
+        for future in as_completed(futures):
+            path, start, end = futures[future]
+            timestamps, tracks = future.result()
+            out = outputs[path]
+            # each chunk lands at its own offset, so the files end up in frame order
+            out['landmarks'][start:start + len(tracks)] = tracks
+            out['timestamps'][start:start + len(tracks)] = timestamps
+            out['valid'][start:start + len(tracks)] = True
+            out['chunks_left'] -= 1
+            done += end - start
+
+            elapsed = time.perf_counter() - t0
+            fps = done / elapsed
+            print(f"[{done}/{total}] {out['stem']} {start}-{end}  {fps:.1f} frames/s  "
+                  f"{fps / workers:.1f} frames/s/core")
+
+            if out['chunks_left'] == 0:
+                finish(out, out_dir)
+
+    elapsed = time.perf_counter() - t0
+    print(f"Done: {total} frames in {elapsed:.1f}s, {total / elapsed:.1f} frames/s, "
+          f"{total / elapsed / workers:.1f} frames/s/core")
+
+
+def finish(out, out_dir):
+    out['landmarks'].flush()
+    out['timestamps'].flush()
+    valid = out['valid']
+    # the container promised more frames than it had: trim a missing tail. frames missing in
+    # the middle stay where they are (NaN), so every later frame keeps its index
+    n = int(np.flatnonzero(valid)[-1]) + 1 if valid.any() else 0
+    if n < out['frames']:
+        landmarks, timestamps = np.array(out['landmarks'][:n]), np.array(out['timestamps'][:n])
+        del out['landmarks'], out['timestamps']
+        np.save(os.path.join(out_dir, f"{out['stem']}_landmarks.npy"), landmarks)
+        np.save(os.path.join(out_dir, f"{out['stem']}_timestamps.npy"), timestamps)
+    missing = n - int(valid[:n].sum())
+    print(f"Wrote {out['stem']} ({n} frames" + (f", {missing} unreadable)" if missing else ")"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch pose extraction from video files.")
+    parser.add_argument('videos', nargs='+')
+    parser.add_argument('--out', default='extracted')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk', type=int, default=300, help="frames per chunk")
+    parser.add_argument('--model', default='pose', choices=['pose', 'holistic'])
+    parser.add_argument('--complexity', type=int, default=1)
+    parser.add_argument('--downscale', type=float, default=1.0)
+    parser.add_argument('--every', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    policy_args = {'model': args.model, 'model_complexity': args.complexity,
+                   'downscale': args.downscale, 'every_n': args.every}
+    extract(args.videos, args.out, max(1, args.workers), max(1, args.chunk), policy_args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
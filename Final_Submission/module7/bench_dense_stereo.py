@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+
+import cv2
+
+from dense_stereo import compute_disparity, MAX_TILES
+
+# megapixels/sec of the dense stereo matcher on the bundled stereo pair, for a few settings.
+# usage: python bench_dense_stereo.py [repeats]
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CONFIGS = [
+    # backend, downscale, num_disparities, block_size, tiles
+    ('bm', 1.0, 128, 15, 1),
+    ('bm', 0.5, 64, 15, 1),
+    ('sgbm', 0.5, 64, 5, 1),
+    ('sgbm', 0.5, 64, 5, min(os.cpu_count() or 1, MAX_TILES)),
+    ('sgbm', 0.25, 32, 5, 1),
+    ('sgbm', 1.0, 128, 5, min(os.cpu_count() or 1, MAX_TILES)),
+]
+
+
+def main(repeats=3):
+    left = cv2.imread(os.path.join(BASE_DIR, 'static', 'left_img.jpg'))
+    right = cv2.imread(os.path.join(BASE_DIR, 'static', 'right_img.jpg'))
+    h, w = left.shape[:2]
+    megapixels = w * h / 1e6
+    print(f"input {w}x{h} ({megapixels:.2f} MP), best of {repeats}\n")
+    print(f"{'backend':<8}{'scale':>6}{'disp':>6}{'block':>6}{'tiles':>6}{'ms':>10}{'MP/s':>8}{'valid':>8}")
+
+    for backend, downscale, num_disp, block, tiles in CONFIGS:
+        best = float('inf')
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            disparity = compute_disparity(left, right, backend, downscale, num_disp, block, tiles)
+            best = min(best, time.perf_counter() - t0)
+        valid = (disparity == disparity).mean()
+        print(f"{backend:<8}{downscale:>6}{num_disp:>6}{block:>6}{tiles:>6}{best * 1000:>10.1f}"
+              f"{megapixels / best:>8.2f}{valid:>8.2f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -0,0 +1,100 @@
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# dense version of the stereo part: instead of one clicked disparity, match every pixel
+# of a rectified left/right pair and turn the whole disparity map into depth with Z = f * B / d.
+# knobs for speed vs quality:
+#   backend         -> 'bm' (block matching, fast) or 'sgbm' (semi-global, smoother, slower)
+#   downscale       -> match on a smaller copy (0.5 = 4x fewer pixels), never bigger than the input
+#   num_disparities -> search range in pixels at the working size (a positive multiple of 16)
+#   block_size      -> matching window (odd, bigger = smoother but blurrier)
+#   tiles           -> split the image into horizontal strips and match them on parallel threads
+# out-of-range knobs raise ValueError (the route turns that into a 400)
+
+BACKENDS = ('bm', 'sgbm')
+MAX_DISPARITIES = 512
+MAX_BLOCK_SIZE = 51
+MAX_TILES = 64
+
+
+def make_matcher(backend, num_disparities, block_size):
+    if backend == 'bm':
+        return cv2.StereoBM_create(numDisparities=num_disparities, blockSize=max(5, block_size))
+    # the P1/P2 smoothness penalties recommended in the opencv docs
+    return cv2.StereoSGBM_create(minDisparity=0, numDisparities=num_disparities, blockSize=block_size,
+                                 P1=8 * block_size * block_size, P2=32 * block_size * block_size,
+                                 uniquenessRatio=10, speckleWindowSize=100, speckleRange=2,
+                                 mode=cv2.STEREO_SGBM_MODE_SGBM_3WAY)
+
+
+def match_strip(left, right, backend, num_disparities, block_size):
+    # opencv releases the GIL while matching, so strips really do run in parallel.
+    # a matcher per strip because they keep internal buffers
+    matcher = make_matcher(backend, num_disparities, block_size)
+    return matcher.compute(left, right)
+
+
+def compute_disparity(left, right, backend='sgbm', downscale=1.0, num_disparities=64, block_size=5,
+                      tiles=1):
+    # returns the disparity map in pixels of the *working* (downscaled) image, NaN where unmatched
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    if left.shape[:2] != right.shape[:2]:
+        raise ValueError("Left and right images must be the same size")
+    if not 0 < downscale <= 1:
+        raise ValueError(f"downscale must be in (0, 1], got {downscale}")
+    if num_disparities <= 0 or num_disparities % 16 or num_disparities > MAX_DISPARITIES:
+        raise ValueError(f"num_disparities must be a multiple of 16 up to {MAX_DISPARITIES}, got {num_disparities}")
+    if block_size % 2 == 0 or not 1 <= block_size <= MAX_BLOCK_SIZE:
+        raise ValueError(f"block_size must be odd, 1 to {MAX_BLOCK_SIZE}, got {block_size}")
+    if not 1 <= tiles <= MAX_TILES:
+        raise ValueError(f"tiles must be 1 to {MAX_TILES}, got {tiles}")
+
+    if left.ndim == 3:
+        left = cv2.cvtColor(left, cv2.COLOR_BGR2GRAY)
+    if right.ndim == 3:
+        right = cv2.cvtColor(right, cv2.COLOR_BGR2GRAY)
+    if downscale != 1.0:
+        left = cv2.resize(left, None, fx=downscale, fy=downscale, interpolation=cv2.INTER_AREA)
+        right = cv2.resize(right, None, fx=downscale, fy=downscale, interpolation=cv2.INTER_AREA)
+
+    h = left.shape[0]
+    tiles = max(1, min(int(tiles), h // (4 * block_size + 16)))
+    # strips overlap so each one has full context at its edges; the overlap gets cut off afterwards
+    overlap = block_size + 16
+    bounds = np.linspace(0, h, tiles + 1).astype(int)
+
+    if tiles == 1:
+        raw = match_strip(left, right, backend, num_disparities, block_size)
+    else:
+        jobs = []
+        with ThreadPoolExecutor(max_workers=tiles) as pool:
+            for y0, y1 in zip(bounds[:-1], bounds[1:]):
+                a, b = max(0, y0 - overlap), min(h, y1 + overlap)
+                jobs.append((y0 - a, y1 - y0, pool.submit(match_strip, left[a:b], right[a:b], backend,
+                                                          num_disparities, block_size)))
+            raw = np.concatenate([job.result()[top:top + rows] for top, rows, job in jobs])
+
+    # opencv gives fixed point disparities (x16), anything <= 0 means no match
+    disparity = raw.astype(np.float32) / 16.0
+    disparity[disparity <= 0] = np.nan
+    return disparity
+
+
+def disparity_to_depth(disparity, fx, baseline):
+    # fx must be for the resolution the disparity was computed at
+    return (fx * baseline) / disparity
+
+
+def colorize(values, lo=None, hi=None):
+    # turbo colormap for display, NaN shown as black
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return np.zeros(values.shape + (3,), np.uint8)
+    lo = np.nanpercentile(values, 2) if lo is None else lo
+    hi = np.nanpercentile(values, 98) if hi is None else hi
+    scaled = np.clip((values - lo) / max(hi - lo, 1e-6), 0, 1)
+    img = cv2.applyColorMap((np.nan_to_num(scaled) * 255).astype(np.uint8), cv2.COLORMAP_TURBO)
+    img[~valid] = 0
+    return img
@@ -0,0 +1,182 @@
+import cv2
+import numpy as np
+import mediapipe as mp
+
+from pose_recorder import NUM_LANDMARKS, POSE_SLICE, LEFT_HAND_SLICE, RIGHT_HAND_SLICE, fill_landmarks
+
+# running full holistic on every full-size frame is the slowest thing in the whole hub.
+# an InferencePolicy says how much of that work to actually do:
+#   model            -> 'holistic' (pose + hands + face) or 'pose' (body only, much cheaper)
+#   model_complexity -> mediapipe's 0 / 1 / 2 model size
+#   downscale        -> shrink the frame before inference (0.5 = half width and height)
+#   every_n          -> only run the model every N frames...
+#   between          -> ...and fill the gaps with 'flow' (optical flow tracking) or 'hold' (reuse last)
+#   motion_threshold -> skip the model when the frame barely changed (mean abs diff, 0-255 scale)
+
+mp_holistic = mp.solutions.holistic
+mp_pose = mp.solutions.pose
+
+
+class InferencePolicy:
+    def __init__(self, model='holistic', model_complexity=1, downscale=1.0, every_n=1,
+                 between='flow', motion_threshold=0.0):
+        if model not in ('holistic', 'pose'):
+            raise ValueError(f"Unknown model: {model}")
+        if between not in ('flow', 'hold'):
+            raise ValueError(f"Unknown gap filling: {between}")
+        self.model = model
+        self.model_complexity = int(model_complexity)
+        self.downscale = float(downscale)
+        self.every_n = max(1, int(every_n))
+        self.between = between
+        self.motion_threshold = float(motion_threshold)
+        # mediapipe aborts the whole process on anything else instead of raising
+        if self.model_complexity not in (0, 1, 2):
+            raise ValueError(f"Model complexity must be 0, 1 or 2, not {model_complexity}")
+        if not 0 < self.downscale <= 1:
+            raise ValueError(f"Downscale must be in (0, 1], not {downscale}")
+
+    @classmethod
+    def from_args(cls, args, base=None):
+        # query string overrides, e.g. ?model=pose&complexity=0&downscale=0.5&every=3&motion=2
+        base = base or cls()
+        return cls(
+            model=args.get('model', base.model),
+            model_complexity=args.get('complexity', base.model_complexity),
+            downscale=args.get('downscale', base.downscale),
+            every_n=args.get('every', base.every_n),
+            between=args.get('between', base.between),
+            motion_threshold=args.get('motion', base.motion_threshold),
+        )
+
+    def describe(self):
+        return (f"{self.model} c{self.model_complexity} x{self.downscale:g} every {self.every_n} "
+                f"({self.between}) motion>{self.motion_threshold:g}")
+
+
+class PoseEstimator:
+    def __init__(self, policy):
+        self.policy = policy
+        if policy.model == 'holistic':
+            self.model = mp_holistic.Holistic(model_complexity=policy.model_complexity,
+                                              min_detection_confidence=0.5, min_tracking_confidence=0.5)
+        else:
+            self.model = mp_pose.Pose(model_complexity=policy.model_complexity,
+                                      min_detection_confidence=0.5, min_tracking_confidence=0.5)
+
+        self.landmarks = np.full((NUM_LANDMARKS, 4), np.nan, np.float32)
+        self.has_landmarks = False
+        self.frames_since_inference = 0
+        self.prev_gray = None
+        self.prev_thumb = None
+        # per-frame buffers that opencv writes into with dst= instead of allocating new ones.
+        # the gray/thumb images are kept for one frame (optical flow, motion check), so those
+        # swap between two buffers: last frame's and a spare
+        self.small = None
+        self.rgb = None
+        self.spare_gray = None
+        self.spare_thumb = None
+        self.inferred = 0
+        self.skipped = 0
+
+    def reset(self):
+        # forget the previous frames, e.g. when jumping to a different part of a video
+        self.landmarks.fill(np.nan)
+        self.has_landmarks = False
+        self.frames_since_inference = 0
+        self.prev_gray = None
+        self.prev_thumb = None
+
+    def close(self):
+        self.model.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run_model(self, small_bgr):
+        # mediapipe needs rgb images, but opencv gives bgr
+        self.rgb = cv2.cvtColor(small_bgr, cv2.COLOR_BGR2RGB, dst=self.rgb)
+        results = self.model.process(self.rgb)
+        fill_landmarks(self.landmarks, results)
+        self.has_landmarks = not np.isnan(self.landmarks[:, 0]).all()
+
+    def track(self, gray):
+        # move the last landmarks along with the image using lucas-kanade optical flow
+        h, w = gray.shape[:2]
+        visible = ~np.isnan(self.landmarks[:, 0])
+        if not visible.any():
+            return
+        pts = (self.landmarks[visible, :2] * [w, h]).astype(np.float32).reshape(-1, 1, 2)
+        new_pts, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, pts, None,
+                                                      winSize=(21, 21), maxLevel=2)
+        ok = status.reshape(-1) == 1
+        moved = self.landmarks[visible]
+        moved[ok, :2] = new_pts.reshape(-1, 2)[ok] / [w, h]
+        self.landmarks[visible] = moved
+
+    def process(self, frame):
+        # returns (landmarks (75, 4) with NaN for missing, whether the model actually ran)
+        policy = self.policy
+        if policy.downscale != 1.0:
+            small = self.small = cv2.resize(frame, None, dst=self.small, fx=policy.downscale,
+                                            fy=policy.downscale, interpolation=cv2.INTER_AREA)
+        else:
+            small = frame
+
+        need_gray = policy.every_n > 1 or policy.motion_threshold > 0
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self.spare_gray) if need_gray else None
+
+        # frame differencing on a tiny thumbnail: no motion means the old landmarks are still right
+        still = False
+        if policy.motion_threshold > 0:
+            thumb = cv2.resize(gray, (64, 48), dst=self.spare_thumb, interpolation=cv2.INTER_AREA)
+            if self.prev_thumb is not None:
+                still = cv2.absdiff(thumb, self.prev_thumb).mean() < policy.motion_threshold
+            self.spare_thumb, self.prev_thumb = self.prev_thumb, thumb
+
+        due = self.frames_since_inference + 1 >= policy.every_n
+        ran = False
+        if not self.has_landmarks or (due and not still):
+            self.run_model(small)
+            self.frames_since_inference = 0
+            self.inferred += 1
+            ran = True
+        else:
+            if not still and policy.between == 'flow' and self.prev_gray is not None:
+                self.track(gray)
+            self.frames_since_inference += 1
+            self.skipped += 1
+
+        # this frame's gray is next frame's previous, the old previous becomes the spare
+        self.spare_gray, self.prev_gray = self.prev_gray, gray
+        return self.landmarks, ran
+
+
+# --- drawing straight from the landmark array ---
+
+def _connections(pairs, offset):
+    return np.array(sorted(pairs), dtype=np.int32) + offset
+
+POSE_CONNECTIONS = _connections(mp_holistic.POSE_CONNECTIONS, POSE_SLICE.start)
+HAND_CONNECTIONS = np.concatenate([_connections(mp_holistic.HAND_CONNECTIONS, LEFT_HAND_SLICE.start),
+                                   _connections(mp_holistic.HAND_CONNECTIONS, RIGHT_HAND_SLICE.start)])
+ALL_CONNECTIONS = np.concatenate([POSE_CONNECTIONS, HAND_CONNECTIONS])
+
+
+def draw_landmarks(frame, landmarks):
+    # same look as mediapipe's drawing utils: white bones, red joints
+    h, w = frame.shape[:2]
+    pts = landmarks[:, :2] * [w, h]
+    visible = ~np.isnan(pts[:, 0])
+    if not visible.any():
+        return frame
+
+    lines = ALL_CONNECTIONS[visible[ALL_CONNECTIONS].all(axis=1)]
+    if len(lines):
+        cv2.polylines(frame, list(pts[lines].astype(np.int32)), False, (224, 224, 224), 2)
+    for x, y in pts[visible].astype(np.int32):
+        cv2.circle(frame, (int(x), int(y)), 3, (0, 0, 255), -1)
+    return frame
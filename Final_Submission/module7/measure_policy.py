@@ -0,0 +1,89 @@
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from inference_policy import InferencePolicy, PoseEstimator
+from pose_recorder import POSE_SLICE
+
+# measures the speed vs accuracy trade-off of different inference policies on a recorded clip.
+# the reference is the original setup (full holistic on every full-size frame); every other
+# policy is scored by how far its pose landmarks land from the reference, in pixels.
+# usage: python measure_policy.py clip.mp4 [max_frames]
+
+POLICIES = [
+    InferencePolicy(model='holistic', model_complexity=1),
+    InferencePolicy(model='pose', model_complexity=1),
+    InferencePolicy(model='pose', model_complexity=0),
+    InferencePolicy(model='pose', model_complexity=0, downscale=0.5),
+    InferencePolicy(model='pose', model_complexity=1, every_n=2, between='flow'),
+    InferencePolicy(model='pose', model_complexity=1, every_n=3, between='flow'),
+    InferencePolicy(model='pose', model_complexity=1, every_n=3, between='hold'),
+    InferencePolicy(model='pose', model_complexity=0, downscale=0.5, every_n=3, motion_threshold=1.5),
+]
+
+
+def load_clip(path, max_frames):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def run_policy(policy, frames):
+    tracks = []
+    with PoseEstimator(policy) as estimator:
+        t0 = time.perf_counter()
+        for frame in frames:
+            landmarks, _ = estimator.process(frame)
+            tracks.append(landmarks.copy())
+        elapsed = time.perf_counter() - t0
+        inferred = estimator.inferred
+    return np.stack(tracks), len(frames) / elapsed, inferred
+
+
+def landmark_error(tracks, reference, width, height):
+    # mean pixel distance over pose landmarks both runs found
+    a = tracks[:, POSE_SLICE, :2] * [width, height]
+    b = reference[:, POSE_SLICE, :2] * [width, height]
+    dist = np.linalg.norm(a - b, axis=-1)
+    found = ~np.isnan(dist)
+    # how many of the reference detections this policy also has
+    recall = found.sum() / max(1, (~np.isnan(b[..., 0])).sum())
+    return (dist[found].mean() if found.any() else float('nan')), recall
+
+
+def main(path, max_frames=300):
+    frames = load_clip(path, max_frames)
+    if not frames:
+        print(f"Could not read any frames from {path}")
+        return
+    height, width = frames[0].shape[:2]
+    print(f"{len(frames)} frames of {width}x{height} from {path}\n")
+
+    reference = None
+    print(f"{'policy':<48}{'fps':>8}{'inferred':>10}{'err px':>9}{'recall':>8}")
+    for policy in POLICIES:
+        try:
+            tracks, fps, inferred = run_policy(policy, frames)
+        except Exception as e:
+            # e.g. complexity 0/2 models get downloaded on first use
+            print(f"{policy.describe():<48}  failed: {e}")
+            continue
+        if reference is None:
+            reference = tracks
+        err, recall = landmark_error(tracks, reference, width, height)
+        print(f"{policy.describe():<48}{fps:>8.1f}{inferred:>10}{err:>9.2f}{recall:>8.2f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("usage: python measure_policy.py clip.mp4 [max_frames]")
+        sys.exit(1)
+    main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 300)
@@ -0,0 +1,171 @@
+import os
+import threading
+
+import numpy as np
+
+from pose_writer import RECORDINGS_DIR, list_sessions, load_npy_session
+
+# keeps every landmark mediapipe gives us (33 pose + 21 per hand) for every frame,
+# as (x, y, z, visibility) in preallocated float32 arrays. a missing body/hand is NaN,
+# not 0, so it can't be mistaken for a real point at the image corner.
+
+POSE_NAMES = [
+    'nose', 'left_eye_inner', 'left_eye', 'left_eye_outer', 'right_eye_inner', 'right_eye',
+    'right_eye_outer', 'left_ear', 'right_ear', 'mouth_left', 'mouth_right', 'left_shoulder',
+    'right_shoulder', 'left_elbow', 'right_elbow', 'left_wrist', 'right_wrist', 'left_pinky',
+    'right_pinky', 'left_index', 'right_index', 'left_thumb', 'right_thumb', 'left_hip',
+    'right_hip', 'left_knee', 'right_knee', 'left_ankle', 'right_ankle', 'left_heel',
+    'right_heel', 'left_foot_index', 'right_foot_index',
+]
+HAND_NAMES = [
+    'wrist', 'thumb_cmc', 'thumb_mcp', 'thumb_ip', 'thumb_tip', 'index_finger_mcp',
+    'index_finger_pip', 'index_finger_dip', 'index_finger_tip', 'middle_finger_mcp',
+    'middle_finger_pip', 'middle_finger_dip', 'middle_finger_tip', 'ring_finger_mcp',
+    'ring_finger_pip', 'ring_finger_dip', 'ring_finger_tip', 'pinky_mcp', 'pinky_pip',
+    'pinky_dip', 'pinky_tip',
+]
+# pose first, then left hand, then right hand
+LANDMARK_NAMES = (POSE_NAMES + ['left_hand_' + n for n in HAND_NAMES] +
+                  ['right_hand_' + n for n in HAND_NAMES])
+LANDMARK_INDEX = {name: i for i, name in enumerate(LANDMARK_NAMES)}
+NUM_LANDMARKS = len(LANDMARK_NAMES)
+FIELDS = ['x', 'y', 'z', 'visibility']
+
+# csv / npy column layout used by the writer: timestamp, then x,y,z,visibility per landmark
+CSV_HEADER = ['timestamp'] + [f"{name}_{field}" for name in LANDMARK_NAMES for field in FIELDS]
+
+POSE_SLICE = slice(0, 33)
+LEFT_HAND_SLICE = slice(33, 54)
+RIGHT_HAND_SLICE = slice(54, 75)
+
+
+def fill_landmarks(out, results):
+    # copies a mediapipe result into a (75, 4) array, NaN wherever a part wasn't found
+    out.fill(np.nan)
+    for part, sl in (('pose_landmarks', POSE_SLICE), ('left_hand_landmarks', LEFT_HAND_SLICE),
+                     ('right_hand_landmarks', RIGHT_HAND_SLICE)):
+        found = getattr(results, part, None)
+        if found:
+            out[sl] = [(l.x, l.y, l.z, l.visibility) for l in found.landmark]
+    return out
+
+
+def resolve_landmarks(names):
+    # "nose,right_hand_wrist" -> column indices (None = all of them)
+    if not names:
+        return None
+    unknown = [n for n in names if n not in LANDMARK_INDEX]
+    if unknown:
+        raise KeyError(f"Unknown landmarks: {', '.join(unknown)}")
+    return [LANDMARK_INDEX[n] for n in names]
+
+
+class PoseRecorder:
+    def __init__(self, session_id, chunk_frames=1024):
+        self.session_id = session_id
+        self.chunk_frames = chunk_frames
+        self.timestamps = np.empty(chunk_frames, np.float64)
+        self.landmarks = np.full((chunk_frames, NUM_LANDMARKS, 4), np.nan, np.float32)
+        self.count = 0
+        self.live = True
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_arrays(cls, session_id, timestamps, landmarks):
+        recorder = cls(session_id, chunk_frames=max(1, len(timestamps)))
+        recorder.timestamps[:len(timestamps)] = timestamps
+        recorder.landmarks[:len(timestamps)] = landmarks
+        recorder.count = len(timestamps)
+        recorder.live = False
+        return recorder
+
+    def grow(self):
+        # add another chunk of frames, so copying only happens once every chunk_frames frames
+        capacity = len(self.timestamps) + self.chunk_frames
+        timestamps = np.empty(capacity, np.float64)
+        landmarks = np.full((capacity, NUM_LANDMARKS, 4), np.nan, np.float32)
+        timestamps[:self.count] = self.timestamps[:self.count]
+        landmarks[:self.count] = self.landmarks[:self.count]
+        self.timestamps, self.landmarks = timestamps, landmarks
+
+    def append(self, timestamp, landmarks):
+        # records one frame from a (75, 4) landmark array
+        with self.lock:
+            if self.count == len(self.timestamps):
+                self.grow()
+            self.timestamps[self.count] = timestamp
+            self.landmarks[self.count] = landmarks
+            self.count += 1
+
+    def query(self, start=None, end=None, names=None):
+        # frames with start <= timestamp <= end, optionally only some landmarks (copies)
+        with self.lock:
+            timestamps = self.timestamps[:self.count]
+            lo = 0 if start is None else np.searchsorted(timestamps, start, side='left')
+            hi = self.count if end is None else np.searchsorted(timestamps, end, side='right')
+            idx = resolve_landmarks(names)
+            selected = self.landmarks[lo:hi] if idx is None else self.landmarks[lo:hi, idx]
+            return timestamps[lo:hi].copy(), selected.copy(), (names or LANDMARK_NAMES)
+
+    def summary(self):
+        with self.lock:
+            return {
+                'session': self.session_id,
+                'frames': int(self.count),
+                'start': float(self.timestamps[0]) if self.count else None,
+                'end': float(self.timestamps[self.count - 1]) if self.count else None,
+                'live': self.live,
+            }
+
+
+class RecorderSessions:
+    # in-memory recorders for this process, older sessions get read back from the writer's npy chunks
+    def __init__(self, out_dir=RECORDINGS_DIR, keep=8):
+        self.out_dir = out_dir
+        self.keep = keep
+        self.recorders = {}
+        self.lock = threading.Lock()
+
+    def new(self, session_id):
+        recorder = PoseRecorder(session_id)
+        with self.lock:
+            self.recorders[session_id] = recorder
+            # forget the oldest finished sessions, they're still on disk
+            finished = [s for s, r in self.recorders.items() if not r.live]
+            for s in finished[:max(0, len(self.recorders) - self.keep)]:
+                del self.recorders[s]
+        return recorder
+
+    def finish(self, session_id):
+        with self.lock:
+            recorder = self.recorders.get(session_id)
+        if recorder is not None:
+            recorder.live = False
+
+    def get(self, session_id):
+        with self.lock:
+            recorder = self.recorders.get(session_id)
+        if recorder is not None:
+            return recorder
+
+        # not in memory: load what the writer saved (only the full-landmark layout)
+        if session_id not in list_sessions(self.out_dir):
+            return None
+        if not os.path.isdir(os.path.join(self.out_dir, session_id)):
+            return None
+        rows = load_npy_session(session_id, self.out_dir)
+        if rows.ndim != 2 or rows.shape[1] != len(CSV_HEADER):
+            return None
+        recorder = PoseRecorder.from_arrays(session_id, rows[:, 0],
+                                            rows[:, 1:].reshape(-1, NUM_LANDMARKS, 4))
+        with self.lock:
+            self.recorders.setdefault(session_id, recorder)
+        return recorder
+
+    def list(self):
+        with self.lock:
+            summaries = {s: r.summary() for s, r in self.recorders.items()}
+        for session_id in list_sessions(self.out_dir):
+            summaries.setdefault(session_id, {'session': session_id, 'frames': None,
+                                              'start': None, 'end': None, 'live': False})
+        return list(summaries.values())
@@ -0,0 +1,158 @@
+import csv
+import os
+import queue
+import threading
+import time
+import itertools
+from collections import deque
+
+import numpy as np
+
+# writes pose rows from a background thread so the capture loop never touches the disk.
+# the loop just drops rows into a queue; this thread flushes them in batches
+# (every `flush_rows` rows or `flush_interval` seconds, whichever comes first).
+# every stream gets its own session, so viewers don't clobber each other's files:
+#   recordings/<session>.csv           -> plain csv, one row per frame
+#   recordings/<session>/chunk_00000.npy -> the same rows as float64 arrays, one file per batch
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RECORDINGS_DIR = os.path.join(BASE_DIR, 'recordings')
+
+_session_counter = itertools.count(1)
+# put on the queue to tell the writer thread to finish up
+_STOP = object()
+
+
+def new_session_id():
+    # timestamp + counter so two streams started in the same second still differ
+    return time.strftime('%Y%m%d-%H%M%S') + f"-{os.getpid()}-{next(_session_counter)}"
+
+
+def list_sessions(out_dir=RECORDINGS_DIR):
+    if not os.path.isdir(out_dir):
+        return []
+    sessions = [f[:-4] for f in os.listdir(out_dir) if f.endswith('.csv')]
+    return sorted(sessions, key=lambda s: os.path.getmtime(os.path.join(out_dir, s + '.csv')))
+
+
+def session_csv_path(session_id, out_dir=RECORDINGS_DIR):
+    return os.path.join(out_dir, session_id + '.csv')
+
+
+def stream_file(path, chunk_size=64 * 1024):
+    # reads whatever has been flushed so far, in chunks, without holding anything up
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def load_npy_session(session_id, out_dir=RECORDINGS_DIR):
+    # glue the chunks back together into one (frames, columns) array
+    session_dir = os.path.join(out_dir, session_id)
+    chunks = sorted(f for f in os.listdir(session_dir) if f.endswith('.npy'))
+    if not chunks:
+        return np.zeros((0, 0))
+    return np.concatenate([np.load(os.path.join(session_dir, f)) for f in chunks])
+
+
+class PoseWriter(threading.Thread):
+    def __init__(self, header, session_id=None, out_dir=RECORDINGS_DIR, formats=('csv', 'npy'),
+                 flush_rows=64, flush_interval=1.0, max_queue=4096):
+        super().__init__(daemon=True)
+        self.header = header
+        self.session_id = session_id or new_session_id()
+        self.out_dir = out_dir
+        self.formats = formats
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.chunk_index = 0
+        self.csv_file = None
+        self.csv_writer = None
+        # rows come back here once they're on disk, so the capture loop stops allocating new ones
+        self.spare_rows = deque(maxlen=flush_rows * 2)
+
+    def new_row(self):
+        # a recycled row if there is one (deque pop/extend are thread-safe)
+        try:
+            return self.spare_rows.pop()
+        except IndexError:
+            return np.empty(len(self.header))
+
+    def submit(self, row):
+        # never blocks the capture loop, if the disk can't keep up we drop and count
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        # if run() gave up (files couldn't be opened) nobody drains the queue, so never block
+        # on a full one waiting for a thread that's gone
+        while self.is_alive():
+            try:
+                self.queue.put(_STOP, timeout=0.5)
+            except queue.Full:
+                continue
+            self.join()
+
+    def open_files(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        if 'csv' in self.formats:
+            # the csv stays open for the whole session instead of reopening every frame
+            self.csv_file = open(session_csv_path(self.session_id, self.out_dir), 'w', newline='')
+            self.csv_writer = csv.writer(self.csv_file)
+            self.csv_writer.writerow(self.header)
+            self.csv_file.flush()
+        if 'npy' in self.formats:
+            os.makedirs(os.path.join(self.out_dir, self.session_id), exist_ok=True)
+
+    def flush(self, batch):
+        if not batch:
+            return
+        if self.csv_writer is not None:
+            self.csv_writer.writerows(batch)
+            self.csv_file.flush()
+        if 'npy' in self.formats:
+            path = os.path.join(self.out_dir, self.session_id, f"chunk_{self.chunk_index:05d}.npy")
+            np.save(path, np.asarray(batch, dtype=np.float64))
+            self.chunk_index += 1
+
+    def run(self):
+        try:
+            self.open_files()
+        except Exception as e:
+            print(f"Pose writer could not open files: {e}")
+            return
+
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        try:
+            while True:
+                try:
+                    row = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    row = None
+
+                if row is _STOP:
+                    break
+                if row is not None:
+                    batch.append(row)
+
+                if len(batch) >= self.flush_rows or time.monotonic() >= deadline:
+                    self.flush(batch)
+                    self.spare_rows.extend(batch)
+                    batch = []
+                    deadline = time.monotonic() + self.flush_interval
+        except Exception as e:
+            print(f"Pose writer error: {e}")
+        finally:
+            self.flush(batch)
+            if self.csv_file is not None:
+                self.csv_file.close()
+            if self.dropped:
+                print(f"Pose writer dropped {self.dropped} rows (queue full)")
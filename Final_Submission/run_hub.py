@@ -14,25 +14,42 @@ sys.path.append(os.path.join(current_dir, "module6"))
 sys.path.append(os.path.join(current_dir, "module7"))
 
 # 2. IMPORT MODULES
+# only the hub itself is imported now, every module app gets imported on the first request to it
 from hub.app import app as hub_app
-from module1.app import app as app1
-from module2.app import app as app2
-from module3.app import app as app3
-from module4.app import app as app4
-from module6.app import app as app6
-from module7.app import app as app7
+from hub.lazy_app import LazyApp, prewarm
+from hub.profiler import profiled
+
+MOUNTS = {
+    '/module1': 'module1.app:app',
+    '/module2': 'module2.app:app',
+    '/module3': 'module3.app:app',
+    '/module4': 'module4.app:app',
+    '/module6': 'module6.app:app',
+    '/module7': 'module7.app:app',
+}
+lazy_apps = {prefix: LazyApp(import_name) for prefix, import_name in MOUNTS.items()}
 
 # 3. Map URLs to Apps
-application = DispatcherMiddleware(hub_app, {
-    '/module1': app1,
-    '/module2': app2,
-    '/module3': app3,
-    '/module4': app4,
-    '/module6': app6,
-    '/module7': app7
-})
+# (?_profile=1 or an X-Profile header profiles one request, see hub/profiler.py)
+application = profiled(DispatcherMiddleware(hub_app, lazy_apps))
+
+
+def prewarm_list(value):
+    # CV_PREWARM=module6,module7 (or "all") loads those apps in the background right away
+    names = [n.strip().strip('/') for n in value.split(',') if n.strip()]
+    if 'all' in names:
+        return list(lazy_apps.values())
+    unknown = [n for n in names if '/' + n not in lazy_apps]
+    if unknown:
+        print(f"CV_PREWARM: unknown modules {', '.join(unknown)}")
+    return [lazy_apps['/' + n] for n in names if '/' + n in lazy_apps]
+
+
+# the reloader's parent process only watches files, so don't warm anything up in there
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN'):
+    prewarm(prewarm_list(os.environ.get('CV_PREWARM', '')))
 
 if __name__ == '__main__':
     print(" Main Menu:   http://0.0.0.0:5050/")
     run_simple('0.0.0.0', 5050, application, use_reloader=True, use_debugger=True, threaded=True)
-    #run_simple('localhost', 5050, application, use_reloader=True, use_debugger=True, threaded=True)
\ No newline at end of file
+    #run_simple('localhost', 5050, application, use_reloader=True, use_debugger=True, threaded=True)
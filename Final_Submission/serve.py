@@ -0,0 +1,258 @@
+import argparse
+import importlib.util
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+# production launcher for the hub (run_hub.py stays the dev server with the reloader/debugger).
+# the mounts are split into route groups, each served by its own pool of worker processes:
+#   compute -> the hub page and modules 1-4, cpu-bound opencv work, one process per core so
+#              requests don't queue behind each other on the GIL.
+#   stream  -> modules 6 and 7, pinned to a single worker: there is one webcam and the
+#              streams share their camera/tracker state, so they must all live in one process.
+#              it runs the asyncio front end in stream_server.py, so every viewer is a coroutine
+#              on a shared feed instead of a thread. that server owns the public port and pipes
+#              everything outside its mounts to the compute pool at the socket level.
+# --threaded-streams goes back to a werkzeug stream worker; then the compute pool owns the
+# public port and proxies modules 6 and 7 to it (hub/proxy.py).
+# runs under gunicorn when it's installed, otherwise preforks werkzeug servers on a shared socket.
+# usage: python serve.py [--port 5050] [--workers 4 | --workers compute=4] [--server gunicorn|werkzeug]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+GROUPS = {
+    'compute': {'mounts': ['/module1', '/module2', '/module3', '/module4'],
+                'workers': os.cpu_count() or 1, 'threads': 4, 'prewarm': True},
+    'stream': {'mounts': ['/module6', '/module7'],
+               'workers': 1, 'threads': 64, 'prewarm': False, 'pinned': True, 'async': True},
+}
+# serves the landing page
+PUBLIC_GROUP = 'compute'
+
+
+def front_group():
+    # the group on the public port: the async stream server when it's on, otherwise the
+    # compute pool, proxying the other groups
+    for name, cfg in GROUPS.items():
+        if cfg.get('async'):
+            return name
+    return PUBLIC_GROUP
+
+
+def group_ports():
+    # "stream=5051" -> {'stream': 5051}, set by the launcher for the workers
+    ports = {}
+    for item in os.environ.get('CV_SERVE_PORTS', '').split(','):
+        if '=' in item:
+            name, port = item.split('=')
+            ports[name] = int(port)
+    return ports
+
+
+def build_app(name):
+    # the WSGI app for one group, built inside each worker process
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    import run_hub
+    from werkzeug.exceptions import NotFound
+    from werkzeug.middleware.dispatcher import DispatcherMiddleware
+    from hub.lazy_app import prewarm
+    from hub.profiler import profiled
+    from hub.proxy import ProxyApp
+
+    group = GROUPS[name]
+    mounts = {prefix: run_hub.lazy_apps[prefix] for prefix in group['mounts']}
+    if name == PUBLIC_GROUP:
+        # set by the launcher, the workers don't see --threaded-streams
+        front = os.environ.get('CV_SERVE_FRONT', PUBLIC_GROUP)
+        ports = group_ports()
+        for other, cfg in GROUPS.items():
+            # nothing for the front group's mounts reaches us, it serves them itself
+            if other != name and other != front:
+                for prefix in cfg['mounts']:
+                    mounts[prefix] = ProxyApp('127.0.0.1', ports[other])
+        root = run_hub.hub_app
+    else:
+        root = NotFound()
+
+    if group.get('prewarm'):
+        # loaded in the background so the worker starts taking requests straight away
+        prewarm([run_hub.lazy_apps[prefix] for prefix in group['mounts']])
+    # proxied requests get profiled by the worker that runs them
+    proxied = [prefix for prefix, app in mounts.items() if isinstance(app, ProxyApp)]
+    return profiled(DispatcherMiddleware(root, mounts), exclude=proxied)
+
+
+def make_plan(host, port, workers, front=PUBLIC_GROUP):
+    # (group, host, port, workers, threads) for every group, the front one on `port`
+    plan, next_port = [], port + 1
+    for name, cfg in GROUPS.items():
+        count = workers.get(name, cfg['workers'])
+        if cfg.get('pinned') and count != 1:
+            print(f"{name} group is pinned to one worker, ignoring workers={count}")
+            count = 1
+        if name == front:
+            plan.append((name, host, port, max(1, count), cfg['threads']))
+        else:
+            plan.append((name, '127.0.0.1', next_port, max(1, count), cfg['threads']))
+            next_port += 1
+    return plan
+
+
+def upstream_for(name, plan):
+    # the front stream server hands everything it doesn't serve to the compute pool
+    if name != front_group() or name == PUBLIC_GROUP:
+        return None
+    return next(('127.0.0.1', port) for group, _, port, _, _ in plan if group == PUBLIC_GROUP)
+
+
+def serve_gunicorn(plan, env):
+    procs = []
+    for name, host, port, workers, threads in plan:
+        if GROUPS[name].get('async'):
+            cmd = [sys.executable, os.path.join(HERE, 'stream_server.py'), '--host', host, '--port', str(port),
+                   '--mounts', ','.join(GROUPS[name]['mounts'])]
+            upstream = upstream_for(name, plan)
+            if upstream:
+                cmd += ['--upstream', '%s:%d' % upstream]
+        else:
+            cmd = [sys.executable, '-m', 'gunicorn', '--chdir', HERE, '--bind', f"{host}:{port}",
+                   '--workers', str(workers), '--threads', str(threads), '--worker-class', 'gthread',
+                   f"serve:build_app('{name}')"]
+        procs.append(subprocess.Popen(cmd, env=env))
+    # a plain `kill` (loadtest.py, systemd) must take the children down too, or they keep
+    # holding the ports for the next run
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        for proc in procs:
+            proc.wait()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+
+
+def serve_prefork(plan):
+    from werkzeug.serving import make_server
+
+    # one listening socket per group, opened before forking so all its workers accept on it
+    sockets = {}
+    for name, host, port, workers, threads in plan:
+        sock = socket.create_server((host, port), reuse_port=False, backlog=128)
+        sock.set_inheritable(True)
+        sockets[name] = (sock, host, port)
+
+    children = {}
+
+    def spawn(name):
+        sock, host, port = sockets[name]
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                if GROUPS[name].get('async'):
+                    from stream_server import StreamServer
+                    StreamServer(build_app(name), host, port, sock=sock, mounts=GROUPS[name]['mounts'],
+                                 upstream=upstream_for(name, plan)).run()
+                else:
+                    server = make_server(host, port, build_app(name), threaded=True, fd=sock.fileno())
+                    server.serve_forever()
+                code = 0
+            except KeyboardInterrupt:
+                code = 0
+            finally:
+                os._exit(code)
+        children[pid] = name
+
+    for name, host, port, workers, threads in plan:
+        for _ in range(workers):
+            spawn(name)
+
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        # keep the pools full: a worker that dies gets replaced
+        while True:
+            pid, status = os.wait()
+            name = children.pop(pid, None)
+            if name is None:
+                continue
+            print(f"{name} worker {pid} exited (status {status}), restarting", flush=True)
+            time.sleep(0.5)
+            spawn(name)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+
+
+def parse_workers(value):
+    # "4" sets the public group, "compute=4,stream=1" sets groups by name
+    if not value:
+        return {}
+    if value.isdigit():
+        return {PUBLIC_GROUP: int(value)}
+    workers = {}
+    for item in value.split(','):
+        name, count = item.split('=')
+        if name not in GROUPS:
+            raise SystemExit(f"Unknown route group: {name} (groups: {', '.join(GROUPS)})")
+        workers[name] = int(count)
+    return workers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the hub with multiple worker processes.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--workers', default='', help="N, or per group like compute=4,stream=1")
+    parser.add_argument('--server', default='auto', choices=['auto', 'gunicorn', 'werkzeug'])
+    parser.add_argument('--threaded-streams', action='store_true',
+                        help="serve modules 6/7 from a threaded werkzeug worker instead of stream_server.py")
+    args = parser.parse_args(argv)
+    if args.threaded_streams:
+        for cfg in GROUPS.values():
+            cfg['async'] = False
+
+    front = front_group()
+    plan = make_plan(args.host, args.port, parse_workers(args.workers), front)
+    # every compute worker runs its own scheduler (hub/scheduler.py), split the cores between them
+    compute_workers = next(workers for name, _, _, workers, _ in plan if name == PUBLIC_GROUP)
+    os.environ.setdefault('CV_CPU_BUDGET', str(max(1, (os.cpu_count() or 1) // compute_workers)))
+    os.environ['CV_SERVE_PORTS'] = ','.join(f"{name}={port}" for name, _, port, _, _ in plan
+                                            if name != PUBLIC_GROUP)
+    os.environ['CV_SERVE_FRONT'] = front
+
+    server = args.server
+    if server == 'auto':
+        server = 'gunicorn' if importlib.util.find_spec('gunicorn') else 'werkzeug'
+    if server == 'werkzeug' and not hasattr(os, 'fork'):
+        raise SystemExit("The werkzeug pool needs fork(), install gunicorn or use run_hub.py")
+
+    for name, host, port, workers, threads in plan:
+        print(f" {name:<8} {host}:{port}  {workers} worker(s)  [{', '.join(GROUPS[name]['mounts'])}]")
+    print(f" Main Menu:   http://{args.host}:{args.port}/  ({server})", flush=True)
+
+    if server == 'gunicorn':
+        serve_gunicorn(plan, dict(os.environ))
+    else:
+        serve_prefork(plan)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import functools
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+# soak test for the live frame loops (module6 get_feed, module7 generate_frames): runs one
+# stream off a synthetic 640x480 camera for a long stretch and reports what every frame costs
+# the allocator and the gc, and whether the memory stays flat:
+#   KB/frame   -> how far the traced heap (python objects + numpy/opencv arrays) rose above
+#                 where it started during one frame, i.e. the temporary buffers it allocated
+#   gen0/gen2  -> gc collections per 1000 frames
+#   gc ms      -> total and longest gc pause over the run
+#   rss        -> process RSS after warm-up and at the end, max, and its slope in MB/min
+# each stream runs in its own process (both modules are imported as `app`).
+# tracemalloc slows allocation-heavy code down, so the fps here is lower than in production.
+# usage: python soak_streams.py [--minutes 10] [--stream module6 module7]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FPS = 30
+
+
+class SyntheticCamera:
+    # a paced 30fps camera: an aruco marker drifting over a noisy background. like
+    # cv2.VideoCapture.read it fills the buffer it's given when the size fits
+    def __init__(self, width=640, height=480):
+        self.width, self.height = width, height
+        dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+        self.marker = cv2.aruco.generateImageMarker(dictionary, 3, 120)
+        self.background = np.random.randint(90, 160, (height, width, 3), np.uint8)
+        self.count = 0
+        self.next_time = time.monotonic()
+
+    def read(self, image=None):
+        self.next_time = max(self.next_time + 1.0 / FPS, time.monotonic() - 1.0)
+        time.sleep(max(0.0, self.next_time - time.monotonic()))
+        if image is not None and image.shape == self.background.shape:
+            frame = image
+            np.copyto(frame, self.background)
+        else:
+            frame = self.background.copy()
+        x = 40 + (self.count * 3) % (self.width - 200)
+        y = 150 + int(60 * np.sin(self.count / 20))
+        frame[y:y + 120, x:x + 120] = self.marker[..., None]
+        self.count += 1
+        return True, frame
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def open_feed(stream):
+    # the module's own generator, wired to the synthetic camera
+    sys.path.insert(0, os.path.join(HERE, stream))
+    import app
+    if stream == 'module6':
+        context = app.CameraContext(cap=SyntheticCamera(), prewarm=['marker'])
+        return context.get_feed()
+    # module7 records every stream, keep this run's files out of recordings/
+    app.open_camera = lambda index: SyntheticCamera()
+    app.PoseWriter = functools.partial(app.PoseWriter, out_dir=tempfile.mkdtemp(prefix='soak_'))
+    return app.generate_frames()
+
+
+def soak(stream, seconds, warmup=150, sample_every=10.0):
+    feed = open_feed(stream)
+    for _ in range(warmup):
+        next(feed)
+
+    pauses = []
+    started = [0.0]
+
+    def on_gc(phase, info):
+        if phase == 'start':
+            started[0] = time.perf_counter()
+        else:
+            pauses.append(time.perf_counter() - started[0])
+
+    gc.collect()
+    gc_before = [s['collections'] for s in gc.get_stats()]
+    gc.callbacks.append(on_gc)
+    tracemalloc.start()
+
+    frames = 0
+    transient_total = 0
+    transient_max = 0
+    rss = [(0.0, rss_mb())]
+    t0 = time.monotonic()
+    next_sample = t0 + sample_every
+    while True:
+        now = time.monotonic()
+        if now - t0 >= seconds:
+            break
+        if now >= next_sample:
+            rss.append((now - t0, rss_mb()))
+            next_sample += sample_every
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        chunk = next(feed)
+        peak = tracemalloc.get_traced_memory()[1]
+        del chunk
+        transient = max(0, peak - before)
+        transient_total += transient
+        transient_max = max(transient_max, transient)
+        frames += 1
+    elapsed = time.monotonic() - t0
+    rss.append((elapsed, rss_mb()))
+
+    tracemalloc.stop()
+    gc.callbacks.remove(on_gc)
+    gc_after = [s['collections'] for s in gc.get_stats()]
+    feed.close()
+
+    times, values = zip(*rss)
+    slope = np.polyfit(times, values, 1)[0] * 60 if len(rss) > 2 else 0.0
+    result = {
+        'stream': stream,
+        'frames': frames,
+        'fps': frames / elapsed,
+        'kb_per_frame': transient_total / max(1, frames) / 1024,
+        'kb_per_frame_max': transient_max / 1024,
+        'gc_per_1k_frames': [(a - b) * 1000 / max(1, frames) for a, b in zip(gc_after, gc_before)],
+        'gc_ms_total': sum(pauses) * 1000,
+        'gc_ms_max': max(pauses, default=0.0) * 1000,
+        'rss_start_mb': values[0],
+        'rss_end_mb': values[-1],
+        'rss_max_mb': max(values),
+        'rss_mb_per_min': slope,
+    }
+    try:
+        from hub.frame_pool import frame_pool
+        result['pool'] = frame_pool.stats()
+    except ImportError:
+        pass
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-frame allocation, gc and RSS soak test of the live streams.")
+    parser.add_argument('--minutes', type=float, default=10)
+    parser.add_argument('--stream', nargs='+', default=['module6', 'module7'], choices=['module6', 'module7'])
+    parser.add_argument('--child', choices=['module6', 'module7'], help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        result = soak(args.child, args.minutes * 60)
+        print('RESULT ' + json.dumps(result), flush=True)
+        # mediapipe and the pose writer leave threads behind, don't wait on them
+        os._exit(0)
+
+    env = dict(os.environ, CV_METRICS='0', CV_CAMERA_BROKER='')
+    print(f"{args.minutes:g} minute soak per stream, synthetic 640x480 camera at {FPS}fps")
+    rows = []
+    for stream in args.stream:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', stream,
+                               '--minutes', str(args.minutes)], cwd=HERE, env=env,
+                              capture_output=True, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith('RESULT ')]
+        if not lines:
+            print(f"{stream} failed:\n{proc.stderr[-2000:]}")
+            continue
+        rows.append(json.loads(lines[-1][7:]))
+
+    print(f"\n{'stream':<9}{'frames':>8}{'fps':>6}{'KB/frame':>10}{'max KB':>8}{'gen0/1k':>9}{'gen2/1k':>9}"
+          f"{'gc ms':>7}{'max ms':>8}{'rss MB start->end (max)':>25}{'MB/min':>8}")
+    for r in rows:
+        gen = r['gc_per_1k_frames']
+        rss = f"{r['rss_start_mb']:.0f} -> {r['rss_end_mb']:.0f} ({r['rss_max_mb']:.0f})"
+        print(f"{r['stream']:<9}{r['frames']:>8}{r['fps']:>6.1f}{r['kb_per_frame']:>10.1f}{r['kb_per_frame_max']:>8.0f}"
+              f"{gen[0]:>9.1f}{gen[2]:>9.2f}{r['gc_ms_total']:>7.0f}{r['gc_ms_max']:>8.1f}{rss:>25}"
+              f"{r['rss_mb_per_min']:>8.2f}")
+        if 'pool' in r:
+            print(f"{'':<9}frame pool: {r['pool']['reused']} buffers reused, {r['pool']['missed']} allocated")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,564 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+from urllib.parse import parse_qsl, unquote_to_bytes, urlencode
+
+# asyncio front end for the live streams. under werkzeug every open /video_feed holds a
+# thread for as long as the tab is open (and runs its own copy of the frame loop), so a few
+# dozen dashboards used up the server. here:
+#   - every distinct feed (path + query, e.g. /module7/video_feed?model=pose) has one producer
+#     thread that runs the existing flask route and pulls JPEGs out of its multipart output.
+#     the query is cut down to the FEED_PARAMS the routes read, and at most MAX_FEEDS run at once
+#   - each viewer is a coroutine that waits for the next frame and writes it, so an idle
+#     viewer is a socket and a few KB. slow viewers skip frames instead of queueing them
+#   - the producer starts with the first viewer and stops (releasing the camera) a couple of
+#     seconds after the last one leaves
+#   - .../video_ws serves the same frames as binary WebSocket messages
+#   - everything else (pages, json, csv downloads) goes to the same WSGI app on a thread pool,
+#     so all the existing URLs keep working
+#   - with --upstream, requests outside --mounts are piped byte for byte to another server.
+#     serve.py puts this on the public port that way: modules 6 and 7 are served here and
+#     the hub page and modules 1-4 go on to the compute worker pool
+# usage: python stream_server.py [--port 5050] [--mounts /module6,/module7 [--upstream 127.0.0.1:5051]]
+# serve.py runs the stream group (modules 6 and 7) on this by default.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+FEED_SUFFIX = '/video_feed'
+WS_SUFFIX = '/video_ws'
+BOUNDARY = b'frame'
+# keep a feed running this long after its last viewer leaves, page reloads reconnect straight away
+IDLE_GRACE = 2.0
+MAX_HEADER = 64 * 1024
+# request bodies are read into memory before the app sees them
+MAX_BODY = int(float(os.environ.get('CV_STREAM_MAX_BODY_MB', '32')) * 1024 * 1024)
+# the query parameters the feed routes read (module6/7 video_feed, InferencePolicy.from_args),
+# anything else would only start another copy of the same feed
+FEED_PARAMS = ('overlay', 'model', 'complexity', 'downscale', 'every', 'between', 'motion')
+MAX_FEEDS = int(os.environ.get('CV_STREAM_MAX_FEEDS', '8'))
+WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               411: 'Length Required', 413: 'Payload Too Large', 431: 'Request Header Fields Too Large',
+               500: 'Internal Server Error', 502: 'Bad Gateway', 503: 'Service Unavailable'}
+# request headers the forwarder replaces, it always asks the upstream for one request per connection
+FORWARD_DROP = {'connection', 'keep-alive', 'proxy-connection', 'x-forwarded-for'}
+
+
+def make_environ(method, path, query, headers=None, body=b'', server=('127.0.0.1', 0), client=('', 0)):
+    # the bare WSGI environ for a request (PEP 3333: PATH_INFO is the unquoted bytes as latin-1)
+    environ = {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': unquote_to_bytes(path).decode('latin-1'),
+        'QUERY_STRING': query,
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': str(client[0]),
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in (headers or {}).items():
+        key = name.upper().replace('-', '_')
+        if key == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif key == 'CONTENT_LENGTH':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            environ['HTTP_' + key] = value
+    return environ
+
+
+def start_wsgi(app, environ):
+    # runs the app up to its first body chunk: (status code, status line, headers, iterator, first chunk)
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'], started['headers'] = status, headers
+        return lambda data: None
+
+    result = app(environ, start_response)
+    iterator = iter(result)
+    try:
+        first = next(iterator, b'')
+    except BaseException:
+        close_quietly(result)
+        raise
+    return int(started['status'].split()[0]), started['status'], started['headers'], result, iterator, first
+
+
+def close_quietly(result):
+    close = getattr(result, 'close', None)
+    if close is not None:
+        try:
+            close()
+        except Exception as e:
+            print(f"Error closing response: {e}")
+
+
+def response_head(status_line, headers):
+    lines = [f"HTTP/1.1 {status_line}"]
+    lines += [f"{k}: {v}" for k, v in headers if k.lower() not in ('connection', 'transfer-encoding')]
+    # one request per connection keeps the dispatching simple, the browser reconnects for free
+    lines.append('Connection: close')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+def split_part(chunk):
+    # one multipart chunk from the apps' generators -> the JPEG inside it, as a view into the
+    # chunk rather than a copy (it only gets copied once, into the outgoing part)
+    head_end = chunk.find(b'\r\n\r\n')
+    if head_end < 0:
+        return None
+    end = len(chunk) - 2 if chunk.endswith(b'\r\n') else len(chunk)
+    return memoryview(chunk)[head_end + 4:end]
+
+
+def ws_frame(payload, opcode=0x2):
+    # server -> client frames aren't masked
+    n = len(payload)
+    if n < 126:
+        head = bytes([0x80 | opcode, n])
+    elif n < 1 << 16:
+        head = bytes([0x80 | opcode, 126]) + n.to_bytes(2, 'big')
+    else:
+        head = bytes([0x80 | opcode, 127]) + n.to_bytes(8, 'big')
+    return b''.join((head, payload))
+
+
+def feed_query(query):
+    # the query with only FEED_PARAMS, in a fixed order, so equivalent urls share one feed
+    params = dict(parse_qsl(query))
+    return urlencode([(name, params[name]) for name in FEED_PARAMS if name in params])
+
+
+class FrameSource:
+    # one running feed: a thread drives the WSGI response, viewers await new frames
+    def __init__(self, server, key):
+        self.server = server
+        self.key = key
+        self.loop = server.loop
+        self.clients = 0
+        self.seq = 0
+        self.part = None        # latest frame as a ready-to-send multipart part
+        self.jpeg = None
+        self.ws = None          # the same frame as a websocket message, built for the first ws viewer
+        self.frames = 0
+        self.new_frame = asyncio.Event()
+        self.started = self.loop.create_future()
+        self.stopping = threading.Event()
+        self.idle_handle = None
+        self.finished = False
+        self.thread = threading.Thread(target=self.run, daemon=True, name=f"feed {key[0]}")
+
+    def run(self):
+        path, query = self.key
+        result = None
+        try:
+            environ = make_environ('GET', path, query, server=self.server.address)
+            status, status_line, headers, result, iterator, first = start_wsgi(self.server.app, environ)
+            content_type = dict((k.lower(), v) for k, v in headers).get('content-type', '')
+            if status != 200 or not content_type.startswith('multipart/'):
+                # an error page (bad query, unknown module): hand it back as it is
+                body = first + b''.join(iterator)
+                self.loop.call_soon_threadsafe(self.resolve_start, (status_line, headers, body))
+                return
+            self.loop.call_soon_threadsafe(self.resolve_start, None)
+            chunk = first
+            while not self.stopping.is_set():
+                jpeg = split_part(chunk) if chunk else None
+                if jpeg:
+                    part = b''.join((b'--', BOUNDARY, b'\r\nContent-Type: image/jpeg\r\nContent-Length: ',
+                                     str(len(jpeg)).encode(), b'\r\n\r\n', jpeg, b'\r\n'))
+                    self.loop.call_soon_threadsafe(self.publish, jpeg, part)
+                chunk = next(iterator, None)
+                if chunk is None:
+                    break
+        except Exception as e:
+            print(f"Feed {path} failed: {e}")
+            self.loop.call_soon_threadsafe(self.resolve_start, ('500 Internal Server Error', [], str(e).encode()))
+        finally:
+            if result is not None:
+                # closing the generator runs its finally: camera released, recordings closed
+                close_quietly(result)
+            self.loop.call_soon_threadsafe(self.ended)
+
+    def resolve_start(self, error):
+        if not self.started.done():
+            self.started.set_result(error)
+
+    def publish(self, jpeg, part):
+        self.jpeg, self.part = jpeg, part
+        self.ws = None
+        self.seq += 1
+        self.frames += 1
+        # wake everyone waiting, later waiters get a fresh event
+        event, self.new_frame = self.new_frame, asyncio.Event()
+        event.set()
+
+    def ended(self):
+        self.finished = True
+        self.resolve_start(('500 Internal Server Error', [], b'Feed ended'))
+        self.server.drop_source(self)
+        event, self.new_frame = self.new_frame, asyncio.Event()
+        event.set()
+
+    async def next_frame(self, last_seq):
+        # newest frame after last_seq, (seq, jpeg, part) or None once the feed is over
+        while self.seq <= last_seq and not self.finished:
+            await self.new_frame.wait()
+        if self.seq <= last_seq:
+            return None
+        return self.seq, self.jpeg, self.part
+
+    def ws_message(self):
+        # framed once per frame, not once per websocket viewer
+        if self.ws is None:
+            self.ws = ws_frame(self.jpeg)
+        return self.ws
+
+    def attach(self):
+        self.clients += 1
+        if self.idle_handle is not None:
+            self.idle_handle.cancel()
+            self.idle_handle = None
+        if not self.thread.is_alive() and not self.finished and not self.stopping.is_set():
+            self.thread.start()
+
+    def detach(self):
+        self.clients -= 1
+        if self.clients == 0 and not self.finished:
+            self.idle_handle = self.loop.call_later(IDLE_GRACE, self.stop_if_idle)
+
+    def stop_if_idle(self):
+        self.idle_handle = None
+        if self.clients == 0:
+            self.stopping.set()
+            self.server.drop_source(self)
+
+
+class StreamServer:
+    def __init__(self, app, host='0.0.0.0', port=5050, sock=None, mounts=None, upstream=None):
+        # upstream = (host, port) that gets every request outside mounts
+        self.app = app
+        self.host, self.port, self.sock = host, port, sock
+        self.address = (host, port)
+        self.mounts = tuple(mounts or ())
+        self.upstream = upstream
+        self.sources = {}
+        self.viewers = 0
+        self.requests = 0
+        self.forwarded = 0
+        self.loop = None
+
+    def owns(self, path):
+        return path == '/_streams' or any(path == m or path.startswith(m + '/') for m in self.mounts)
+
+    def drop_source(self, source):
+        if self.sources.get(source.key) is source:
+            del self.sources[source.key]
+
+    def get_source(self, key):
+        source = self.sources.get(key)
+        if source is None or source.finished or source.stopping.is_set():
+            source = FrameSource(self, key)
+            self.sources[key] = source
+        return source
+
+    async def handle(self, reader, writer):
+        self.requests += 1
+        try:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except asyncio.LimitOverrunError:
+                await self.send_simple(writer, 431, b'Request headers too large')
+                return
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            lines = head.decode('latin-1').split('\r\n')
+            try:
+                method, target, _ = lines[0].split(' ', 2)
+            except ValueError:
+                await self.send_simple(writer, 400, b'Bad request line')
+                return
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    headers[name.strip()] = value.strip()
+            path, _, query = target.partition('?')
+
+            if self.upstream and not self.owns(path):
+                await self.forward(reader, writer, lines)
+            elif method == 'GET' and path.endswith(FEED_SUFFIX):
+                await self.serve_feed(writer, path, query)
+            elif method == 'GET' and path.endswith(WS_SUFFIX):
+                await self.serve_websocket(reader, writer, path[:-len(WS_SUFFIX)] + FEED_SUFFIX, query, headers)
+            elif path == '/_streams':
+                await self.send_simple(writer, 200, json.dumps(self.stats()).encode(), 'application/json')
+            else:
+                await self.serve_wsgi(reader, writer, method, path, query, headers)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            # a bug in here shouldn't just drop the connection (the response may already be
+            # under way, then the 500 only ends it)
+            print(f"Error handling request: {e!r}")
+            try:
+                await self.send_simple(writer, 500, b'Internal Server Error')
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def forward(self, reader, writer, lines):
+        # pipe the request to the upstream server and its response back, both ways at once so
+        # uploads and long downloads stream through without being buffered here
+        try:
+            up_reader, up_writer = await asyncio.open_connection(*self.upstream)
+        except OSError as e:
+            await self.send_simple(writer, 502, f"Upstream unavailable: {e}".encode())
+            return
+        self.forwarded += 1
+        peer = writer.get_extra_info('peername') or ('',)
+        head = [lines[0]] + [line for line in lines[1:]
+                             if ':' in line and line.split(':', 1)[0].strip().lower() not in FORWARD_DROP]
+        # one request per connection like everything else here: the next request on a
+        # kept-alive browser connection might be for a feed, which has to come back to us
+        head += [f"X-Forwarded-For: {peer[0]}", 'Connection: close']
+        up_writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+
+        async def pipe(src, dst):
+            try:
+                while True:
+                    data = await src.read(65536)
+                    if not data:
+                        break
+                    dst.write(data)
+                    await dst.drain()
+            except ConnectionError:
+                pass
+
+        # (the reader may already hold the start of the body, read() hands that over first)
+        upload = asyncio.ensure_future(pipe(reader, up_writer))
+        try:
+            await pipe(up_reader, writer)
+        finally:
+            upload.cancel()
+            up_writer.close()
+
+    async def send_simple(self, writer, code, body, content_type='text/plain; charset=utf-8'):
+        writer.write(response_head(f"{code} {STATUS_TEXT.get(code, '')}",
+                                   [('Content-Type', content_type), ('Content-Length', str(len(body)))]) + body)
+        await writer.drain()
+
+    async def open_feed(self, writer, path, query):
+        # the shared source for this feed once it's producing, or None after sending its error
+        key = (path, feed_query(query))
+        running = sum(not s.finished for s in self.sources.values())
+        if key not in self.sources and running >= MAX_FEEDS:
+            await self.send_simple(writer, 503, b'Too many different feeds running, try again later')
+            return None
+        source = self.get_source(key)
+        source.attach()
+        error = await asyncio.shield(source.started)
+        if error is not None:
+            source.detach()
+            status_line, headers, body = error
+            writer.write(response_head(status_line, headers) + body)
+            await writer.drain()
+            return None
+        return source
+
+    async def serve_feed(self, writer, path, query):
+        source = await self.open_feed(writer, path, query)
+        if source is None:
+            return
+        self.viewers += 1
+        try:
+            writer.write(response_head('200 OK', [
+                ('Content-Type', f"multipart/x-mixed-replace; boundary={BOUNDARY.decode()}"),
+                ('Cache-Control', 'no-cache, no-store'),
+            ]))
+            seq = 0
+            while True:
+                frame = await source.next_frame(seq)
+                if frame is None:
+                    break
+                seq, _, part = frame
+                writer.write(part)
+                # a slow viewer waits here while newer frames replace the ones it missed
+                await writer.drain()
+        finally:
+            self.viewers -= 1
+            source.detach()
+
+    async def serve_websocket(self, reader, writer, feed_path, query, headers):
+        lowered = {k.lower(): v for k, v in headers.items()}
+        key = lowered.get('sec-websocket-key')
+        if 'websocket' not in lowered.get('upgrade', '').lower() or not key:
+            await self.send_simple(writer, 400, b'Expected a WebSocket upgrade')
+            return
+        source = await self.open_feed(writer, feed_path, query)
+        if source is None:
+            return
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WS_GUID).digest()).decode()
+        writer.write(f"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode())
+        self.viewers += 1
+
+        async def watch_client():
+            # the client only ever sends pings/close, any close or EOF ends the stream
+            try:
+                while True:
+                    b0, b1 = await reader.readexactly(2)
+                    n = b1 & 0x7f
+                    if n == 126:
+                        n = int.from_bytes(await reader.readexactly(2), 'big')
+                    elif n == 127:
+                        n = int.from_bytes(await reader.readexactly(8), 'big')
+                    await reader.readexactly(n + (4 if b1 & 0x80 else 0))
+                    if b0 & 0x0f == 0x8:
+                        return
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+
+        watcher = asyncio.ensure_future(watch_client())
+        try:
+            seq = 0
+            while not watcher.done():
+                next_frame = asyncio.ensure_future(source.next_frame(seq))
+                done, _ = await asyncio.wait({next_frame, watcher}, return_when=asyncio.FIRST_COMPLETED)
+                if next_frame not in done:
+                    next_frame.cancel()
+                    break
+                frame = next_frame.result()
+                if frame is None:
+                    break
+                # no await since next_frame, so the source still holds this frame
+                seq = frame[0]
+                writer.write(source.ws_message())
+                await writer.drain()
+            writer.write(ws_frame(b'', opcode=0x8))
+        finally:
+            watcher.cancel()
+            self.viewers -= 1
+            source.detach()
+
+    async def serve_wsgi(self, reader, writer, method, path, query, headers):
+        lowered = {k.lower(): v for k, v in headers.items()}
+        if 'chunked' in lowered.get('transfer-encoding', '').lower():
+            await self.send_simple(writer, 411, b'Chunked request bodies are not supported')
+            return
+        body = b''
+        try:
+            length = int(lowered.get('content-length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            await self.send_simple(writer, 400, b'Bad Content-Length')
+            return
+        if length > MAX_BODY:
+            await self.send_simple(writer, 413, f"Request body over {MAX_BODY} bytes".encode())
+            return
+        if length:
+            try:
+                body = await reader.readexactly(length)
+            except asyncio.IncompleteReadError:
+                return
+        peer = writer.get_extra_info('peername') or ('', 0)
+        environ = make_environ(method, path, query, headers, body, self.address, peer[:2])
+        loop = asyncio.get_running_loop()
+        try:
+            status, status_line, resp_headers, result, iterator, first = await loop.run_in_executor(
+                None, start_wsgi, self.app, environ)
+        except Exception as e:
+            print(f"Error in {method} {path}: {e}")
+            await self.send_simple(writer, 500, b'Internal Server Error')
+            return
+        try:
+            writer.write(response_head(status_line, resp_headers) + first)
+            await writer.drain()
+            # the rest of the body (csv downloads stream in pieces) without blocking the loop
+            while True:
+                chunk = await loop.run_in_executor(None, next, iterator, None)
+                if chunk is None:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+        finally:
+            await loop.run_in_executor(None, close_quietly, result)
+
+    def stats(self):
+        return {
+            'viewers': self.viewers,
+            'requests': self.requests,
+            'forwarded': self.forwarded,
+            'feeds': [{'path': path, 'query': query, 'clients': s.clients, 'frames': s.frames}
+                      for (path, query), s in self.sources.items()],
+        }
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        if self.sock is not None:
+            server = await asyncio.start_server(self.handle, sock=self.sock, limit=MAX_HEADER, backlog=1024)
+        else:
+            server = await asyncio.start_server(self.handle, self.host, self.port, limit=MAX_HEADER, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+
+def build_app(mounts=None):
+    # the hub's WSGI app, or only some of its mounts (serve.py passes its stream group)
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    import run_hub
+    if not mounts:
+        return run_hub.application
+    from werkzeug.exceptions import NotFound
+    from werkzeug.middleware.dispatcher import DispatcherMiddleware
+    from hub.profiler import profiled
+    return profiled(DispatcherMiddleware(NotFound(), {prefix: run_hub.lazy_apps[prefix] for prefix in mounts}))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Async MJPEG / WebSocket front end for the live streams.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--mounts', default='', help="only serve these, e.g. /module6,/module7 (default: everything)")
+    parser.add_argument('--upstream', default='', help="HOST:PORT that gets every request outside --mounts")
+    args = parser.parse_args(argv)
+
+    mounts = [m.strip() for m in args.mounts.split(',') if m.strip()]
+    upstream = None
+    if args.upstream:
+        if not mounts:
+            raise SystemExit("--upstream needs --mounts, otherwise everything is served here")
+        host, _, port = args.upstream.rpartition(':')
+        upstream = (host or '127.0.0.1', int(port))
+    print(f" Streams:     http://{args.host}:{args.port}/  ({', '.join(mounts) or 'all modules'})"
+          + (f", everything else -> {args.upstream}" if upstream else ''), flush=True)
+    StreamServer(build_app(mounts), args.host, args.port, mounts=mounts, upstream=upstream).run()
+
+
+if __name__ == '__main__':
+    main()